@@ -9,10 +9,35 @@ config = {
 
 TESTING = bool(config.get("TESTING", False))
 
+# The repositories backend: "rethinkdb", "redis" or "sqlite"
+DB_BACKEND = config.get("DB_BACKEND", "rethinkdb")
+
 SECRET_KEY = config.get("SECRET_KEY", "NOSECRET")
 ALGORITHM = config.get("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(config.get("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
+# Authenticated users are cached for PRINCIPAL_CACHE_TTL seconds in every process, and
+# for PRINCIPAL_CACHE_REDIS_TTL seconds in redis when PRINCIPAL_CACHE_REDIS is set
+PRINCIPAL_CACHE_SIZE = int(config.get("PRINCIPAL_CACHE_SIZE", 10_000))
+PRINCIPAL_CACHE_TTL = float(config.get("PRINCIPAL_CACHE_TTL", 5))
+PRINCIPAL_CACHE_REDIS = bool(config.get("PRINCIPAL_CACHE_REDIS", False))
+PRINCIPAL_CACHE_REDIS_TTL = int(config.get("PRINCIPAL_CACHE_REDIS_TTL", 60))
+# The tasks lists are cached per user, status and page for TASKS_QUERY_CACHE_TTL seconds
+# in every process, up to TASKS_QUERY_CACHE_SIZE lists and TASKS_QUERY_CACHE_MAX_ROWS
+# tasks, and for TASKS_QUERY_CACHE_REDIS_TTL seconds in redis when
+# TASKS_QUERY_CACHE_REDIS is set. Writes bump the user version, so stale lists are missed
+TASKS_QUERY_CACHE_SIZE = int(config.get("TASKS_QUERY_CACHE_SIZE", 1_000))
+TASKS_QUERY_CACHE_MAX_ROWS = int(config.get("TASKS_QUERY_CACHE_MAX_ROWS", 100_000))
+TASKS_QUERY_CACHE_TTL = float(config.get("TASKS_QUERY_CACHE_TTL", 60))
+TASKS_QUERY_CACHE_REDIS = bool(config.get("TASKS_QUERY_CACHE_REDIS", False))
+TASKS_QUERY_CACHE_REDIS_TTL = int(config.get("TASKS_QUERY_CACHE_REDIS_TTL", 60))
+# The bcrypt work factor, passwords hashed with other rounds are rehashed on login
+BCRYPT_ROUNDS = int(config.get("BCRYPT_ROUNDS", 12))
+# Processes hashing the passwords of the async endpoints, 0 uses the threadpool instead
+PASSWORD_HASH_WORKERS = int(config.get("PASSWORD_HASH_WORKERS", 2))
+# Password jobs submitted at once per process, the rest wait on the event loop
+PASSWORD_HASH_MAX_CONCURRENCY = int(config.get("PASSWORD_HASH_MAX_CONCURRENCY", 4))
+
 
 TRELLO_TOKEN_USER_DATA_KEY = "trello_access_token"
 TRELLO_API_KEY = config.get("TRELLO_API_KEY")
@@ -24,3 +49,34 @@ REDIS_URI = config.get("REDIS_URI", "redis://redis/")
 
 RETHINKDB_DB_NAME = config.get("RETHINKDB_DB", "test")
 RETHINKDB_URI = config.get("RETHINKDB_URI", "rethinkdb://rethinkdb:28015")
+RETHINKDB_POOL_MIN_SIZE = int(config.get("RETHINKDB_POOL_MIN_SIZE", 1))
+RETHINKDB_POOL_MAX_SIZE = int(config.get("RETHINKDB_POOL_MAX_SIZE", 20))
+RETHINKDB_POOL_TIMEOUT = float(config.get("RETHINKDB_POOL_TIMEOUT", 10))
+RETHINKDB_POOL_HEALTH_CHECK_INTERVAL = float(
+    config.get("RETHINKDB_POOL_HEALTH_CHECK_INTERVAL", 30)
+)
+# Comma separated URIs of servers close to the replicas, eventually consistent reads use
+# them instead of RETHINKDB_URI
+RETHINKDB_REPLICA_URIS = [
+    uri.strip()
+    for uri in config.get("RETHINKDB_REPLICA_URIS", "").split(",")
+    if uri.strip()
+]
+# Consistency of the tasks list reads, "outdated" may lag behind the latest writes
+RETHINKDB_LIST_READ_MODE = config.get("RETHINKDB_LIST_READ_MODE", "outdated")
+# Create missing tables and indexes when the app starts, set to empty, "0", "false" or "no" to
+# use `manage.py migrate` instead
+RETHINKDB_BOOTSTRAP = str(config.get("RETHINKDB_BOOTSTRAP", True)).lower() not in (
+    "",
+    "0",
+    "false",
+    "no",
+)
+
+SQLITE_PATH = config.get("SQLITE_PATH", "spacex_trello.sqlite3")
+
+# Directory of the archived tasks segments
+ARCHIVE_PATH = config.get("ARCHIVE_PATH", "archive")
+# Tasks created in trello are archived by `manage.py archive` after this many days
+ARCHIVE_AFTER_DAYS = int(config.get("ARCHIVE_AFTER_DAYS", 30))
+ARCHIVE_BATCH_SIZE = int(config.get("ARCHIVE_BATCH_SIZE", 1000))
@@ -0,0 +1,24 @@
+class DuplicateValuesError(Exception):
+    """Raised by migrations when the values of a field made unique are duplicated."""
+
+
+def check_unique(table: str, field: str, duplicates: list) -> None:
+    """
+    Fails the migration making a field of a table unique while some of its values are
+    held by more than one record.
+
+    Args:
+        table (str): The name of the table.
+        field (str): The field made unique.
+        duplicates (list): The values held by more than one record.
+
+    Raises:
+        DuplicateValuesError: If there are duplicated values.
+    """
+    if duplicates:
+        raise DuplicateValuesError(
+            f"The {table} table holds duplicated {field} values: "
+            f"{', '.join(sorted(map(str, duplicates)))}. Rename or remove the duplicated "
+            f"records, then run `python manage.py migrate` or restart the API to make "
+            f"{field} unique."
+        )
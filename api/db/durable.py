@@ -0,0 +1,235 @@
+import contextlib
+import mmap
+import os
+import pathlib
+import pickle
+import struct
+import threading
+import typing
+import uuid
+import zlib
+
+from api.db.memory import DICT_ROWS, InMemoryDB
+
+# Every log record is framed by its length and crc32, so a record torn by a crash is
+# detected and dropped on replay
+FRAME_HEADER = struct.Struct("<II")
+
+
+def _fsync_dir(path: pathlib.Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class DurableInMemoryDB(InMemoryDB):
+    """
+    An InMemoryDB that survives restarts. Data is still served from memory, every write
+    is also appended to a log on disk and replayed on startup.
+
+    Writes only pickle the operation into an in-memory buffer, a background thread writes
+    the buffer to the log and fsyncs it every `fsync_interval` seconds, so one fsync
+    commits every write of the interval (group commit) and write latency does not
+    include any disk I/O. Writes of the last interval are lost on a crash, call `flush`
+    to wait until the pending writes are on disk.
+
+    Once the log holds `snapshot_every` records, the tables are written to a compacted
+    snapshot and the log is truncated. On startup the snapshot is memory-mapped and
+    unpickled, and only the log written after it is replayed. Snapshots and logs hold
+    plain records, codecs set with `set_codec` convert them once they are loaded.
+
+    Args:
+        path (str | Path): The directory holding the snapshot and the log files.
+        fsync_interval (float): Seconds between two log fsyncs.
+        snapshot_every (int): The number of log records that triggers a snapshot.
+    """
+
+    def __init__(
+        self,
+        path: str | pathlib.Path,
+        fsync_interval: float = 0.01,
+        snapshot_every: int = 100_000,
+    ) -> None:
+        super().__init__()
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+
+        # Writes are applied and appended under the log lock, so the log order is the
+        # order the writes were applied and snapshots see no half logged write
+        self._log_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._pending: list[bytes] = []
+        self._log_records = 0
+
+        self._sequence = self._load()
+        self._log_file = open(self._log_path(self._sequence), "ab")
+
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(
+            target=self._run_flusher, name="durable-db-flusher", daemon=True
+        )
+        self._flusher.start()
+
+    @property
+    def snapshot_path(self) -> pathlib.Path:
+        return self.path / "snapshot"
+
+    def _log_path(self, sequence: int) -> pathlib.Path:
+        return self.path / f"log.{sequence:08d}"
+
+    def _log_sequences(self) -> list[int]:
+        return sorted(int(log.suffix[1:]) for log in self.path.glob("log.*"))
+
+    def _load(self) -> int:
+        """
+        Loads the snapshot and replays the logs written after it.
+
+        Returns:
+            int: The sequence number of the log to write to.
+        """
+        sequence = 0
+        if self.snapshot_path.exists() and self.snapshot_path.stat().st_size:
+            with open(self.snapshot_path, "rb") as file, mmap.mmap(
+                file.fileno(), 0, access=mmap.ACCESS_READ
+            ) as data:
+                snapshot = pickle.loads(data)
+            self.store.update(snapshot["store"])
+            sequence = snapshot["sequence"]
+
+        for log_sequence in self._log_sequences():
+            if log_sequence < sequence:
+                continue
+            for operation, args in self._read_log(self._log_path(log_sequence)):
+                getattr(super(), operation)(*args)
+                self._log_records += 1
+            sequence = log_sequence + 1
+        # A new log is started, the last one may end with a torn record
+        return sequence
+
+    @staticmethod
+    def _read_log(path: pathlib.Path):
+        with open(path, "rb") as file:
+            data = file.read()
+        offset = 0
+        while offset + FRAME_HEADER.size <= len(data):
+            size, checksum = FRAME_HEADER.unpack_from(data, offset)
+            start = offset + FRAME_HEADER.size
+            record = data[start : start + size]
+            if len(record) < size or zlib.crc32(record) != checksum:
+                break
+            yield pickle.loads(record)
+            offset = start + size
+
+    def _log(self, operation: str, *args) -> None:
+        record = pickle.dumps((operation, args), protocol=pickle.HIGHEST_PROTOCOL)
+        self._pending.append(FRAME_HEADER.pack(len(record), zlib.crc32(record)))
+        self._pending.append(record)
+        self._log_records += 1
+
+    def _run_flusher(self) -> None:
+        while not self._closed.wait(self.fsync_interval):
+            self.flush()
+            if self._log_records >= self.snapshot_every:
+                self.snapshot()
+
+    def flush(self) -> None:
+        """
+        Writes the pending log records and waits until they are on disk.
+        """
+        with self._flush_lock:
+            with self._log_lock:
+                pending, self._pending = self._pending, []
+                log_file = self._log_file
+            if pending:
+                log_file.write(b"".join(pending))
+                log_file.flush()
+                os.fsync(log_file.fileno())
+
+    def snapshot(self) -> None:
+        """
+        Writes the tables to a new snapshot and removes the logs it replaces.
+        """
+        with self._snapshot_lock:
+            with self._flush_lock:
+                with self._log_lock:
+                    # Records are replaced on write, never mutated, so copying the
+                    # tables is enough to freeze them
+                    tables = [
+                        (table, self.codecs.get(table, DICT_ROWS), tuple(rows.values()))
+                        for table, rows in tuple(self.store.items())
+                    ]
+                    pending, self._pending = self._pending, []
+                    old_log_file = self._log_file
+                    self._sequence += 1
+                    self._log_file = open(self._log_path(self._sequence), "ab")
+                    self._log_records = 0
+                old_log_file.write(b"".join(pending))
+                old_log_file.flush()
+                os.fsync(old_log_file.fileno())
+                old_log_file.close()
+
+            # Snapshots hold plain records, so they do not depend on the table codecs
+            store = {}
+            for table, codec, rows in tables:
+                records = map(codec.decode, rows)
+                store[table] = {record["id"]: record for record in records}
+
+            temporary = self.path / "snapshot.tmp"
+            with open(temporary, "wb") as file:
+                pickle.dump(
+                    {"sequence": self._sequence, "store": store},
+                    file,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, self.snapshot_path)
+            _fsync_dir(self.path)
+
+            for sequence in self._log_sequences():
+                if sequence < self._sequence:
+                    self._log_path(sequence).unlink()
+
+    def close(self) -> None:
+        """
+        Stops the background thread and flushes the pending writes.
+        """
+        self._closed.set()
+        self._flusher.join()
+        self.flush()
+        self._log_file.close()
+
+    def cleanup(self, table: str = None) -> None:
+        # Table locks are always taken before the log lock
+        table_lock = self.lock(table) if table else contextlib.nullcontext()
+        with table_lock, self._log_lock:
+            super().cleanup(table)
+            self._log("cleanup", table)
+
+    def create(self, table: str, data: dict, unique: typing.Sequence[str] = ()) -> dict:
+        with self.lock(table), self._log_lock:
+            data = super().create(table, data, unique)
+            self._log("create", table, data)
+        return data
+
+    def update(self, table: str, id: uuid.UUID, data: dict) -> dict:
+        with self.lock(table), self._log_lock:
+            record = super().update(table, id, data)
+            self._log("update", table, id, data)
+        return record
+
+    def increment(self, table: str, id: uuid.UUID, counters: dict[str, int]) -> dict:
+        with self.lock(table), self._log_lock:
+            record = super().increment(table, id, counters)
+            self._log("increment", table, id, counters)
+        return record
+
+    def remove(self, table, id: uuid.UUID) -> None:
+        with self.lock(table), self._log_lock:
+            super().remove(table, id)
+            self._log("remove", table, id)
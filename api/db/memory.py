@@ -1,16 +1,239 @@
+import contextlib
+import datetime
+import enum
 import functools
+import itertools
+import threading
+import types
+import typing
 import uuid
 
+EPOCH = datetime.datetime(1970, 1, 1)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+class RowCodec:
+    """
+    Converts the records of a table to the rows kept in memory and back. This base codec
+    keeps every record as the dict it was given.
+    """
+
+    def encode(self, data: dict) -> typing.Any:
+        return data
+
+    def decode(self, row: typing.Any) -> dict:
+        return row
+
+    def encode_value(self, field: str, value: typing.Any) -> typing.Any:
+        return value
+
+    def get(self, row: typing.Any, field: str) -> typing.Any:
+        return row.get(field)
+
+    def replace(self, row: typing.Any, data: dict) -> typing.Any:
+        return {**row, **data}
+
+    def release(self, row: typing.Any) -> None:
+        """Called with the rows dropped from a table, once replaced or removed."""
+
+
+class CompactRowCodec(RowCodec):
+    """
+    Keeps the records of a known schema as tuples of their field values, so field names
+    are not repeated for every record. UUIDs are stored as ints, enums as the index of
+    their member and naive datetimes as integer microseconds since the epoch. Index keys
+    and query values are encoded the same way, so lookups and filters compare the stored
+    values without decoding the rows.
+
+    Args:
+        fields (list[str]): The fields of the schema, in storage order.
+        types (dict[str, type]): The type of the fields stored compactly.
+        interned (Iterable[str]): Fields whose values repeat across records, like foreign
+            keys. Their encoded values are shared instead of being stored once per
+            row, and forgotten when no stored row holds them anymore.
+    """
+
+    def __init__(
+        self,
+        fields: list[str],
+        types: dict[str, type],
+        interned: typing.Iterable[str] = (),
+    ) -> None:
+        self.fields = tuple(fields)
+        self.positions = {field: position for position, field in enumerate(fields)}
+        self.interned = frozenset(interned)
+        self._interned_positions = tuple(
+            position for field, position in self.positions.items() if field in interned
+        )
+        # The shared value and the number of stored rows holding it, by value
+        self._interned_values: dict[typing.Any, list] = {}
+        self._interned_lock = threading.Lock()
+        self._encoders = {}
+        self._decoders = {}
+        for field, type_ in types.items():
+            if issubclass(type_, enum.Enum):
+                members = tuple(type_)
+                codes = {member: code for code, member in enumerate(members)}
+                self._encoders[field] = codes.__getitem__
+                self._decoders[field] = members.__getitem__
+            elif issubclass(type_, uuid.UUID):
+                self._encoders[field] = self._encode_uuid
+                self._decoders[field] = self._decode_uuid
+            elif issubclass(type_, datetime.datetime):
+                self._encoders[field] = self._encode_datetime
+                self._decoders[field] = self._decode_datetime
+
+    @classmethod
+    def from_model(
+        cls, model, interned: typing.Iterable[str] = ()
+    ) -> "CompactRowCodec":
+        """
+        Builds the codec of the fields of a pydantic model. Optional fields are encoded
+        as their inner type and stay None when unset.
+
+        Args:
+            model (type[BaseModel]): The model of the records.
+            interned (Iterable[str]): Fields whose values repeat across records.
+        """
+        types_ = {}
+        for field, info in model.model_fields.items():
+            annotation = info.annotation
+            if typing.get_origin(annotation) in (typing.Union, types.UnionType):
+                args = [a for a in typing.get_args(annotation) if a is not type(None)]
+                annotation = args[0] if len(args) == 1 else None
+            if isinstance(annotation, type) and issubclass(
+                annotation, (enum.Enum, uuid.UUID, datetime.datetime)
+            ):
+                types_[field] = annotation
+        return cls(fields=list(model.model_fields), types=types_, interned=interned)
+
+    @staticmethod
+    def _encode_uuid(value: uuid.UUID | str) -> int:
+        return (value if isinstance(value, uuid.UUID) else uuid.UUID(value)).int
+
+    @staticmethod
+    def _decode_uuid(value: int) -> uuid.UUID:
+        return uuid.UUID(int=value)
+
+    @staticmethod
+    def _encode_datetime(value: datetime.datetime) -> int | datetime.datetime:
+        # Aware datetimes keep their timezone and are stored as they are
+        if value.tzinfo is not None:
+            return value
+        return (value - EPOCH) // MICROSECOND
+
+    @staticmethod
+    def _decode_datetime(value: int | datetime.datetime) -> datetime.datetime:
+        if isinstance(value, datetime.datetime):
+            return value
+        return EPOCH + value * MICROSECOND
+
+    def encode_value(self, field: str, value: typing.Any) -> typing.Any:
+        encoder = self._encoders.get(field)
+        if encoder is not None and value is not None:
+            value = encoder(value)
+        return value
+
+    def _intern(self, values: list) -> tuple:
+        """Shares the interned values of a row about to be stored, counting the row."""
+        if self._interned_positions:
+            with self._interned_lock:
+                for position in self._interned_positions:
+                    value = values[position]
+                    if value is None:
+                        continue
+                    entry = self._interned_values.get(value)
+                    if entry is None:
+                        entry = self._interned_values[value] = [value, 0]
+                    entry[1] += 1
+                    values[position] = entry[0]
+        return tuple(values)
+
+    def release(self, row: tuple) -> None:
+        if not self._interned_positions:
+            return
+        with self._interned_lock:
+            for position in self._interned_positions:
+                entry = self._interned_values.get(row[position])
+                if entry is None:
+                    continue
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._interned_values[row[position]]
+
+    def encode(self, data: dict) -> tuple:
+        unknown = data.keys() - self.positions.keys()
+        if unknown:
+            raise ValueError(f"Fields {sorted(unknown)} are not in the schema.")
+        return self._intern(
+            [self.encode_value(field, data.get(field)) for field in self.fields]
+        )
+
+    def decode(self, row: tuple) -> dict:
+        data = dict(zip(self.fields, row))
+        for field, decoder in self._decoders.items():
+            if data[field] is not None:
+                data[field] = decoder(data[field])
+        return data
+
+    def get(self, row: tuple, field: str) -> typing.Any:
+        position = self.positions.get(field)
+        return None if position is None else row[position]
+
+    def replace(self, row: tuple, data: dict) -> tuple:
+        values = list(row)
+        for field, value in data.items():
+            if field not in self.positions:
+                raise ValueError(f"Field {field!r} is not in the schema.")
+            values[self.positions[field]] = self.encode_value(field, value)
+        return self._intern(values)
+
+
+DICT_ROWS = RowCodec()
+
 
 class InMemoryDB:
     """
     InMemoryDB is a class that represents an in-memory database.
+
+    Tables can declare secondary hash indexes with `create_index`. Indexes map every value
+    of a field to the ids of the records holding it, are maintained on every write and let
+    `find` look up records without scanning the table.
+
+    The database is safe to share between threads. Writers of a table are serialized by a
+    per-table lock, while readers never take it: records are replaced instead of mutated
+    in place, and reads iterate a snapshot of the record references, so a reader sees
+    every record as it was when the read started and never fails with "dictionary
+    changed size during iteration".
+
+    Tables keep their records as dicts unless `set_codec` gives them a compact codec.
+    Either way, records go in and come out of every method as dicts.
     """
 
+    def __init__(self) -> None:
+        # Indexed fields and codecs by table, kept when the data is cleaned up
+        self.indexes: dict[str, list[str]] = dict()
+        self.codecs: dict[str, RowCodec] = dict()
+        self._locks: dict[str, threading.RLock] = dict()
+        self._locks_lock = threading.Lock()
+        # Writes by table, and the last scan snapshot of every table as (records, writes,
+        # rows), reused by the scans until the next write
+        self._writes: dict[str, int] = dict()
+        self._snapshots: dict[str, tuple[dict, int, tuple]] = dict()
+
     @functools.cached_property
     def store(self) -> dict:
         return dict()
 
+    @functools.cached_property
+    def index_store(self) -> dict[str, dict[str, dict[typing.Any, dict]]]:
+        """
+        The index buckets as {table: {field: {value: {id: None}}}}. Buckets are dicts
+        used as ordered sets, so lookups return records in insertion order. Values and ids
+        are encoded by the codec of the table.
+        """
+        return dict()
+
     def _get_table(self, table: str) -> dict[dict]:
         """
         Returns a dictionary representing the table with the given name. If the table does not exist, it is created.
@@ -21,9 +244,128 @@ class InMemoryDB:
         Returns:
         - dict[dict]: A dictionary representing the table with the given name
         """
-        if not table in self.store:
-            self.store[table] = dict()
-        return self.store[table]
+        return self.store.setdefault(table, dict())
+
+    def _get_index(self, table: str, field: str) -> dict[typing.Any, dict]:
+        """
+        Returns the buckets of the index on the given field of the table.
+
+        Args:
+            table (str): The name of the indexed table.
+            field (str): The indexed field.
+
+        Returns:
+            dict[Any, dict]: The ids of the records by field value.
+        """
+        return self.index_store.setdefault(table, dict()).setdefault(field, dict())
+
+    def _index_record(self, table: str, row, fields: typing.Iterable[str]):
+        codec = self.codecs.get(table, DICT_ROWS)
+        for field in fields:
+            index = self._get_index(table, field)
+            index.setdefault(codec.get(row, field), dict())[codec.get(row, "id")] = None
+
+    def _unindex_record(self, table: str, row, fields: typing.Iterable[str]):
+        codec = self.codecs.get(table, DICT_ROWS)
+        for field in fields:
+            index = self._get_index(table, field)
+            value = codec.get(row, field)
+            bucket = index.get(value, {})
+            bucket.pop(codec.get(row, "id"), None)
+            if not bucket:
+                index.pop(value, None)
+
+    def _replace_record(self, table: str, old, new) -> None:
+        """
+        Stores the new version of a row. The new version is indexed before the old one is
+        unindexed, so concurrent readers find the record under one of them.
+        """
+        codec = self.codecs.get(table, DICT_ROWS)
+        fields = self.indexes.get(table, [])
+        if old is not None:
+            fields = [f for f in fields if codec.get(old, f) != codec.get(new, f)]
+        self._index_record(table, new, fields)
+        self._get_table(table)[codec.get(new, "id")] = new
+        if old is not None:
+            self._unindex_record(table, old, fields)
+            codec.release(old)
+        self._writes[table] = self._writes.get(table, 0) + 1
+
+    def _snapshot(self, table: str) -> tuple:
+        """
+        Returns the references to the records of the table. The copy is shared by the
+        scans until a write replaces it, so readers never take the write lock and
+        read-mostly tables are not copied on every scan.
+        """
+        records = self._get_table(table)
+        # Read before copying, a write racing the copy makes the snapshot newer only
+        writes = self._writes.get(table, 0)
+        snapshot = self._snapshots.get(table)
+        if snapshot is not None and snapshot[0] is records and snapshot[1] == writes:
+            return snapshot[2]
+        rows = tuple(records.values())
+        self._snapshots[table] = (records, writes, rows)
+        return rows
+
+    def _release_rows(self, table: str) -> None:
+        codec = self.codecs.get(table, DICT_ROWS)
+        # Copied, the whole database cleanup does not take the table locks
+        for row in tuple(self._get_table(table).values()):
+            codec.release(row)
+
+    @contextlib.contextmanager
+    def lock(self, table: str) -> typing.Iterator[None]:
+        """
+        Holds the write lock of the table for the duration of the block. Writes already
+        take it, callers only need it to make a read-modify-write sequence atomic. The
+        lock is reentrant, so writes can be called inside the block.
+
+        Args:
+            table (str): The name of the table to lock.
+        """
+        lock = self._locks.get(table)
+        if lock is None:
+            with self._locks_lock:
+                lock = self._locks.setdefault(table, threading.RLock())
+        with lock:
+            yield
+
+    def set_codec(self, table: str, codec: RowCodec) -> None:
+        """
+        Sets how the records of the table are kept in memory, converting the existing
+        records and rebuilding the indexes of the table.
+
+        Args:
+            table (str): The name of the table.
+            codec (RowCodec): The codec of the records.
+        """
+        with self.lock(table):
+            old = self.codecs.get(table, DICT_ROWS)
+            old_rows = self._get_table(table).values()
+            rows = [codec.encode(old.decode(row)) for row in old_rows]
+            for row in old_rows:
+                old.release(row)
+            self.codecs[table] = codec
+            self.store[table] = {codec.get(row, "id"): row for row in rows}
+            self.index_store.pop(table, None)
+            for row in rows:
+                self._index_record(table, row, self.indexes.get(table, []))
+
+    def create_index(self, table: str, field: str) -> None:
+        """
+        Declares a hash index on the given field of the table and indexes the existing records.
+
+        Args:
+            table (str): The name of the table to index.
+            field (str): The field to index.
+        """
+        with self.lock(table):
+            fields = self.indexes.setdefault(table, [])
+            if field in fields:
+                return
+            for row in tuple(self._get_table(table).values()):
+                self._index_record(table, row, [field])
+            fields.append(field)
 
     def cleanup(self, table: str = None) -> None:
         """
@@ -33,9 +375,84 @@ class InMemoryDB:
             table (str, optional): The name of the table to remove data from. If not specified, all tables will be cleared.
         """
         if table:
-            self.store[table] = dict()
+            with self.lock(table):
+                self._release_rows(table)
+                self.store[table] = dict()
+                self.index_store.pop(table, None)
+                self._snapshots.pop(table, None)
             return
-        vars(self).pop("store")
+        for table in tuple(vars(self).get("store", ())):
+            self._release_rows(table)
+        vars(self).pop("store", None)
+        vars(self).pop("index_store", None)
+        self._snapshots.clear()
+
+    def iterate(
+        self, table: str, offset: int = 0, limit: int = None, **equals
+    ) -> typing.Iterator[dict]:
+        """
+        Returns a lazy iterator over the records of the table whose fields are equal to the
+        given values, as they were when `iterate` was called.
+
+        The candidates are taken from the id, or from the smallest bucket of the indexed
+        fields, and only scanned when none of the fields is indexed. Only the references to
+        the candidates are snapshotted, so callers that stop early pay for building the
+        records they consumed and concurrent writes never break the iteration. Scans share
+        one snapshot of the table until the next write.
+
+        Args:
+            table (str): The name of the table to search.
+            offset (int): The number of matching records to skip.
+            limit (int, optional): The maximum number of records to yield.
+            **equals: The values the fields of the records must be equal to.
+
+        Returns:
+            Iterator[dict]: The matching records.
+        """
+        codec = self.codecs.get(table, DICT_ROWS)
+        equals = {
+            field: codec.encode_value(field, value) for field, value in equals.items()
+        }
+        stop = None if limit is None else offset + limit
+
+        def matches(candidates: typing.Iterable) -> typing.Iterator:
+            rows = (
+                row
+                for row in candidates
+                if all(codec.get(row, f) == value for f, value in equals.items())
+            )
+            return itertools.islice(rows, offset, stop)
+
+        records = self._get_table(table)
+        if "id" in equals:
+            row = records.get(equals["id"])
+            candidates = () if row is None else (row,)
+        else:
+            buckets = [
+                self._get_index(table, field).get(equals[field], {})
+                for field in self.indexes.get(table, [])
+                if field in equals
+            ]
+            if buckets:
+                # The ids are snapshotted, records removed since then are skipped
+                ids = tuple(min(buckets, key=len))
+                candidates = filter(None, map(records.get, ids))
+            else:
+                candidates = self._snapshot(table)
+        return map(codec.decode, matches(candidates))
+
+    def find(self, table: str, **equals) -> list[dict]:
+        """
+        Returns the records of the table whose fields are equal to the given values.
+
+        Args:
+            table (str): The name of the table to search.
+            **equals: The values the fields of the records must be equal to.
+
+        Returns:
+            list[dict]: The matching records.
+        """
+        return list(self.iterate(table, **equals))
 
     def list(self, table: str) -> list[dict]:
         """
@@ -47,7 +464,8 @@ class InMemoryDB:
         Returns:
         list[dict]: A list of dictionaries containing all the items in the specified table.
         """
-        return list(self._get_table(table).values())
+        codec = self.codecs.get(table, DICT_ROWS)
+        return list(map(codec.decode, tuple(self._get_table(table).values())))
 
     def get(self, table: str, id: uuid.UUID) -> dict:
         """
@@ -60,25 +478,44 @@ class InMemoryDB:
         Returns:
             dict: The record with the specified ID.
         """
-        return self._get_table(table)[id]
+        codec = self.codecs.get(table, DICT_ROWS)
+        return codec.decode(self._get_table(table)[codec.encode_value("id", id)])
 
-    def create(self, table: str, data: dict) -> dict:
+    def create(self, table: str, data: dict, unique: typing.Sequence[str] = ()) -> dict:
         """
-        Creates a new record in the specified table with the given data.
+        Creates a new record in the specified table with the given data. The unique
+        fields are checked and the record inserted under the table lock, so concurrent
+        creates can not both insert the same value.
 
         Args:
             table (str): The name of the table to create the record in.
             data (dict): A dictionary containing the data for the new record.
+            unique (Sequence[str]): The fields no other record may share, checked with
+                their index when they have one.
+
+        Raises:
+            ValueError: If another record has the same value of a unique field.
 
         Returns:
             dict: The newly created record.
         """
-        self._get_table(table)[data["id"]] = data
+        with self.lock(table):
+            for field in unique:
+                if any(
+                    record["id"] != data["id"]
+                    for record in self.find(table, **{field: data[field]})
+                ):
+                    raise ValueError(f"A record with this {field} already exists.")
+            codec = self.codecs.get(table, DICT_ROWS)
+            row = codec.encode(data)
+            old = self._get_table(table).get(codec.get(row, "id"))
+            self._replace_record(table, old, row)
         return data
 
     def update(self, table: str, id: uuid.UUID, data: dict) -> dict:
         """
-        Update a record in the specified table with the given ID and data.
+        Update a record in the specified table with the given ID and data. The record is
+        replaced by an updated copy, so readers holding the previous one are not affected.
 
         Args:
             table (str): The name of the table to update the record in.
@@ -88,8 +525,33 @@ class InMemoryDB:
         Returns:
             dict: The updated record.
         """
-        self._get_table(table)[id].update(data)
-        return self._get_table(table)[id]
+        with self.lock(table):
+            codec = self.codecs.get(table, DICT_ROWS)
+            old = self._get_table(table)[codec.encode_value("id", id)]
+            row = codec.replace(old, data)
+            self._replace_record(table, old, row)
+        return codec.decode(row)
+
+    def increment(self, table: str, id: uuid.UUID, counters: dict[str, int]) -> dict:
+        """
+        Adds the given amounts to the counters of a record, creating the record if it does not exist.
+
+        Args:
+            table (str): The name of the table holding the counters.
+            id (uuid.UUID): The ID of the counters record.
+            counters (dict[str, int]): The amount to add to each counter.
+
+        Returns:
+            dict: The updated record.
+        """
+        with self.lock(table):
+            codec = self.codecs.get(table, DICT_ROWS)
+            old = self._get_table(table).get(codec.encode_value("id", id))
+            record = {"id": id} if old is None else dict(codec.decode(old))
+            for key, amount in counters.items():
+                record[key] = record.get(key, 0) + amount
+            self._replace_record(table, old, codec.encode(record))
+        return record
 
     def remove(self, table, id: uuid.UUID) -> None:
         """
@@ -102,4 +564,9 @@ class InMemoryDB:
         Returns:
             None
         """
-        del self._get_table(table)[id]
+        with self.lock(table):
+            codec = self.codecs.get(table, DICT_ROWS)
+            row = self._get_table(table).pop(codec.encode_value("id", id))
+            self._unindex_record(table, row, self.indexes.get(table, []))
+            codec.release(row)
+            self._writes[table] = self._writes.get(table, 0) + 1
@@ -1,5 +1,7 @@
 from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
 
 from api.config import REDIS_URI
 
 redis_connection = Redis.from_url(REDIS_URI)
+async_redis_connection = AsyncRedis.from_url(REDIS_URI)
@@ -1,24 +1,528 @@
-from rethinkdb import r
+import asyncio
+import collections
+import contextlib
+import functools
+import itertools
+import threading
+import time
+import typing
 
-from api.config import RETHINKDB_DB_NAME, RETHINKDB_URI
+from rethinkdb import RethinkDB, r
+from rethinkdb.errors import ReqlDriverError
+from rethinkdb.net import Connection
+
+from api.config import (
+    RETHINKDB_DB_NAME,
+    RETHINKDB_POOL_HEALTH_CHECK_INTERVAL,
+    RETHINKDB_POOL_MAX_SIZE,
+    RETHINKDB_POOL_MIN_SIZE,
+    RETHINKDB_POOL_TIMEOUT,
+    RETHINKDB_REPLICA_URIS,
+    RETHINKDB_URI,
+)
+from api.db import check_unique
 
 uri = f"{RETHINKDB_URI}/{RETHINKDB_DB_NAME}"
+replica_uris = [
+    f"{replica_uri}/{RETHINKDB_DB_NAME}" for replica_uri in RETHINKDB_REPLICA_URIS
+]
+
+# Queries are built with `r` and run on whichever connection is given, this instance only
+# opens connections driven by the asyncio event loop.
+r_asyncio = RethinkDB()
+r_asyncio.set_loop_type("asyncio")
+
+
+class ConnectionPool:
+    """
+    A thread safe pool of rethinkdb connections.
+
+    Rethinkdb connections must not be shared between threads, so every query checks out a
+    connection for the duration of a `with pool.connection() as connection:` block.
+    Connections that raise a driver error are discarded and replaced on the next checkout,
+    and idle connections are pinged before reuse, so the pool survives database restarts.
+
+    Args:
+        connect (Callable[[], Connection]): Opens a new connection.
+        min_size (int): The number of connections opened by `open`.
+        max_size (int): The maximum number of connections, idle or checked out.
+        timeout (float | None): Seconds to wait for a free connection, None waits forever.
+        health_check_interval (float): Idle seconds after which a connection is pinged.
+    """
+
+    def __init__(
+        self,
+        connect: typing.Callable[[], Connection],
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float | None = None,
+        health_check_interval: float = 30,
+    ) -> None:
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size.")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle: collections.deque[tuple[Connection, float]] = collections.deque()
+        self._size = 0
+        self._condition = threading.Condition()
+
+    @property
+    def size(self) -> int:
+        """
+        The number of open connections, idle or checked out.
+        """
+        return self._size
+
+    def open(self) -> None:
+        """
+        Opens connections until the pool holds `min_size` of them.
+        """
+        while self._size < self.min_size:
+            connection = self._connect()
+            with self._condition:
+                self._size += 1
+                self._idle.append((connection, time.monotonic()))
+                self._condition.notify()
+
+    def close(self) -> None:
+        """
+        Closes the idle connections. Checked out connections are closed when released.
+        """
+        with self._condition:
+            idle, self._idle = self._idle, collections.deque()
+            self._size -= len(idle)
+        for connection, _ in idle:
+            self._close(connection)
+
+    @contextlib.contextmanager
+    def connection(self) -> typing.Iterator[Connection]:
+        """
+        Checks out a connection for the duration of the block.
+
+        Raises:
+            ReqlDriverError: If no connection gets free before the pool timeout.
+        """
+        connection = self._acquire()
+        try:
+            yield connection
+        except ReqlDriverError:
+            self._release(connection, broken=True)
+            raise
+        except BaseException:
+            self._release(connection)
+            raise
+        else:
+            self._release(connection)
+
+    def _acquire(self) -> Connection:
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._condition:
+            while not self._idle and self._size >= self.max_size:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise ReqlDriverError("Timed out waiting for a free connection.")
+                self._condition.wait(remaining)
+
+            if self._idle:
+                # LIFO keeps the most recently used connections warm
+                connection, last_used = self._idle.pop()
+            else:
+                connection, last_used = None, None
+                self._size += 1
+
+        try:
+            if connection is None:
+                return self._connect()
+            if not self._is_healthy(connection, last_used):
+                connection.reconnect(noreply_wait=False)
+            return connection
+        except BaseException:
+            self._release(connection, broken=True)
+            raise
+
+    def _release(self, connection: Connection | None, broken: bool = False) -> None:
+        with self._condition:
+            if broken or connection is None:
+                self._size -= 1
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+        if broken and connection is not None:
+            self._close(connection)
+
+    def _is_healthy(self, connection: Connection, last_used: float) -> bool:
+        if not connection.is_open():
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            connection.server()
+        except ReqlDriverError:
+            return False
+        return True
+
+    @staticmethod
+    def _close(connection: Connection) -> None:
+        try:
+            connection.close(noreply_wait=False)
+        except ReqlDriverError:
+            pass
+
+
+class AsyncConnectionPool:
+    """
+    An asyncio pool of rethinkdb connections, the counterpart of `ConnectionPool` for
+    async repos. Connections are checked out with `async with pool.connection() as
+    connection:` and follow the same health check and discard rules.
+
+    Args:
+        connect (Callable[[], Awaitable[Connection]]): Opens a new asyncio connection.
+        min_size (int): The number of connections opened by `open`.
+        max_size (int): The maximum number of connections, idle or checked out.
+        timeout (float | None): Seconds to wait for a free connection, None waits forever.
+        health_check_interval (float): Idle seconds after which a connection is pinged.
+    """
+
+    def __init__(
+        self,
+        connect: typing.Callable[[], typing.Awaitable[Connection]],
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float | None = None,
+        health_check_interval: float = 30,
+    ) -> None:
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size.")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle: collections.deque[tuple[Connection, float]] = collections.deque()
+        self._size = 0
+        self._condition = asyncio.Condition()
+
+    @property
+    def size(self) -> int:
+        """
+        The number of open connections, idle or checked out.
+        """
+        return self._size
+
+    async def open(self) -> None:
+        """
+        Opens connections until the pool holds `min_size` of them.
+        """
+        while self._size < self.min_size:
+            connection = await self._connect()
+            async with self._condition:
+                self._size += 1
+                self._idle.append((connection, time.monotonic()))
+                self._condition.notify()
+
+    async def close(self) -> None:
+        """
+        Closes the idle connections. Checked out connections are closed when released.
+        """
+        async with self._condition:
+            idle, self._idle = self._idle, collections.deque()
+            self._size -= len(idle)
+        for connection, _ in idle:
+            await self._close(connection)
+
+    @contextlib.asynccontextmanager
+    async def connection(self) -> typing.AsyncIterator[Connection]:
+        """
+        Checks out a connection for the duration of the block.
+
+        Raises:
+            ReqlDriverError: If no connection gets free before the pool timeout.
+        """
+        connection = await self._acquire()
+        try:
+            yield connection
+        except ReqlDriverError:
+            await self._release(connection, broken=True)
+            raise
+        except BaseException:
+            await self._release(connection)
+            raise
+        else:
+            await self._release(connection)
+
+    async def _acquire(self) -> Connection:
+        async with self._condition:
+            try:
+                await asyncio.wait_for(
+                    self._condition.wait_for(
+                        lambda: self._idle or self._size < self.max_size
+                    ),
+                    self.timeout,
+                )
+            except asyncio.TimeoutError as e:
+                raise ReqlDriverError("Timed out waiting for a free connection.") from e
+
+            if self._idle:
+                connection, last_used = self._idle.pop()
+            else:
+                connection, last_used = None, None
+                self._size += 1
+
+        try:
+            if connection is None:
+                return await self._connect()
+            if not await self._is_healthy(connection, last_used):
+                await connection.reconnect(noreply_wait=False)
+            return connection
+        except BaseException:
+            await self._release(connection, broken=True)
+            raise
+
+    async def _release(self, connection: Connection | None, broken: bool = False):
+        async with self._condition:
+            if broken or connection is None:
+                self._size -= 1
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+        if broken and connection is not None:
+            await self._close(connection)
+
+    async def _is_healthy(self, connection: Connection, last_used: float) -> bool:
+        if not connection.is_open():
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            await connection.server()
+        except ReqlDriverError:
+            return False
+        return True
+
+    @staticmethod
+    async def _close(connection: Connection) -> None:
+        try:
+            await connection.close(noreply_wait=False)
+        except ReqlDriverError:
+            pass
+
+
+def round_robin(connect: typing.Callable, urls: list[str]) -> typing.Callable:
+    """
+    Returns a connect function that spreads the new connections over the given urls.
+
+    Args:
+        connect (Callable): Opens a connection to the `url` keyword argument.
+        urls (list[str]): The urls to connect to, in turns.
+    """
+    urls = itertools.cycle(urls)
+    return lambda: connect(url=next(urls))
+
+
+rethinkdb_pool = ConnectionPool(
+    connect=functools.partial(r.connect, url=uri),
+    min_size=RETHINKDB_POOL_MIN_SIZE,
+    max_size=RETHINKDB_POOL_MAX_SIZE,
+    timeout=RETHINKDB_POOL_TIMEOUT,
+    health_check_interval=RETHINKDB_POOL_HEALTH_CHECK_INTERVAL,
+)
+
+rethinkdb_async_pool = AsyncConnectionPool(
+    connect=functools.partial(r_asyncio.connect, url=uri),
+    min_size=RETHINKDB_POOL_MIN_SIZE,
+    max_size=RETHINKDB_POOL_MAX_SIZE,
+    timeout=RETHINKDB_POOL_TIMEOUT,
+    health_check_interval=RETHINKDB_POOL_HEALTH_CHECK_INTERVAL,
+)
+
+# Pools of the servers close to the replicas, for the eventually consistent reads.
+# Writes and reads that must see them always use the pools of RETHINKDB_URI.
+rethinkdb_replica_pool = None
+rethinkdb_replica_async_pool = None
+if replica_uris:
+    rethinkdb_replica_pool = ConnectionPool(
+        connect=round_robin(r.connect, replica_uris),
+        min_size=RETHINKDB_POOL_MIN_SIZE,
+        max_size=RETHINKDB_POOL_MAX_SIZE,
+        timeout=RETHINKDB_POOL_TIMEOUT,
+        health_check_interval=RETHINKDB_POOL_HEALTH_CHECK_INTERVAL,
+    )
+    rethinkdb_replica_async_pool = AsyncConnectionPool(
+        connect=round_robin(r_asyncio.connect, replica_uris),
+        min_size=RETHINKDB_POOL_MIN_SIZE,
+        max_size=RETHINKDB_POOL_MAX_SIZE,
+        timeout=RETHINKDB_POOL_TIMEOUT,
+        health_check_interval=RETHINKDB_POOL_HEALTH_CHECK_INTERVAL,
+    )
+
+# Tables and their secondary indexes, as {table: {index: [fields]}}.
+# Indexes with more than one field are compound indexes.
+SCHEMA: dict[str, dict[str, list[str]]] = {
+    "users": {"username": ["username"]},
+    "usernames": {},
+    "tasks": {
+        "user": ["user"],
+        "status": ["status"],
+        "user_status": ["user", "status"],
+        # Ordered indexes, the lists are paged in the order they read the rows
+        "received_at": ["received_at"],
+        "user_received_at": ["user", "received_at"],
+        "status_received_at": ["status", "received_at"],
+        "user_status_received_at": ["user", "status", "received_at"],
+    },
+    "tasks_stats": {},
+    "tasks_versions": {},
+}
+
+# Tables keyed by a unique field of another table, as {table: (source table, field,
+# reference field)}. Their rows are {"id": value, <reference field>: source id}, and they
+# are filled from the source table when they are created.
+LOOKUPS: dict[str, tuple[str, str, str]] = {
+    "usernames": ("users", "username", "user"),
+}
+
+
+def select(
+    table, query: dict, indexes: dict[str, list[str]], order_by: str | None = None
+):
+    """
+    Returns the rows of the table that match every field of the query.
+
+    The rows are looked up with `get_all` on the primary key, or on the index covering the
+    most query fields, and only the fields left are matched with `filter`. A full table
+    scan only happens when no index fits the query.
+
+    With `order_by`, the rows are read in order from an index made of the query fields it
+    covers followed by `order_by`, like `["user", "received_at"]`, so pages taken with
+    `skip` and `limit` are stable. Rows with the same value come in primary key order,
+    and "id" orders them by the primary key. An index covering more query fields than
+    every ordered one is still preferred, unordered.
+
+    Args:
+        table: The `r.table(...)` handle to select from.
+        query (dict): The field values to match.
+        indexes (dict[str, list[str]]): The secondary indexes of the table.
+        order_by (str | None): The field to order the rows by.
+
+    Returns:
+        The ReQL selection of the matching rows.
+    """
+    if "id" in query:
+        index, fields = None, ["id"]
+    else:
+        covering = [
+            (index, fields)
+            for index, fields in indexes.items()
+            if all(field in query for field in fields)
+        ]
+        index, fields = max(covering, key=lambda item: len(item[1]), default=(None, []))
+
+    ordered = None
+    if order_by is not None and "id" not in query:
+        candidates = {**indexes, "id": ["id"]}.items()
+        ordered = max(
+            (
+                (index, fields[:-1])
+                for index, fields in candidates
+                if fields[-1] == order_by and all(f in query for f in fields[:-1])
+            ),
+            key=lambda item: len(item[1]),
+            default=None,
+        )
+        if ordered is not None and len(ordered[1]) < len(fields):
+            ordered = None
+
+    selection = table
+    if ordered is not None:
+        index, fields = ordered
+        if fields:
+            keys = [query[field] for field in fields]
+            selection = table.between([*keys, r.minval], [*keys, r.maxval], index=index)
+        selection = selection.order_by(index=index)
+    elif fields:
+        keys = [query[field] for field in fields]
+        key = keys if len(keys) > 1 else keys[0]
+        selection = table.get_all(key, index=index) if index else table.get_all(key)
+
+    remaining = {field: value for field, value in query.items() if field not in fields}
+    if remaining:
+        selection = selection.filter(remaining)
+    return selection
+
+
+def duplicated_values(table, field: str):
+    """
+    Returns the query of the values of the field held by more than one row of the table.
+
+    Args:
+        table: The rethinkdb table.
+        field (str): The field to check.
+    """
+    return (
+        table.group(field)
+        .count()
+        .ungroup()
+        .filter(lambda group: group["reduction"] > 1)
+        .map(lambda group: group["group"])
+    )
 
-rethinkdb_connection = r.connect(url=uri)
 
+def bootstrap(
+    connection,
+    db_name: str = RETHINKDB_DB_NAME,
+    schema: dict = SCHEMA,
+    lookups: dict = LOOKUPS,
+):
+    """
+    Creates the database, tables and indexes of the schema that do not exist yet.
+    It is meant to run once at startup or through `manage.py migrate`, so repos can use
+    `r.table(...)` directly instead of checking the schema on every query.
 
-def get_or_create_db(db_name: str):
-    if db_name not in r.db_list().run(rethinkdb_connection):
-        r.db_create(db_name).run(rethinkdb_connection)
-    return r.db(db_name)
+    Lookup tables are not created while their source field holds duplicated values, the
+    bootstrap fails listing them instead, at startup as in `manage.py migrate`.
 
+    Args:
+        connection: The rethinkdb connection to run the queries with.
+        db_name (str): The name of the database.
+        schema (dict): The tables and indexes to create.
+        lookups (dict): The lookup tables to fill from their source table on creation.
 
-def get_or_create_table_for_db(db_name: str, table_name: str):
-    get_or_create_db(db_name)
-    if table_name not in r.table_list().run(rethinkdb_connection):
-        r.table_create(table_name).run(rethinkdb_connection)
-    return r.table(table_name)
+    Raises:
+        DuplicateValuesError: If a lookup table can not be filled.
+    """
+    if db_name not in r.db_list().run(connection):
+        r.db_create(db_name).run(connection)
+    db = r.db(db_name)
 
+    tables = db.table_list().run(connection)
+    for table_name, indexes in schema.items():
+        table = db.table(table_name)
+        if table_name not in tables:
+            if table_name in lookups:
+                source, field, reference = lookups[table_name]
+                duplicates = duplicated_values(db.table(source), field).run(connection)
+                check_unique(source, field, duplicates)
+            db.table_create(table_name).run(connection)
+            if table_name in lookups:
+                table.insert(
+                    db.table(source).map(
+                        lambda row: {"id": row[field], reference: row["id"]}
+                    )
+                ).run(connection)
 
-def get_or_create_table(table_name: str):
-    return get_or_create_table_for_db(RETHINKDB_DB_NAME, table_name)
+        existing = table.index_list().run(connection)
+        for index_name, fields in indexes.items():
+            if index_name in existing:
+                continue
+            if len(fields) > 1:
+                table.index_create(index_name, [r.row[field] for field in fields]).run(
+                    connection
+                )
+            else:
+                table.index_create(index_name, r.row[fields[0]]).run(connection)
+        table.index_wait().run(connection)
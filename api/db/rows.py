@@ -0,0 +1,204 @@
+import datetime
+import enum
+import types
+import typing
+import uuid
+
+from pydantic import BaseModel
+from pydantic.fields import FieldInfo
+
+_object_setattr = object.__setattr__
+
+
+def _field_type(info: FieldInfo) -> type | None:
+    """
+    Returns the type of the field, the inner type of optional fields, or None when it is
+    not a plain class.
+    """
+    annotation = info.annotation
+    if typing.get_origin(annotation) in (typing.Union, types.UnionType):
+        args = [a for a in typing.get_args(annotation) if a is not type(None)]
+        annotation = args[0] if len(args) == 1 else None
+    return annotation if isinstance(annotation, type) else None
+
+
+def _nullable(info: FieldInfo) -> bool:
+    annotation = info.annotation
+    if annotation is None or annotation is typing.Any:
+        return True
+    if typing.get_origin(annotation) in (typing.Union, types.UnionType):
+        return type(None) in typing.get_args(annotation)
+    return False
+
+
+def _uuid(value: typing.Any) -> uuid.UUID:
+    return value if type(value) is uuid.UUID else uuid.UUID(value)
+
+
+def _datetime(value: typing.Any) -> datetime.datetime:
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.fromisoformat(value)
+
+
+def _enum(type_: type[enum.Enum]) -> typing.Callable[[typing.Any], enum.Enum]:
+    members = {member.value: member for member in type_}
+    members.update((member, member) for member in type_)
+
+    def convert(value: typing.Any) -> enum.Enum:
+        member = members.get(value)
+        return type_(value) if member is None else member
+
+    return convert
+
+
+class RowHydrator:
+    """
+    Builds models from the rows the repositories wrote themselves, without validating
+    them again. The rows were validated when their model was created, so only the values
+    stored as JSON strings are converted back to UUIDs, datetimes and enums, and the
+    model is built with `model_construct` semantics: model validators do not run and
+    fields missing from the row take their default. Fields that can not be None also take
+    their default when the row holds None, like the records written before the field was
+    added and decoded with a fixed schema.
+
+    Only use it for rows read from our own storage, data sent by clients must still be
+    validated by the model.
+
+    Args:
+        model (type[BaseModel]): The model of the rows.
+        shared (bool): Whether the rows are the records kept by the storage, like the
+            records of an InMemoryDB. Their dict and list values are copied, so changing
+            a model does not change the stored record.
+    """
+
+    def __init__(self, model: type[BaseModel], shared: bool = False) -> None:
+        self.model = model
+        self.shared = shared
+        self._fields = []
+        for field, info in model.model_fields.items():
+            annotation = _field_type(info)
+            converter = None
+            if annotation is not None:
+                if issubclass(annotation, enum.Enum):
+                    converter = _enum(annotation)
+                elif issubclass(annotation, uuid.UUID):
+                    converter = _uuid
+                elif issubclass(annotation, datetime.datetime):
+                    converter = _datetime
+            # None is kept for the fields accepting it and for the required fields
+            fallback = not info.is_required() and not _nullable(info)
+            self._fields.append((field, converter, fallback, info))
+
+    def __call__(self, row: typing.Mapping) -> BaseModel:
+        """
+        Returns the model of the given row.
+
+        Args:
+            row (Mapping): The row, with JSON or python values.
+        """
+        values = {}
+        fields_set = set()
+        for field, converter, fallback, info in self._fields:
+            value = row.get(field)
+            if value is None:
+                if fallback or field not in row:
+                    values[field] = info.get_default(call_default_factory=True)
+                    continue
+            elif converter is not None:
+                value = converter(value)
+            elif self.shared and isinstance(value, (dict, list)):
+                value = value.copy()
+            values[field] = value
+            fields_set.add(field)
+
+        instance = self.model.__new__(self.model)
+        _object_setattr(instance, "__dict__", values)
+        _object_setattr(instance, "__pydantic_fields_set__", fields_set)
+        _object_setattr(instance, "__pydantic_extra__", None)
+        _object_setattr(instance, "__pydantic_private__", None)
+        return instance
+
+
+def _encode_uuid(value: uuid.UUID) -> str:
+    return str(value)
+
+
+def _encode_datetime(value: datetime.datetime) -> str:
+    # Written like pydantic does, so stored values compare equal to the existing ones
+    encoded = value.isoformat()
+    if encoded.endswith("+00:00"):
+        encoded = encoded[:-6] + "Z"
+    return encoded
+
+
+def _encode_enum(value: enum.Enum) -> typing.Any:
+    return value.value
+
+
+class RowDumper:
+    """
+    Builds the JSON compatible dicts the drivers store from models, like
+    `json.loads(model.model_dump_json())` does without encoding and parsing a string.
+
+    The encoder of every field is picked once from the model: UUIDs and datetimes are
+    written as strings, like pydantic writes them, and enums as their values. Other values
+    are kept as they are and must already be JSON compatible, like the dicts of
+    `trello_data` or `external_data`.
+
+    Args:
+        model (type[BaseModel]): The model to dump.
+    """
+
+    def __init__(self, model: type[BaseModel]) -> None:
+        self.model = model
+        self._encoders = {}
+        for field, info in model.model_fields.items():
+            annotation = _field_type(info)
+            if annotation is None:
+                continue
+            if issubclass(annotation, enum.Enum):
+                self._encoders[field] = _encode_enum
+            elif issubclass(annotation, uuid.UUID):
+                self._encoders[field] = _encode_uuid
+            elif issubclass(annotation, datetime.datetime):
+                self._encoders[field] = _encode_datetime
+            elif issubclass(annotation, BaseModel):
+                self._encoders[field] = dump_row
+
+    def __call__(self, instance: BaseModel, exclude_none: bool = False) -> dict:
+        """
+        Returns the row of the given model.
+
+        Args:
+            instance (BaseModel): The model to dump.
+            exclude_none (bool): Whether to leave the fields set to None out of the row.
+        """
+        row = {}
+        for field, value in instance.__dict__.items():
+            if value is None:
+                if not exclude_none:
+                    row[field] = None
+                continue
+            encoder = self._encoders.get(field)
+            row[field] = value if encoder is None else encoder(value)
+        return row
+
+
+_dumpers: dict[type[BaseModel], RowDumper] = {}
+
+
+def dump_row(instance: BaseModel, exclude_none: bool = False) -> dict:
+    """
+    Returns the JSON compatible dict of a model, ready to be stored by the drivers or
+    used in their queries. The `RowDumper` of every model class is built once.
+
+    Args:
+        instance (BaseModel): The model to dump.
+        exclude_none (bool): Whether to leave the fields set to None out of the row.
+    """
+    model = type(instance)
+    dumper = _dumpers.get(model)
+    if dumper is None:
+        dumper = _dumpers[model] = RowDumper(model)
+    return dumper(instance, exclude_none=exclude_none)
@@ -0,0 +1,184 @@
+import contextlib
+import sqlite3
+import threading
+import typing
+
+from api.config import SQLITE_PATH
+from api.db import check_unique
+
+# Tables and indexes, created by `bootstrap` when they do not exist yet
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id TEXT PRIMARY KEY,
+        username TEXT NOT NULL,
+        password TEXT NOT NULL,
+        external_data TEXT,
+        token_version INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS tasks (
+        id TEXT PRIMARY KEY,
+        user TEXT NOT NULL,
+        received_at TEXT NOT NULL,
+        status TEXT NOT NULL,
+        type TEXT NOT NULL,
+        category TEXT,
+        title TEXT,
+        description TEXT,
+        trello_data TEXT,
+        fail_count INTEGER NOT NULL DEFAULT 0,
+        revision INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT
+    )
+    """,
+    # Also serves the queries by user alone
+    "CREATE INDEX IF NOT EXISTS tasks_user_status ON tasks (user, status)",
+    "CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status)",
+    """
+    CREATE TABLE IF NOT EXISTS tasks_stats (
+        user TEXT NOT NULL,
+        counter TEXT NOT NULL,
+        amount INTEGER NOT NULL,
+        PRIMARY KEY (user, counter)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS tasks_versions (
+        user TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """,
+]
+
+# Unique indexes, as (index, table, column, replaced index), created by `bootstrap` once
+# the rows of their table hold no duplicated values. The index they replace is dropped.
+UNIQUE_INDEXES = [
+    # Registrations rely on it to reject taken usernames
+    ("users_username_unique", "users", "username", "users_username"),
+]
+
+# Columns added after their table was created, as (table, column, definition), added by
+# `bootstrap` to the databases created before them
+ADDED_COLUMNS = [
+    ("users", "token_version", "INTEGER NOT NULL DEFAULT 0"),
+    ("tasks", "revision", "INTEGER NOT NULL DEFAULT 0"),
+    ("tasks", "updated_at", "TEXT"),
+]
+
+
+class SQLitePool:
+    """
+    Hands every thread its own connection to the sqlite database, sqlite connections must
+    not be shared between threads.
+
+    Connections run in WAL mode, so readers do not block the writer and the writer does
+    not block readers, with `synchronous=NORMAL`, which only fsyncs the WAL on
+    checkpoints. Connections are in autocommit mode, writes that span several
+    statements run in a `transaction` block. sqlite keeps a cache of prepared statements
+    per connection, so repos only use constant SQL with placeholders.
+
+    Args:
+        path (str): The path of the database file.
+        timeout (float): Seconds to wait for the write lock held by another connection.
+        cached_statements (int): The number of prepared statements kept per connection.
+    """
+
+    def __init__(
+        self, path: str, timeout: float = 5, cached_statements: int = 256
+    ) -> None:
+        self.path = path
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            isolation_level=None,
+            cached_statements=self.cached_statements,
+        )
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        The connection of the current thread, opened on first use.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    @contextlib.contextmanager
+    def transaction(self) -> typing.Iterator[sqlite3.Connection]:
+        """
+        Runs the block in a write transaction of the current thread's connection, taking
+        the write lock upfront so reads in the block see the rows they update.
+        """
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def close(self) -> None:
+        """
+        Closes the connection of the current thread.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def bootstrap(
+    connection: sqlite3.Connection,
+    schema: list[str] = SCHEMA,
+    added_columns: list[tuple[str, str, str]] = ADDED_COLUMNS,
+    unique_indexes: list[tuple[str, str, str, str]] = UNIQUE_INDEXES,
+) -> None:
+    """
+    Creates the tables, indexes and columns of the schema that do not exist yet.
+
+    Unique indexes are created before the API serves any request, so it does not start
+    while their column holds duplicated values, and neither does `manage.py migrate`.
+
+    Args:
+        connection (sqlite3.Connection): The connection to run the statements with.
+        schema (list[str]): The statements creating the tables and indexes.
+        added_columns (list[tuple[str, str, str]]): The columns added to the tables.
+        unique_indexes (list[tuple[str, str, str, str]]): The unique indexes.
+
+    Raises:
+        DuplicateValuesError: If a unique index can not be created.
+    """
+    for statement in schema:
+        connection.execute(statement)
+    for table, column, definition in added_columns:
+        columns = [row[1] for row in connection.execute(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    for index, table, column, replaced in unique_indexes:
+        exists = connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", [index]
+        ).fetchone()
+        if exists:
+            continue
+        duplicates = connection.execute(
+            f"SELECT {column} FROM {table} GROUP BY {column} HAVING COUNT(*) > 1"
+        ).fetchall()
+        check_unique(table, column, [row[0] for row in duplicates])
+        connection.execute(f"DROP INDEX IF EXISTS {replaced}")
+        connection.execute(f"CREATE UNIQUE INDEX {index} ON {table} ({column})")
+
+
+sqlite_pool = SQLitePool(path=SQLITE_PATH)
@@ -0,0 +1,68 @@
+import datetime
+import email.utils
+import typing
+
+import pydantic_core
+from fastapi import Request
+from starlette.responses import JSONResponse
+
+
+class PydanticJSONResponse(JSONResponse):
+    """
+    JSON response encoded by pydantic-core in a single pass. Models, lists of models and
+    their UUIDs, datetimes and enums are written straight to bytes, without converting
+    them to dicts with `jsonable_encoder` and dumping the dicts with `json.dumps`.
+
+    It is the default response class of the app. Routes returning models that need no
+    response validation, like the tasks built by the repos, return it directly so FastAPI
+    does not run `jsonable_encoder` on their content first.
+    """
+
+    def render(self, content: typing.Any) -> bytes:
+        return pydantic_core.to_json(content)
+
+
+def http_date(value: datetime.datetime) -> str:
+    """
+    Returns the date formatted for the `Last-Modified` header. Naive dates are taken as
+    local time, like the dates set with `datetime.datetime.now()`.
+
+    Args:
+        value (datetime.datetime): The date to format.
+    """
+    return email.utils.format_datetime(
+        value.astimezone(datetime.timezone.utc), usegmt=True
+    )
+
+
+def is_not_modified(
+    request: Request, etag: str, last_modified: datetime.datetime | None = None
+) -> bool:
+    """
+    Returns whether the client already holds the current representation, so the route
+    can answer 304 Not Modified without building the body. `If-None-Match` is compared
+    with the weak comparison, `If-Modified-Since` is only checked when the request has no
+    `If-None-Match`.
+
+    Args:
+        request (Request): The request with the conditional headers.
+        etag (str): The current entity tag, quoted.
+        last_modified (datetime.datetime | None): The date the resource last changed.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = email.utils.parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=datetime.timezone.utc)
+    # HTTP dates have a precision of one second
+    modified = last_modified.astimezone(datetime.timezone.utc).replace(microsecond=0)
+    return modified <= since
@@ -1,7 +1,11 @@
-from api.config import TESTING
+from api.config import DB_BACKEND, TESTING
 
 # Import the correct services based on the config
 if TESTING:
     from api.setup.testing import rq_queue, tasks_service, trello_service, users_service
+elif DB_BACKEND == "redis":
+    from api.setup.redis import rq_queue, tasks_service, trello_service, users_service
+elif DB_BACKEND == "sqlite":
+    from api.setup.sqlite import rq_queue, tasks_service, trello_service, users_service
 else:
     from api.setup.local import rq_queue, tasks_service, trello_service, users_service
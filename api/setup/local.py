@@ -1,25 +1,86 @@
 from rq import Queue
 
-from api.db.redis import redis_connection
-from api.db.rethinkdb import rethinkdb_connection
-from services.tasks.repo.rethinkdb import RethinkDBTasksRepo
+from api.config import (
+    ARCHIVE_PATH,
+    PRINCIPAL_CACHE_REDIS,
+    PRINCIPAL_CACHE_REDIS_TTL,
+    PRINCIPAL_CACHE_SIZE,
+    PRINCIPAL_CACHE_TTL,
+    RETHINKDB_BOOTSTRAP,
+    RETHINKDB_LIST_READ_MODE,
+    TASKS_QUERY_CACHE_MAX_ROWS,
+    TASKS_QUERY_CACHE_REDIS,
+    TASKS_QUERY_CACHE_REDIS_TTL,
+    TASKS_QUERY_CACHE_SIZE,
+    TASKS_QUERY_CACHE_TTL,
+)
+from api.db.redis import async_redis_connection, redis_connection
+from api.db.rethinkdb import (
+    bootstrap,
+    rethinkdb_async_pool,
+    rethinkdb_pool,
+    rethinkdb_replica_async_pool,
+    rethinkdb_replica_pool,
+)
+from services.tasks.archive import TasksArchive
+from services.tasks.cache import TasksQueryCache
+from services.tasks.repo.rethinkdb import AsyncRethinkDBTasksRepo, RethinkDBTasksRepo
 from services.tasks.service import TasksService
 from services.trello.service import TrelloService
-from services.users.repo.rethinkdb import RethinkDBUsersRepo
+from services.users.cache import PrincipalCache
+from services.users.repo.rethinkdb import AsyncRethinkDBUsersRepo, RethinkDBUsersRepo
 from services.users.service import UsersService
 
+rethinkdb_pool.open()
+if RETHINKDB_BOOTSTRAP:
+    with rethinkdb_pool.connection() as connection:
+        bootstrap(connection)
+
 rq_queue = Queue(name="tasks", connection=redis_connection)
 
 
-users_repo = RethinkDBUsersRepo(db=rethinkdb_connection)
-users_service = UsersService(repo=users_repo)
+users_repo = RethinkDBUsersRepo(db=rethinkdb_pool)
+async_users_repo = AsyncRethinkDBUsersRepo(db=rethinkdb_async_pool)
+principal_cache = PrincipalCache(
+    maxsize=PRINCIPAL_CACHE_SIZE,
+    ttl=PRINCIPAL_CACHE_TTL,
+    redis=redis_connection if PRINCIPAL_CACHE_REDIS else None,
+    async_redis=async_redis_connection if PRINCIPAL_CACHE_REDIS else None,
+    redis_ttl=PRINCIPAL_CACHE_REDIS_TTL,
+)
+users_service = UsersService(
+    repo=users_repo, async_repo=async_users_repo, cache=principal_cache
+)
 
 trello_service = TrelloService(users_service=users_service)
 
-tasks_repo = RethinkDBTasksRepo(db=rethinkdb_connection)
+# The tasks list is polled, so its reads may go to the replicas
+list_read_modes = {
+    "query": RETHINKDB_LIST_READ_MODE,
+    "iter_query": RETHINKDB_LIST_READ_MODE,
+}
+tasks_repo = RethinkDBTasksRepo(
+    db=rethinkdb_pool, replica_db=rethinkdb_replica_pool, read_modes=list_read_modes
+)
+async_tasks_repo = AsyncRethinkDBTasksRepo(
+    db=rethinkdb_async_pool,
+    replica_db=rethinkdb_replica_async_pool,
+    read_modes=list_read_modes,
+)
+tasks_query_cache = TasksQueryCache(
+    maxsize=TASKS_QUERY_CACHE_SIZE,
+    max_rows=TASKS_QUERY_CACHE_MAX_ROWS,
+    ttl=TASKS_QUERY_CACHE_TTL,
+    redis=redis_connection if TASKS_QUERY_CACHE_REDIS else None,
+    async_redis=async_redis_connection if TASKS_QUERY_CACHE_REDIS else None,
+    redis_ttl=TASKS_QUERY_CACHE_REDIS_TTL,
+)
 tasks_service = TasksService(
     repo=tasks_repo,
+    async_repo=async_tasks_repo,
     users_service=users_service,
     trello_service=trello_service,
     queue=rq_queue,
+    archive=TasksArchive(path=ARCHIVE_PATH),
+    cache=tasks_query_cache,
 )
@@ -0,0 +1,61 @@
+from rq import Queue
+
+from api.config import (
+    ARCHIVE_PATH,
+    PRINCIPAL_CACHE_REDIS,
+    PRINCIPAL_CACHE_REDIS_TTL,
+    PRINCIPAL_CACHE_SIZE,
+    PRINCIPAL_CACHE_TTL,
+    TASKS_QUERY_CACHE_MAX_ROWS,
+    TASKS_QUERY_CACHE_REDIS,
+    TASKS_QUERY_CACHE_REDIS_TTL,
+    TASKS_QUERY_CACHE_SIZE,
+    TASKS_QUERY_CACHE_TTL,
+)
+from api.db.redis import async_redis_connection, redis_connection
+from services.tasks.archive import TasksArchive
+from services.tasks.cache import TasksQueryCache
+from services.tasks.repo.redis import AsyncRedisTasksRepo, RedisTasksRepo
+from services.tasks.service import TasksService
+from services.trello.service import TrelloService
+from services.users.cache import PrincipalCache
+from services.users.repo.redis import AsyncRedisUsersRepo, RedisUsersRepo
+from services.users.service import UsersService
+
+rq_queue = Queue(name="tasks", connection=redis_connection)
+
+
+users_repo = RedisUsersRepo(db=redis_connection)
+async_users_repo = AsyncRedisUsersRepo(db=async_redis_connection)
+principal_cache = PrincipalCache(
+    maxsize=PRINCIPAL_CACHE_SIZE,
+    ttl=PRINCIPAL_CACHE_TTL,
+    redis=redis_connection if PRINCIPAL_CACHE_REDIS else None,
+    async_redis=async_redis_connection if PRINCIPAL_CACHE_REDIS else None,
+    redis_ttl=PRINCIPAL_CACHE_REDIS_TTL,
+)
+users_service = UsersService(
+    repo=users_repo, async_repo=async_users_repo, cache=principal_cache
+)
+
+trello_service = TrelloService(users_service=users_service)
+
+tasks_repo = RedisTasksRepo(db=redis_connection)
+async_tasks_repo = AsyncRedisTasksRepo(db=async_redis_connection)
+tasks_query_cache = TasksQueryCache(
+    maxsize=TASKS_QUERY_CACHE_SIZE,
+    max_rows=TASKS_QUERY_CACHE_MAX_ROWS,
+    ttl=TASKS_QUERY_CACHE_TTL,
+    redis=redis_connection if TASKS_QUERY_CACHE_REDIS else None,
+    async_redis=async_redis_connection if TASKS_QUERY_CACHE_REDIS else None,
+    redis_ttl=TASKS_QUERY_CACHE_REDIS_TTL,
+)
+tasks_service = TasksService(
+    repo=tasks_repo,
+    async_repo=async_tasks_repo,
+    users_service=users_service,
+    trello_service=trello_service,
+    queue=rq_queue,
+    archive=TasksArchive(path=ARCHIVE_PATH),
+    cache=tasks_query_cache,
+)
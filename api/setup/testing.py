@@ -1,25 +1,46 @@
 from fakeredis import FakeStrictRedis
 from rq import Queue
 
+from api.config import (
+    PRINCIPAL_CACHE_SIZE,
+    PRINCIPAL_CACHE_TTL,
+    TASKS_QUERY_CACHE_MAX_ROWS,
+    TASKS_QUERY_CACHE_SIZE,
+    TASKS_QUERY_CACHE_TTL,
+)
 from api.db.memory import InMemoryDB
-from services.tasks.repo.memory import TasksMemoryRepo
+from services.tasks.cache import TasksQueryCache
+from services.tasks.repo.memory import AsyncTasksMemoryRepo, TasksMemoryRepo
 from services.tasks.service import TasksService
 from services.trello.service import TrelloService
-from services.users.repo.memory import UsersMemoryRepo
+from services.users.cache import PrincipalCache
+from services.users.repo.memory import AsyncUsersMemoryRepo, UsersMemoryRepo
 from services.users.service import UsersService
 
 db = InMemoryDB()
 rq_queue = Queue(name="tasks", is_async=False, connection=FakeStrictRedis())
 
 users_repo = UsersMemoryRepo(db=db)
-users_service = UsersService(repo=users_repo)
+async_users_repo = AsyncUsersMemoryRepo(db=db)
+principal_cache = PrincipalCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+users_service = UsersService(
+    repo=users_repo, async_repo=async_users_repo, cache=principal_cache
+)
 
 trello_service = TrelloService(users_service=users_service)
 
 tasks_repo = TasksMemoryRepo(db=db)
+async_tasks_repo = AsyncTasksMemoryRepo(db=db)
+tasks_query_cache = TasksQueryCache(
+    maxsize=TASKS_QUERY_CACHE_SIZE,
+    max_rows=TASKS_QUERY_CACHE_MAX_ROWS,
+    ttl=TASKS_QUERY_CACHE_TTL,
+)
 tasks_service = TasksService(
     repo=tasks_repo,
+    async_repo=async_tasks_repo,
     users_service=users_service,
     trello_service=trello_service,
     queue=rq_queue,
+    cache=tasks_query_cache,
 )
@@ -1,10 +1,14 @@
 from fastapi import FastAPI
 
+from api.responses import PydanticJSONResponse
 from api.router import router
+from services.auth.hasher import password_hasher
 
 app = FastAPI(
     title="SpaceX Trello API",
     version="0.0.1",
+    default_response_class=PydanticJSONResponse,
 )
 
 app.include_router(router)
+app.add_event_handler("shutdown", password_hasher.shutdown)
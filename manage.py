@@ -0,0 +1,77 @@
+import argparse
+import datetime
+
+from api.config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+
+
+def migrate(args: argparse.Namespace) -> None:
+    """
+    Creates the missing database, tables and indexes of the rethinkdb or sqlite backend.
+    """
+    from api.config import DB_BACKEND
+    from api.db import DuplicateValuesError
+
+    try:
+        if DB_BACKEND == "sqlite":
+            from api.db.sqlite import bootstrap, sqlite_pool
+
+            bootstrap(sqlite_pool.connection)
+            return
+
+        from api.db.rethinkdb import bootstrap, rethinkdb_pool
+
+        with rethinkdb_pool.connection() as connection:
+            bootstrap(connection)
+    except DuplicateValuesError as e:
+        parser.exit(1, f"{e}\n")
+
+
+def rebuild_stats(args: argparse.Namespace) -> None:
+    """
+    Recomputes the task counters of every user from the tasks table.
+    """
+    from api.setup import tasks_service
+
+    tasks_service.rebuild_stats()
+
+
+def archive(args: argparse.Namespace) -> None:
+    """
+    Moves the tasks created in trello before the given age to the archive.
+    """
+    from api.setup import tasks_service
+
+    before = datetime.datetime.now() - datetime.timedelta(days=args.days)
+    archived = tasks_service.archive_tasks(before=before, batch_size=args.batch_size)
+    print(f"Archived {archived} tasks.")
+
+
+parser = argparse.ArgumentParser(description="SpaceX Trello API management commands.")
+commands = parser.add_subparsers(dest="command", required=True)
+
+commands.add_parser("migrate", help=migrate.__doc__.strip()).set_defaults(
+    handler=migrate
+)
+commands.add_parser("rebuild_stats", help=rebuild_stats.__doc__.strip()).set_defaults(
+    handler=rebuild_stats
+)
+
+archive_parser = commands.add_parser("archive", help=archive.__doc__.strip())
+archive_parser.add_argument(
+    "--days",
+    type=int,
+    default=ARCHIVE_AFTER_DAYS,
+    help="Age in days of the archived tasks.",
+)
+archive_parser.add_argument(
+    "--batch-size",
+    type=int,
+    default=ARCHIVE_BATCH_SIZE,
+    help="Tasks moved per batch.",
+)
+archive_parser.set_defaults(handler=archive)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    args.handler(args)
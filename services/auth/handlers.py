@@ -6,40 +6,82 @@ from jose import JWTError, jwt
 
 from api.config import ALGORITHM, SECRET_KEY
 from api.setup import users_service
-from services.users.models import UserRead, UsersQuery
+from services.auth.models import Principal, TokenData
+from services.users.models import UserPrincipal
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/login")
 
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
 
-def get_current_user(token: typing.Annotated[str, Depends(oauth2_scheme)]):
+
+def decode_token(token: str) -> TokenData:
     """
-    Returns the user associated with the provided token.
+    Returns the data signed in the provided token.
 
     Args:
         token (str): The token to be validated.
 
     Raises:
         HTTPException: If the credentials could not be validated.
-
-    Returns:
-        User: The user associated with the provided token.
     """
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = users_service.get(query=UsersQuery(username=username))
-    if user is None:
+    if payload.get("sub") is None:
+        raise credentials_exception
+    return TokenData.from_claims(payload)
+
+
+async def get_current_user(token: typing.Annotated[str, Depends(oauth2_scheme)]):
+    """
+    Returns the user associated with the provided token, for endpoints that need the
+    fresh user data. Tokens revoked by a newer token version are rejected.
+
+    Args:
+        token (str): The token to be validated.
+
+    Raises:
+        HTTPException: If the credentials could not be validated.
+
+    Returns:
+        User: The user associated with the provided token.
+    """
+    data = decode_token(token)
+    user = await users_service.aget_principal(username=data.username)
+    if user is None or user.token_version != data.token_version:
         raise credentials_exception
     return user
 
 
-UserDependsType = typing.Annotated[UserRead, Depends(get_current_user)]
+async def get_current_principal(
+    token: typing.Annotated[str, Depends(oauth2_scheme)]
+) -> Principal:
+    """
+    Returns the principal signed in the provided token without reading the users table.
+    Revoked tokens are accepted until they expire, endpoints that must reject them at
+    once depend on `get_current_user`.
+
+    Args:
+        token (str): The token to be validated.
+
+    Raises:
+        HTTPException: If the credentials could not be validated.
+
+    Returns:
+        Principal: The id and username of the authenticated user.
+    """
+    data = decode_token(token)
+    if data.id is None:
+        # Tokens issued before the user id claim was added
+        user = await get_current_user(token)
+        return Principal(id=user.id, username=user.username)
+    return Principal(id=data.id, username=data.username)
+
+
+UserDependsType = typing.Annotated[UserPrincipal, Depends(get_current_user)]
+PrincipalDependsType = typing.Annotated[Principal, Depends(get_current_principal)]
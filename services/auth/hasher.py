@@ -0,0 +1,175 @@
+import asyncio
+import concurrent.futures
+import dataclasses
+import multiprocessing
+import threading
+import time
+import weakref
+
+from passlib.context import CryptContext
+from starlette.concurrency import run_in_threadpool
+
+from api.config import (
+    BCRYPT_ROUNDS,
+    PASSWORD_HASH_MAX_CONCURRENCY,
+    PASSWORD_HASH_WORKERS,
+)
+
+# Hashes with other rounds than BCRYPT_ROUNDS need an update, so changing it rehashes the
+# passwords as their users log in
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+# The jobs return the time they started at, to measure how long they waited for a worker
+def _hash(password: str) -> tuple[str, float]:
+    started = time.time()
+    return pwd_context.hash(password), started
+
+
+def _verify_and_update(password: str, hashed: str) -> tuple[bool, str | None, float]:
+    started = time.time()
+    valid, new_hash = pwd_context.verify_and_update(password, hashed)
+    return valid, new_hash, started
+
+
+@dataclasses.dataclass
+class PasswordHasherMetrics:
+    """
+    Counters of the password jobs of a `PasswordHasher`.
+
+    Attributes:
+        jobs (int): The number of finished jobs.
+        in_flight (int): The number of jobs running or waiting for a worker.
+        rehashes (int): The number of passwords verified with outdated rounds.
+        queue_seconds_total (float): Seconds jobs waited before a worker started them.
+        queue_seconds_max (float): The longest wait of a job.
+    """
+
+    jobs: int = 0
+    in_flight: int = 0
+    rehashes: int = 0
+    queue_seconds_total: float = 0
+    queue_seconds_max: float = 0
+
+    @property
+    def queue_seconds_avg(self) -> float:
+        return self.queue_seconds_total / self.jobs if self.jobs else 0
+
+
+class PasswordHasher:
+    """
+    Runs the bcrypt work of the async endpoints in a pool of processes, so password
+    hashing does not hold the GIL of the API process and starve the other requests.
+
+    At most `max_concurrency` jobs are submitted at once per event loop, the rest wait
+    on the loop without holding a thread, and the time every job waits before a worker
+    starts it is recorded in `metrics`. With no workers, jobs run in the threadpool.
+
+    Args:
+        workers (int): The number of worker processes, 0 runs jobs in the threadpool.
+        max_concurrency (int): The maximum number of jobs submitted at once.
+    """
+
+    def __init__(self, workers: int, max_concurrency: int) -> None:
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.metrics = PasswordHasherMetrics()
+        self._executor: concurrent.futures.ProcessPoolExecutor | None = None
+        self._semaphores: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, asyncio.Semaphore
+        ] = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Forking a process running threads can copy held locks
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(
+                    self.max_concurrency
+                )
+            return semaphore
+
+    async def _run(self, function, *args):
+        submitted = time.time()
+        with self._lock:
+            self.metrics.in_flight += 1
+        try:
+            async with self._get_semaphore():
+                if self.workers:
+                    loop = asyncio.get_running_loop()
+                    result = await loop.run_in_executor(
+                        self._get_executor(), function, *args
+                    )
+                else:
+                    result = await run_in_threadpool(function, *args)
+        finally:
+            with self._lock:
+                self.metrics.in_flight -= 1
+
+        queued = max(result[-1] - submitted, 0)
+        with self._lock:
+            self.metrics.jobs += 1
+            self.metrics.queue_seconds_total += queued
+            self.metrics.queue_seconds_max = max(self.metrics.queue_seconds_max, queued)
+        return result[:-1]
+
+    async def hash(self, password: str) -> str:
+        """
+        Hashes the given password.
+
+        Args:
+            password (str): The password to be hashed.
+        """
+        (hashed,) = await self._run(_hash, password)
+        return hashed
+
+    async def verify_and_update(
+        self, password: str, hashed: str
+    ) -> tuple[bool, str | None]:
+        """
+        Verifies a password against its hash.
+
+        Args:
+            password (str): The plain text password to verify.
+            hashed (str): The hashed password to compare against.
+
+        Returns:
+            tuple[bool, str | None]: Whether the password matches, and its new hash
+                when it matches a hash with outdated rounds.
+        """
+        valid, new_hash = await self._run(_verify_and_update, password, hashed)
+        if new_hash is not None:
+            with self._lock:
+                self.metrics.rehashes += 1
+        return valid, new_hash
+
+    def shutdown(self) -> None:
+        """
+        Stops the worker processes.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+password_hasher = PasswordHasher(
+    workers=PASSWORD_HASH_WORKERS, max_concurrency=PASSWORD_HASH_MAX_CONCURRENCY
+)
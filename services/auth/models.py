@@ -1,3 +1,6 @@
+import typing
+import uuid
+
 from pydantic import BaseModel
 
 
@@ -12,7 +15,51 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     """
-    The data inside token payload.
+    The data inside token payload, signed under the short JWT claim names.
+
+    Attributes:
+        username (str): The username of the user, the `sub` claim.
+        id (uuid.UUID | None): The id of the user, the `uid` claim. Tokens issued before
+            it was added do not have it.
+        token_version (int): The token version of the user when the token was issued,
+            the `ver` claim. Increasing the user's version revokes its tokens.
+    """
+
+    username: str
+    id: typing.Optional[uuid.UUID] = None
+    token_version: int = 0
+
+    @property
+    def claims(self) -> dict:
+        """
+        Returns the JWT claims of the data.
+        """
+        claims = {"sub": self.username, "ver": self.token_version}
+        if self.id is not None:
+            claims["uid"] = str(self.id)
+        return claims
+
+    @classmethod
+    def from_claims(cls, claims: dict) -> "TokenData":
+        """
+        Builds the data from the JWT claims.
+        """
+        return cls(
+            username=claims["sub"],
+            id=claims.get("uid"),
+            token_version=claims.get("ver", 0),
+        )
+
+
+class Principal(BaseModel):
+    """
+    The authenticated user as told by the signed token claims, built without reading the
+    users table.
+
+    Attributes:
+        id (uuid.UUID): The id of the user.
+        username (str): The username of the user.
     """
 
+    id: uuid.UUID
     username: str
@@ -1,11 +1,9 @@
 import datetime
 
 from jose import jwt
-from passlib.context import CryptContext
 
 from api.config import ACCESS_TOKEN_EXPIRE_MINUTES, ALGORITHM, SECRET_KEY
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from services.auth.hasher import password_hasher, pwd_context
 
 
 class AuthService:
@@ -40,6 +38,55 @@ class AuthService:
         """
         return pwd_context.verify(plain_password, hashed_password)
 
+    @staticmethod
+    def verify_and_update_password(
+        plain_password: str, hashed_password: str
+    ) -> tuple[bool, str | None]:
+        """
+        Verify a plain text password against a hashed password, and rehash it when the
+        hash uses other rounds than the configured ones.
+
+        Args:
+            plain_password (str): The plain text password to verify.
+            hashed_password (str): The hashed password to compare against.
+
+        Returns:
+            tuple[bool, str | None]: Whether the password matches, and its new hash
+                when it has to be updated.
+        """
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+
+    @staticmethod
+    async def ahash_password(password: str) -> str:
+        """
+        Async version of `hash_password`, the hashing runs in the password processes.
+
+        Args:
+            password (str): The password to be hashed.
+
+        Returns:
+            str: The hashed password.
+        """
+        return await password_hasher.hash(password)
+
+    @staticmethod
+    async def averify_and_update_password(
+        plain_password: str, hashed_password: str
+    ) -> tuple[bool, str | None]:
+        """
+        Async version of `verify_and_update_password`, the check runs in the password
+        processes.
+
+        Args:
+            plain_password (str): The plain text password to verify.
+            hashed_password (str): The hashed password to compare against.
+
+        Returns:
+            tuple[bool, str | None]: Whether the password matches, and its new hash
+                when it has to be updated.
+        """
+        return await password_hasher.verify_and_update(plain_password, hashed_password)
+
     @staticmethod
     def create_access_token(
         data: dict, expires_delta: datetime.timedelta | None = None
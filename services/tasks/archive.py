@@ -0,0 +1,114 @@
+import gzip
+import os
+import threading
+import time
+import uuid
+
+from services.tasks.models import Task
+
+
+class TasksArchive:
+    """
+    File store of the tasks moved out of the tasks repository.
+
+    Every archived batch is written as a gzip compressed NDJSON segment, and an append
+    only index maps the id of every archived task to its segment, so a single task is
+    read back by decompressing one segment. Segments are written to a temporary file and
+    renamed, and a task is only indexed once its segment is complete.
+
+    The index is loaded lazily and only the lines appended since the last read are
+    parsed, so processes reading the archive see the batches written by `manage.py
+    archive` without reloading it.
+
+    Args:
+        path (str): The directory of the segments and the index.
+        compresslevel (int): The gzip compression level of the segments.
+    """
+
+    index_name = "index.tsv"
+    segment_suffix = ".ndjson.gz"
+
+    def __init__(self, path: str, compresslevel: int = 6) -> None:
+        self.path = path
+        self.compresslevel = compresslevel
+        self._index: dict[str, str] = {}
+        self._index_offset = 0
+        self._lock = threading.Lock()
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.path, self.index_name)
+
+    def _refresh_index(self) -> None:
+        try:
+            size = os.path.getsize(self.index_path)
+        except FileNotFoundError:
+            return
+        if size <= self._index_offset:
+            return
+        with open(self.index_path, "rb") as file:
+            file.seek(self._index_offset)
+            data = file.read(size - self._index_offset)
+        # A line still being appended is read on the next refresh
+        data = data[: data.rfind(b"\n") + 1]
+        for line in data.decode().splitlines():
+            id, segment = line.split("\t")
+            self._index[id] = segment
+        self._index_offset += len(data)
+
+    def write(self, tasks: list[Task]) -> str | None:
+        """
+        Writes the given tasks to a new segment and indexes them.
+
+        Args:
+            tasks (list[Task]): The tasks to archive.
+
+        Returns:
+            str | None: The name of the segment, None if there were no tasks.
+        """
+        if not tasks:
+            return None
+        os.makedirs(self.path, exist_ok=True)
+        segment = f"{time.time_ns()}-{os.getpid()}{self.segment_suffix}"
+        segment_path = os.path.join(self.path, segment)
+        with open(f"{segment_path}.tmp", "wb") as file:
+            with gzip.GzipFile(
+                fileobj=file, mode="wb", compresslevel=self.compresslevel
+            ) as gzip_file:
+                for task in tasks:
+                    gzip_file.write(task.model_dump_json().encode() + b"\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(f"{segment_path}.tmp", segment_path)
+
+        with open(self.index_path, "ab") as file:
+            file.write(b"".join(f"{task.id}\t{segment}\n".encode() for task in tasks))
+            file.flush()
+            os.fsync(file.fileno())
+        return segment
+
+    def get(self, id: uuid.UUID) -> Task | None:
+        """
+        Reads an archived task.
+
+        Args:
+            id (uuid.UUID): The id of the task.
+
+        Returns:
+            Task | None: The archived task, None if it was not archived.
+        """
+        id = str(id)
+        with self._lock:
+            self._refresh_index()
+            segment = self._index.get(id)
+        if segment is None:
+            return None
+
+        with gzip.open(os.path.join(self.path, segment), "rb") as file:
+            for line in file:
+                # Only the line holding the id is parsed
+                if id.encode() in line:
+                    task = Task.model_validate_json(line)
+                    if str(task.id) == id:
+                        return task
+        return None
@@ -0,0 +1,218 @@
+import collections
+import dataclasses
+import json
+import threading
+import time
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+from api.db.rows import RowHydrator, dump_row
+from services.tasks.models import Task, TasksQuery
+
+
+@dataclasses.dataclass
+class TasksQueryCacheMetrics:
+    """
+    Counters of the lookups of a `TasksQueryCache`.
+
+    Attributes:
+        hits (int): The number of lookups answered by the cache.
+        redis_hits (int): The hits answered by the redis tier.
+        misses (int): The number of lookups that had to query the repository.
+    """
+
+    hits: int = 0
+    redis_hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+
+class TasksQueryCache:
+    """
+    Bounded cache of the tasks lists of the users, keyed by user, collection version,
+    status and page, so dashboards polling the same list do not query the repository on
+    every call.
+
+    The version of the user tasks is part of the key, so the writes bumping it make the
+    older entries unreachable in every process at once, and they are evicted as newer
+    ones fill the cache or their ttl ends. The local tier is an LRU of `maxsize` lists
+    holding at most `max_rows` tasks in total, kept for `ttl` seconds, the optional redis
+    tier is shared by every worker and kept for `redis_ttl` seconds. Lists longer than
+    `max_rows`, like unpaged lists of large collections, are not cached. The cached
+    lists are shared, do not change them.
+
+    Args:
+        maxsize (int): The maximum number of lists in the local tier.
+        max_rows (int): The maximum number of tasks in the local tier.
+        ttl (float): Seconds a list is kept in the local tier.
+        redis (Redis | None): The redis client of the shared tier.
+        async_redis (AsyncRedis | None): The asyncio redis client of the shared tier.
+        redis_ttl (int): Seconds a list is kept in the shared tier.
+    """
+
+    prefix = "tasks_query"
+    hydrate = RowHydrator(Task)
+
+    def __init__(
+        self,
+        maxsize: int = 1_000,
+        max_rows: int = 100_000,
+        ttl: float = 60,
+        redis: Redis | None = None,
+        async_redis: AsyncRedis | None = None,
+        redis_ttl: int = 60,
+    ) -> None:
+        self.maxsize = maxsize
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.redis = redis
+        self.async_redis = async_redis
+        self.redis_ttl = redis_ttl
+        self.metrics = TasksQueryCacheMetrics()
+        self._tasks: collections.OrderedDict[
+            str, tuple[list[Task], float]
+        ] = collections.OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+
+    def _key(
+        self, query: TasksQuery, version: int, offset: int, limit: int | None
+    ) -> str:
+        status = query.status.value if query.status else ""
+        return f"{self.prefix}:{query.user}:{version}:{status}:{offset}:{limit or ''}"
+
+    def _get_local(self, key: str) -> list[Task] | None:
+        with self._lock:
+            entry = self._tasks.get(key)
+            if entry is None:
+                return None
+            tasks, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._tasks[key]
+                self._rows -= len(tasks)
+                return None
+            self._tasks.move_to_end(key)
+            self.metrics.hits += 1
+            return tasks
+
+    def _set_local(self, key: str, tasks: list[Task]) -> None:
+        with self._lock:
+            previous = self._tasks.pop(key, None)
+            if previous is not None:
+                self._rows -= len(previous[0])
+            self._tasks[key] = (tasks, time.monotonic() + self.ttl)
+            self._rows += len(tasks)
+            while len(self._tasks) > self.maxsize or self._rows > self.max_rows:
+                _, (evicted, _) = self._tasks.popitem(last=False)
+                self._rows -= len(evicted)
+
+    def _decode(self, key: str, data: bytes | None) -> list[Task] | None:
+        if data is None:
+            with self._lock:
+                self.metrics.misses += 1
+            return None
+        tasks = [self.hydrate(row) for row in json.loads(data)]
+        self._set_local(key, tasks)
+        with self._lock:
+            self.metrics.hits += 1
+            self.metrics.redis_hits += 1
+        return tasks
+
+    @staticmethod
+    def _encode(tasks: list[Task]) -> str:
+        return json.dumps([dump_row(task) for task in tasks])
+
+    def get(
+        self, query: TasksQuery, version: int, offset: int = 0, limit: int | None = None
+    ) -> list[Task] | None:
+        """
+        Returns the cached tasks of the given query and version of the user tasks, None
+        on a miss.
+
+        Args:
+            query (TasksQuery): The query by user, and optionally status, of the tasks.
+            version (int): The collection version of the user tasks.
+            offset (int): The number of matching tasks skipped.
+            limit (int | None): The maximum number of tasks returned.
+        """
+        key = self._key(query, version, offset, limit)
+        tasks = self._get_local(key)
+        if tasks is not None:
+            return tasks
+        data = self.redis.get(key) if self.redis is not None else None
+        return self._decode(key, data)
+
+    def set(
+        self,
+        query: TasksQuery,
+        version: int,
+        tasks: list[Task],
+        offset: int = 0,
+        limit: int | None = None,
+    ) -> None:
+        """
+        Caches the tasks of the given query and version of the user tasks, unless they
+        are more than `max_rows`.
+
+        Args:
+            query (TasksQuery): The query by user, and optionally status, of the tasks.
+            version (int): The collection version the tasks were read at, or before.
+            tasks (list[Task]): The tasks to cache.
+            offset (int): The number of matching tasks skipped.
+            limit (int | None): The maximum number of tasks returned.
+        """
+        if len(tasks) > self.max_rows:
+            return
+        key = self._key(query, version, offset, limit)
+        self._set_local(key, tasks)
+        if self.redis is not None:
+            self.redis.set(key, self._encode(tasks), ex=self.redis_ttl)
+
+    async def aget(
+        self, query: TasksQuery, version: int, offset: int = 0, limit: int | None = None
+    ) -> list[Task] | None:
+        """
+        Async version of `get`.
+
+        Args:
+            query (TasksQuery): The query by user, and optionally status, of the tasks.
+            version (int): The collection version of the user tasks.
+            offset (int): The number of matching tasks skipped.
+            limit (int | None): The maximum number of tasks returned.
+        """
+        key = self._key(query, version, offset, limit)
+        tasks = self._get_local(key)
+        if tasks is not None:
+            return tasks
+        data = await self.async_redis.get(key) if self.async_redis is not None else None
+        return self._decode(key, data)
+
+    async def aset(
+        self,
+        query: TasksQuery,
+        version: int,
+        tasks: list[Task],
+        offset: int = 0,
+        limit: int | None = None,
+    ) -> None:
+        """
+        Async version of `set`.
+
+        Args:
+            query (TasksQuery): The query by user, and optionally status, of the tasks.
+            version (int): The collection version the tasks were read at, or before.
+            tasks (list[Task]): The tasks to cache.
+            offset (int): The number of matching tasks skipped.
+            limit (int | None): The maximum number of tasks returned.
+        """
+        if len(tasks) > self.max_rows:
+            return
+        key = self._key(query, version, offset, limit)
+        self._set_local(key, tasks)
+        if self.async_redis is not None:
+            await self.async_redis.set(key, self._encode(tasks), ex=self.redis_ttl)
@@ -0,0 +1,119 @@
+import csv
+import enum
+import io
+import json
+import typing
+import zlib
+
+import pydantic_core
+
+from api.db.rows import dump_row
+from services.tasks.models import Task
+
+CSV_COLUMNS = list(Task.model_fields)
+
+
+class ExportFormat(str, enum.Enum):
+    """
+    Enum for the formats of a tasks export.
+    """
+
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+    @property
+    def media_type(self) -> str:
+        return {"ndjson": "application/x-ndjson", "csv": "text/csv"}[self.value]
+
+
+async def _batches(
+    tasks: typing.AsyncIterator[Task], size: int
+) -> typing.AsyncIterator[list[Task]]:
+    batch = []
+    async for task in tasks:
+        batch.append(task)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def ndjson_chunks(
+    tasks: typing.AsyncIterator[Task], batch_size: int = 100
+) -> typing.AsyncIterator[bytes]:
+    """
+    Encodes the tasks as JSON lines, one chunk per batch of tasks.
+
+    Args:
+        tasks (AsyncIterator[Task]): The tasks to encode.
+        batch_size (int): The number of tasks of every chunk.
+    """
+    async for batch in _batches(tasks, batch_size):
+        yield b"".join(pydantic_core.to_json(task) + b"\n" for task in batch)
+
+
+def _csv_value(value: typing.Any) -> typing.Any:
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+async def csv_chunks(
+    tasks: typing.AsyncIterator[Task], batch_size: int = 100
+) -> typing.AsyncIterator[bytes]:
+    """
+    Encodes the tasks as CSV rows under a header of the task fields, one chunk per batch
+    of tasks. Missing values are empty and `trello_data` is written as JSON.
+
+    Args:
+        tasks (AsyncIterator[Task]): The tasks to encode.
+        batch_size (int): The number of tasks of every chunk.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    yield buffer.getvalue().encode()
+    async for batch in _batches(tasks, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        for task in batch:
+            row = dump_row(task)
+            writer.writerow([_csv_value(row[column]) for column in CSV_COLUMNS])
+        yield buffer.getvalue().encode()
+
+
+async def gzip_chunks(
+    chunks: typing.AsyncIterator[bytes], compresslevel: int = 6
+) -> typing.AsyncIterator[bytes]:
+    """
+    Compresses a stream of chunks as a single gzip member, flushing every chunk so the
+    client receives the data as it is produced.
+
+    Args:
+        chunks (AsyncIterator[bytes]): The chunks to compress.
+        compresslevel (int): The gzip compression level.
+    """
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def export_chunks(
+    tasks: typing.AsyncIterator[Task], format: ExportFormat, gzip: bool = False
+) -> typing.AsyncIterator[bytes]:
+    """
+    Returns the stream of chunks exporting the given tasks. The tasks are consumed as the
+    chunks are, so only one batch of tasks is held at once.
+
+    Args:
+        tasks (AsyncIterator[Task]): The tasks to export.
+        format (ExportFormat): The format of the export.
+        gzip (bool): Whether to compress the export with gzip.
+    """
+    encode = ndjson_chunks if format == ExportFormat.NDJSON else csv_chunks
+    chunks = encode(tasks)
+    return gzip_chunks(chunks) if gzip else chunks
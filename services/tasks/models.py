@@ -1,6 +1,5 @@
 import datetime
 import enum
-import json
 import typing
 import uuid
 
@@ -8,6 +7,8 @@ from fastapi import status
 from fastapi.exceptions import HTTPException
 from pydantic import BaseModel, Field, model_validator
 
+from api.db.rows import dump_row
+
 
 class TaskStatus(str, enum.Enum):
     """
@@ -93,6 +94,8 @@ class Task(TaskCreate):
         status (TaskStatus): The status of the task.
         trello_data (dict): The trello data of the task.
         fail_count (int): The fail count of the task.
+        revision (int): The number of updates of the task, its version for caches.
+        updated_at (datetime.datetime): The date of the last update of the task.
         title (str): The title of the task.
         description (str): The description of the task.
         category (TaskCategory): The category of the task.
@@ -105,6 +108,15 @@ class Task(TaskCreate):
     status: TaskStatus = Field(default=TaskStatus.PENDING)
     trello_data: typing.Optional[dict] = None
     fail_count: int = 0
+    revision: int = 0
+    updated_at: typing.Optional[datetime.datetime] = None
+
+    @property
+    def last_modified(self) -> datetime.datetime:
+        """
+        Returns the date the task last changed.
+        """
+        return self.updated_at or self.received_at
 
 
 class TaskUpdate(BaseModel):
@@ -135,9 +147,7 @@ class TaskUpdate(BaseModel):
         """
         Returns the update as a JSON object.
         """
-        return {
-            k: v for k, v in json.loads(self.model_dump_json()).items() if v is not None
-        }
+        return dump_row(self, exclude_none=True)
 
 
 class TasksQuery(BaseModel):
@@ -154,11 +164,70 @@ class TasksQuery(BaseModel):
     user: typing.Optional[uuid.UUID] = None
     status: typing.Optional[TaskStatus] = None
 
+    @property
+    def query_dict(self):
+        """
+        Returns the query as a dict.
+        """
+        return {k: v for k, v in self.model_dump().items() if v is not None}
+
     @property
     def query_json(self):
         """
         Returns the query as a JSON object.
         """
-        return {
-            k: v for k, v in json.loads(self.model_dump_json()).items() if v is not None
+        return dump_row(self, exclude_none=True)
+
+
+class TaskStats(BaseModel):
+    """
+    Model for the task counters of a user. Counters are stored flat, keyed as
+    `total` or `<field>:<value>` (e.g. `status:PENDING`), so they can be incremented in place.
+
+    Attributes:
+        total (int): The number of tasks.
+        status (dict[TaskStatus, int]): The number of tasks by status.
+        type (dict[TaskType, int]): The number of tasks by type.
+        category (dict[TaskCategory, int]): The number of tasks by category.
+    """
+
+    total: int = 0
+    status: dict[TaskStatus, int] = Field(default_factory=dict)
+    type: dict[TaskType, int] = Field(default_factory=dict)
+    category: dict[TaskCategory, int] = Field(default_factory=dict)
+
+    @staticmethod
+    def create_delta(task: Task) -> dict[str, int]:
+        """
+        Returns the counters to add when the given task is created.
+        """
+        delta = {
+            "total": 1,
+            f"status:{task.status.value}": 1,
+            f"type:{task.type.value}": 1,
         }
+        if task.category:
+            delta[f"category:{task.category.value}"] = 1
+        return delta
+
+    @staticmethod
+    def status_delta(old: TaskStatus, new: TaskStatus) -> dict[str, int]:
+        """
+        Returns the counters to add when a task moves from the old status to the new one.
+        """
+        old, new = TaskStatus(old), TaskStatus(new)
+        if old == new:
+            return {}
+        return {f"status:{old.value}": -1, f"status:{new.value}": 1}
+
+    @classmethod
+    def from_counters(cls, counters: dict) -> "TaskStats":
+        """
+        Builds the stats from a flat counters record.
+        """
+        data = dict(total=counters.get("total", 0), status={}, type={}, category={})
+        for key, amount in counters.items():
+            field, _, value = key.partition(":")
+            if value and amount and field in data:
+                data[field][value] = amount
+        return cls(**data)
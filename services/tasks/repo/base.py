@@ -1,6 +1,9 @@
 import abc
+import datetime
+import typing
+import uuid
 
-from services.tasks.models import Task, TasksQuery, TaskUpdate
+from services.tasks.models import Task, TasksQuery, TaskStats, TaskUpdate
 
 
 class TasksRepo(abc.ABC):
@@ -19,19 +22,62 @@ class TasksRepo(abc.ABC):
         """
         pass
 
+    def create_many(self, tasks: list[Task]) -> list[Task]:
+        """
+        Creates the given tasks in the database. Repositories that support bulk inserts
+        override it to create them at once.
+
+        Args:
+            tasks (list[Task]): The tasks to create.
+
+        Returns:
+            list[Task]: The created tasks.
+        """
+        return [self.create(task=task) for task in tasks]
+
     @abc.abstractmethod
-    def query(self, query: TasksQuery) -> list[Task]:
+    def query(
+        self,
+        query: TasksQuery,
+        offset: int = 0,
+        limit: int | None = None,
+        version: int | None = None,
+    ) -> list[Task]:
         """
         Queries the database for tasks that match the given query.
 
         Args:
             query (TasksQuery): The query to match tasks against.
+            offset (int): The number of matching tasks to skip.
+            limit (int | None): The maximum number of tasks to return.
+            version (int | None): A collection version of the user of the query the
+                tasks must not be older than. Backends whose list reads may lag behind
+                check the version they read, the others always see every write and
+                ignore it.
 
         Returns:
             list[Task]: A list of tasks that match the given query.
         """
         pass
 
+    @abc.abstractmethod
+    def iter_query(
+        self, query: TasksQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.Iterator[Task]:
+        """
+        Lazily yields the tasks that match the given query, so callers can stop early
+        without every match being loaded.
+
+        Args:
+            query (TasksQuery): The query to match tasks against.
+            offset (int): The number of matching tasks to skip.
+            limit (int | None): The maximum number of tasks to yield.
+
+        Yields:
+            Task: The tasks that match the given query.
+        """
+        pass
+
     @abc.abstractmethod
     def get(self, query: TasksQuery) -> Task:
         """
@@ -46,15 +92,204 @@ class TasksRepo(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def update(self, query: TasksQuery, data: TaskUpdate) -> list[Task]:
+    def update(
+        self, query: TasksQuery, data: TaskUpdate, returning: bool = True
+    ) -> list[Task]:
         """
         Updates a task in the database based on the provided query.
 
         Args:
             query (TasksQuery): The query used to retrieve the task.
             update (TaskUpdate): The update to apply to the task.
+            returning (bool): Whether to return the updated tasks. Callers that ignore
+                the result can skip building them.
+
+        Every updated task gets its `revision` increased and `updated_at` set, and the
+        collection version of its user is increased.
+
+        Returns:
+            list[Task]: A list of tasks that were updated, empty if not returning.
+        """
+        pass
+
+    @abc.abstractmethod
+    def query_received_before(
+        self, query: TasksQuery, before: datetime.datetime, limit: int | None = None
+    ) -> list[Task]:
+        """
+        Queries the database for tasks that match the given query and were received
+        before the given date.
+
+        Args:
+            query (TasksQuery): The query to match tasks against.
+            before (datetime.datetime): The date the tasks were received before.
+            limit (int | None): The maximum number of tasks to return.
+
+        Returns:
+            list[Task]: A list of tasks that match the given query.
+        """
+        pass
+
+    @abc.abstractmethod
+    def delete_many(self, ids: list[uuid.UUID]) -> None:
+        """
+        Deletes the tasks with the given ids, skipping the ones that do not exist. The
+        task counters are kept, deleted tasks are moved to the archive and still count,
+        but the collection version of their users is increased.
+
+        Args:
+            ids (list[uuid.UUID]): The ids of the tasks to delete.
+        """
+        pass
+
+    @abc.abstractmethod
+    def stats(self, user: uuid.UUID) -> TaskStats:
+        """
+        Retrieves the task counters of a user. Counters are maintained on every create and
+        status change, so this does not scan the tasks table.
+
+        Args:
+            user (uuid.UUID): The id of the user.
+
+        Returns:
+            TaskStats: The task counters of the user.
+        """
+        pass
+
+    @abc.abstractmethod
+    def collection_version(self, user: uuid.UUID) -> int:
+        """
+        Retrieves the version of the tasks of a user. It is increased whenever a task of
+        the user is created, updated or deleted, so an unchanged version means the tasks
+        of the user did not change.
+
+        Args:
+            user (uuid.UUID): The id of the user.
+
+        Returns:
+            int: The version of the tasks of the user, 0 if the user has no tasks.
+        """
+        pass
+
+    @abc.abstractmethod
+    def rebuild_stats(self) -> None:
+        """
+        Recomputes every user's task counters from the tasks table.
+        """
+        pass
+
+
+class AsyncTasksRepo(abc.ABC):
+    """Abstract base class for asyncio task repository, the async variant of TasksRepo."""
+
+    @abc.abstractmethod
+    async def create(self, task: Task) -> Task:
+        """
+        Creates a new task in the database.
+
+        Args:
+            task (Task): The task to create.
+
+        Returns:
+            Task: The created task.
+        """
+        pass
+
+    @abc.abstractmethod
+    async def query(
+        self,
+        query: TasksQuery,
+        offset: int = 0,
+        limit: int | None = None,
+        version: int | None = None,
+    ) -> list[Task]:
+        """
+        Queries the database for tasks that match the given query.
+
+        Args:
+            query (TasksQuery): The query to match tasks against.
+            offset (int): The number of matching tasks to skip.
+            limit (int | None): The maximum number of tasks to return.
+            version (int | None): A collection version of the user of the query the
+                tasks must not be older than. Backends whose list reads may lag behind
+                check the version they read, the others always see every write and
+                ignore it.
+
+        Returns:
+            list[Task]: A list of tasks that match the given query.
+        """
+        pass
+
+    @abc.abstractmethod
+    def iter_query(
+        self, query: TasksQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.AsyncIterator[Task]:
+        """
+        Lazily yields the tasks that match the given query, so callers can stop early
+        without every match being loaded.
+
+        Args:
+            query (TasksQuery): The query to match tasks against.
+            offset (int): The number of matching tasks to skip.
+            limit (int | None): The maximum number of tasks to yield.
+
+        Yields:
+            Task: The tasks that match the given query.
+        """
+        pass
+
+    @abc.abstractmethod
+    async def get(self, query: TasksQuery) -> Task:
+        """
+        Retrieves a task from the database based on the provided query.
+
+        Args:
+            query (TasksQuery): The query used to retrieve the task.
+
+        Returns:
+            Task: The task retrieved from the database.
+        """
+        pass
+
+    @abc.abstractmethod
+    async def update(
+        self, query: TasksQuery, data: TaskUpdate, returning: bool = True
+    ) -> list[Task]:
+        """
+        Updates a task in the database based on the provided query.
+
+        Args:
+            query (TasksQuery): The query used to retrieve the task.
+            update (TaskUpdate): The update to apply to the task.
+            returning (bool): Whether to return the updated tasks.
+
+        Returns:
+            list[Task]: A list of tasks that were updated, empty if not returning.
+        """
+        pass
+
+    @abc.abstractmethod
+    async def stats(self, user: uuid.UUID) -> TaskStats:
+        """
+        Retrieves the task counters of a user.
+
+        Args:
+            user (uuid.UUID): The id of the user.
+
+        Returns:
+            TaskStats: The task counters of the user.
+        """
+        pass
+
+    @abc.abstractmethod
+    async def collection_version(self, user: uuid.UUID) -> int:
+        """
+        Retrieves the version of the tasks of a user.
+
+        Args:
+            user (uuid.UUID): The id of the user.
 
         Returns:
-            list[Task]: A list of tasks that were updated.
+            int: The version of the tasks of the user, 0 if the user has no tasks.
         """
         pass
@@ -1,44 +1,177 @@
-from api.db.memory import InMemoryDB
-from services.tasks.models import Task, TasksQuery, TaskUpdate
-from services.tasks.repo.base import TasksRepo
+import datetime
+import itertools
+import typing
+import uuid
+
+from api.db.memory import CompactRowCodec, InMemoryDB
+from api.db.rows import RowHydrator
+from services.tasks.models import Task, TasksQuery, TaskStats, TaskUpdate
+from services.tasks.repo.base import AsyncTasksRepo, TasksRepo
 
 
 class TasksMemoryRepo(TasksRepo):
     table = "tasks"
+    stats_table = "tasks_stats"
+    versions_table = "tasks_versions"
+    hydrate = RowHydrator(Task, shared=True)
+    indexes = ["user", "status"]
 
     def __init__(self, db: InMemoryDB) -> None:
         self.db = db
+        # Codecs count the rows holding their interned values, every database has its own
+        if self.table not in self.db.codecs:
+            codec = CompactRowCodec.from_model(Task, interned=["user"])
+            self.db.set_codec(table=self.table, codec=codec)
+        for field in self.indexes:
+            self.db.create_index(table=self.table, field=field)
+
+    def _bump_versions(self, users: typing.Iterable[uuid.UUID]) -> None:
+        for user in users:
+            self.db.increment(
+                table=self.versions_table, id=user, counters={"version": 1}
+            )
 
     def create(self, task: Task) -> Task:
-        return Task(**self.db.create(table=self.table, data=task.model_dump()))
+        task = self.hydrate(self.db.create(table=self.table, data=task.model_dump()))
+        self.db.increment(
+            table=self.stats_table, id=task.user, counters=TaskStats.create_delta(task)
+        )
+        self._bump_versions([task.user])
+        return task
 
-    def _filter_entry(self, entry: dict, query: TasksQuery) -> bool:
-        if query.id and not query.id == entry.get("id"):
-            print(query)
-            return False
+    def iter_query(
+        self, query: TasksQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.Iterator[Task]:
+        for entry in self.db.iterate(
+            table=self.table, offset=offset, limit=limit, **query.query_dict
+        ):
+            yield self.hydrate(entry)
 
-        if query.user and not query.user == entry.get("user"):
-            return False
+    def query(
+        self,
+        query: TasksQuery,
+        offset: int = 0,
+        limit: int | None = None,
+        version: int | None = None,
+    ) -> list[Task]:
+        return list(self.iter_query(query=query, offset=offset, limit=limit))
 
-        if query.status and not query.status == entry.get("status"):
-            return False
+    def get(self, query: Task) -> Task:
+        return next(self.iter_query(query=query, limit=1), None)
 
-        return True
+    def update(
+        self, query: TasksQuery, data: TaskUpdate, returning: bool = True
+    ) -> list[Task]:
+        update = data.update_dict
+        if not update:
+            return self.query(query=query) if returning else []
 
-    def query(self, query: TasksQuery) -> list[Task]:
-        return [
-            Task(**entry)
-            for entry in self.db.list(table=self.table)
-            if self._filter_entry(entry=entry, query=query)
-        ]
+        updated = []
+        users = set()
+        updated_at = datetime.datetime.now()
+        # The old status and revision must not change before the update is applied
+        with self.db.lock(self.table):
+            for task in self.query(query=query):
+                entry = self.db.update(
+                    table=self.table,
+                    data={
+                        **update,
+                        "revision": task.revision + 1,
+                        "updated_at": updated_at,
+                    },
+                    id=task.id,
+                )
+                users.add(task.user)
+                if data.status:
+                    self.db.increment(
+                        table=self.stats_table,
+                        id=task.user,
+                        counters=TaskStats.status_delta(task.status, data.status),
+                    )
+                if returning:
+                    updated.append(self.hydrate(entry))
+            self._bump_versions(users)
+        return updated
 
-    def get(self, query: Task) -> Task:
-        result = self.query(query=query)
-        if not result:
-            return None
-        return result[0]
-
-    def update(self, query: TasksQuery, data: TaskUpdate) -> list[Task]:
-        for task in self.query(query=query):
-            self.db.update(table=self.table, data=data.update_dict, id=task.id)
-        return self.query(query=query)
+    def query_received_before(
+        self, query: TasksQuery, before: datetime.datetime, limit: int | None = None
+    ) -> list[Task]:
+        tasks = (
+            task for task in self.iter_query(query=query) if task.received_at < before
+        )
+        return list(itertools.islice(tasks, limit))
+
+    def delete_many(self, ids: list[uuid.UUID]) -> None:
+        users = set()
+        with self.db.lock(self.table):
+            for id in ids:
+                try:
+                    users.add(self.db.get(table=self.table, id=id)["user"])
+                    self.db.remove(table=self.table, id=id)
+                except KeyError:
+                    pass
+            self._bump_versions(users)
+
+    def stats(self, user: uuid.UUID) -> TaskStats:
+        try:
+            counters = self.db.get(table=self.stats_table, id=user)
+        except KeyError:
+            counters = {}
+        return TaskStats.from_counters(counters)
+
+    def collection_version(self, user: uuid.UUID) -> int:
+        try:
+            return self.db.get(table=self.versions_table, id=user)["version"]
+        except KeyError:
+            return 0
+
+    def rebuild_stats(self) -> None:
+        self.db.cleanup(table=self.stats_table)
+        for entry in self.db.list(table=self.table):
+            self.db.increment(
+                table=self.stats_table,
+                id=entry["user"],
+                counters=TaskStats.create_delta(self.hydrate(entry)),
+            )
+
+
+class AsyncTasksMemoryRepo(AsyncTasksRepo):
+    """
+    Asyncio interface of TasksMemoryRepo. In-memory operations never wait on I/O, so they
+    run directly on the event loop.
+    """
+
+    def __init__(self, db: InMemoryDB) -> None:
+        self.repo = TasksMemoryRepo(db=db)
+
+    async def create(self, task: Task) -> Task:
+        return self.repo.create(task=task)
+
+    async def query(
+        self,
+        query: TasksQuery,
+        offset: int = 0,
+        limit: int | None = None,
+        version: int | None = None,
+    ) -> list[Task]:
+        return self.repo.query(query=query, offset=offset, limit=limit, version=version)
+
+    async def iter_query(
+        self, query: TasksQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.AsyncIterator[Task]:
+        for task in self.repo.iter_query(query=query, offset=offset, limit=limit):
+            yield task
+
+    async def get(self, query: TasksQuery) -> Task:
+        return self.repo.get(query=query)
+
+    async def update(
+        self, query: TasksQuery, data: TaskUpdate, returning: bool = True
+    ) -> list[Task]:
+        return self.repo.update(query=query, data=data, returning=returning)
+
+    async def stats(self, user: uuid.UUID) -> TaskStats:
+        return self.repo.stats(user=user)
+
+    async def collection_version(self, user: uuid.UUID) -> int:
+        return self.repo.collection_version(user=user)
@@ -0,0 +1,465 @@
+import datetime
+import json
+import typing
+import uuid
+
+from redis import Redis, WatchError
+from redis.asyncio import Redis as AsyncRedis
+
+from api.db.rows import RowHydrator, dump_row
+from services.tasks.models import Task, TasksQuery, TaskStats, TaskUpdate
+from services.tasks.repo.base import AsyncTasksRepo, TasksRepo
+
+
+class RedisTasksQueries:
+    """
+    Builds the redis commands of the tasks repositories, shared by the sync and asyncio
+    repositories like the RethinkDB queries.
+
+    Every task is a hash of JSON encoded fields. Tasks are indexed by sorted sets scored
+    by `received_at`, one for all the tasks and one per user, status and user and status,
+    so every query reads a single index range and fetches the hashes in one pipeline.
+    The stats of a user are a hash of counters updated with HINCRBY, and the collection
+    versions of the users are the fields of a single hash increased on every write.
+    """
+
+    table = "tasks"
+    stats_table = "tasks_stats"
+    versions_key = "tasks_versions"
+    hydrate = RowHydrator(Task)
+
+    # Tasks hashes fetched per round trip while iterating
+    batch_size = 100
+
+    def _key(self, id: uuid.UUID | str) -> str:
+        return f"{self.table}:{id}"
+
+    def _stats_key(self, user: uuid.UUID | str) -> str:
+        return f"{self.stats_table}:{user}"
+
+    def _index_key(self, user: str | None = None, status: str | None = None) -> str:
+        if user and status:
+            return f"{self.table}:index:user_status:{user}:{status}"
+        if user:
+            return f"{self.table}:index:user:{user}"
+        if status:
+            return f"{self.table}:index:status:{status}"
+        return f"{self.table}:index:all"
+
+    def _index_keys(self, row: dict) -> list[str]:
+        """
+        Returns every index key holding the given JSON row.
+        """
+        user, status = row["user"], row["status"]
+        return [
+            self._index_key(),
+            self._index_key(user=user),
+            self._index_key(status=status),
+            self._index_key(user=user, status=status),
+        ]
+
+    @staticmethod
+    def _score(row: dict) -> float:
+        return datetime.datetime.fromisoformat(row["received_at"]).timestamp()
+
+    @staticmethod
+    def _encode(row: dict) -> dict[str, str]:
+        return {field: json.dumps(value) for field, value in row.items()}
+
+    @staticmethod
+    def _decode(entry: dict[bytes, bytes]) -> dict:
+        return {field.decode(): json.loads(value) for field, value in entry.items()}
+
+    def _matches(self, row: dict, query: dict) -> bool:
+        return all(row.get(field) == value for field, value in query.items())
+
+    def _range(
+        self, query: dict, offset: int, limit: int | None
+    ) -> tuple[str, int, int | None]:
+        """
+        Returns the index key and the inclusive ZRANGE bounds of the tasks matching the
+        query, the stop is None when there is no limit.
+        """
+        stop = None if limit is None else offset + limit - 1
+        return self._index_key(query.get("user"), query.get("status")), offset, stop
+
+    def _queue_create(self, pipe, row: dict) -> None:
+        score = self._score(row)
+        pipe.hset(self._key(row["id"]), mapping=self._encode(row))
+        for key in self._index_keys(row):
+            pipe.zadd(key, {row["id"]: score})
+        for counter, amount in TaskStats.create_delta(self.hydrate(row)).items():
+            pipe.hincrby(self._stats_key(row["user"]), counter, amount)
+        pipe.hincrby(self.versions_key, row["user"], 1)
+
+    def _queue_update(self, pipe, old: dict, data: dict) -> dict:
+        """
+        Queues the update of a task and the moves of its indexes and counters. The
+        revision of the task and the collection version of its user are increased.
+
+        Returns:
+            dict: The updated JSON row.
+        """
+        if not data:
+            return old
+        data = {
+            **data,
+            "revision": (old.get("revision") or 0) + 1,
+            "updated_at": datetime.datetime.now().isoformat(),
+        }
+        new = {**old, **data}
+        pipe.hset(self._key(old["id"]), mapping=self._encode(data))
+        pipe.hincrby(self.versions_key, old["user"], 1)
+        if new["status"] != old["status"]:
+            score = self._score(old)
+            old_keys, new_keys = self._index_keys(old), self._index_keys(new)
+            for key in set(old_keys) - set(new_keys):
+                pipe.zrem(key, old["id"])
+            for key in set(new_keys) - set(old_keys):
+                pipe.zadd(key, {old["id"]: score})
+            counters = TaskStats.status_delta(old["status"], new["status"])
+            for counter, amount in counters.items():
+                pipe.hincrby(self._stats_key(old["user"]), counter, amount)
+        return new
+
+
+class RedisTasksRepo(RedisTasksQueries, TasksRepo):
+    """
+    Redis tasks repository.
+    """
+
+    def __init__(self, db: Redis):
+        """
+        Args:
+            db (Redis): The redis client.
+        """
+        self.db = db
+
+    def _fetch(self, ids: list[bytes | str]) -> list[dict]:
+        pipe = self.db.pipeline(transaction=False)
+        for id in ids:
+            pipe.hgetall(self._key(id.decode() if isinstance(id, bytes) else id))
+        return [self._decode(entry) for entry in pipe.execute() if entry]
+
+    def create(self, task: Task) -> Task:
+        """
+        Creates a new task with its indexes and counters in a single transaction.
+
+        Args:
+            task (Task): The data for the task to be created.
+        """
+        pipe = self.db.pipeline()
+        self._queue_create(pipe, dump_row(task))
+        pipe.execute()
+        return task
+
+    def iter_query(
+        self, query: TasksQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.Iterator[Task]:
+        """
+        Lazily yields the tasks that match the given query, fetching the hashes in
+        batches of `batch_size`.
+
+        Args:
+            query (TasksQuery): The query to match.
+            offset (int): The number of matching tasks to skip.
+            limit (int | None): The maximum number of tasks to yield.
+        """
+        query = query.query_json
+        if "id" in query:
+            rows = self._fetch([query["id"]])
+            matches = [row for row in rows if self._matches(row, query)]
+            stop = None if limit is None else offset + limit
+            yield from (self.hydrate(row) for row in matches[offset:stop])
+            return
+
+        key, start, stop = self._range(query, offset=offset, limit=limit)
+        while stop is None or start <= stop:
+            end = start + self.batch_size - 1
+            if stop is not None:
+                end = min(end, stop)
+            ids = self.db.zrange(key, start, end)
+            for row in self._fetch(ids):
+                yield self.hydrate(row)
+            if len(ids) < end - start + 1:
+                return
+            start = end + 1
+
+    def query(
+        self,
+        query: TasksQuery,
+        offset: int = 0,
+        limit: int | None = None,
+        version: int | None = None,
+    ) -> list[Task]:
+        """
+        Queries the repository for tasks that match the given query.
+
+        Args:
+            query (TasksQuery): The query to match.
+            offset (int): The number of matching tasks to skip.
+            limit (int | None): The maximum number of tasks to return.
+            version (int | None): Ignored, redis reads always see every write.
+        """
+        return list(self.iter_query(query=query, offset=offset, limit=limit))
+
+    def get(self, query: TasksQuery) -> Task:
+        """
+        Gets the first task that matches the given query.
+
+        Args:
+            query (TasksQuery): The query to match.
+        """
+        return next(self.iter_query(query=query, limit=1), None)
+
+    def update(
+        self, query: TasksQuery, data: TaskUpdate, returning: bool = True
+    ) -> list[Task]:
+        """
+        Updates the tasks that match the given query with the given update. The matching
+        tasks are watched, so a status changed by a concurrent update retries the
+        transaction instead of corrupting the indexes and counters.
+
+        Args:
+            query (TasksQuery): The query to match.
+            data (TaskUpdate): The update to apply.
+            returning (bool): Whether to return the updated tasks.
+        """
+        ids = [task.id for task in self.iter_query(query=query)]
+        if not ids:
+            return []
+        with self.db.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(*[self._key(id) for id in ids])
+                    rows = self._fetch(ids)
+                    pipe.multi()
+                    rows = [
+                        self._queue_update(pipe, row, data.update_json) for row in rows
+                    ]
+                    pipe.execute()
+                    break
+                except WatchError:
+                    continue
+        if not returning:
+            return []
+        return [self.hydrate(row) for row in rows]
+
+    def query_received_before(
+        self, query: TasksQuery, before: datetime.datetime, limit: int | None = None
+    ) -> list[Task]:
+        """
+        Queries the tasks that match the given query received before the given date,
+        reading the index range scored below the date.
+
+        Args:
+            query (TasksQuery): The query to match.
+            before (datetime.datetime): The date the tasks were received before.
+            limit (int | None): The maximum number of tasks to return.
+        """
+        query = query.query_json
+        page = {} if limit is None else {"start": 0, "num": limit}
+        key = self._index_key(query.get("user"), query.get("status"))
+        ids = self.db.zrangebyscore(key, "-inf", f"({before.timestamp()}", **page)
+        return [
+            self.hydrate(row) for row in self._fetch(ids) if self._matches(row, query)
+        ]
+
+    def delete_many(self, ids: list[uuid.UUID]) -> None:
+        """
+        Deletes the tasks with the given ids and their index entries in a single
+        transaction.
+
+        Args:
+            ids (list[uuid.UUID]): The ids of the tasks to delete.
+        """
+        pipe = self.db.pipeline()
+        for row in self._fetch([str(id) for id in ids]):
+            pipe.delete(self._key(row["id"]))
+            for key in self._index_keys(row):
+                pipe.zrem(key, row["id"])
+            pipe.hincrby(self.versions_key, row["user"], 1)
+        pipe.execute()
+
+    def stats(self, user: uuid.UUID) -> TaskStats:
+        """
+        Gets the task counters of a user from its counters hash.
+
+        Args:
+            user (uuid.UUID): The id of the user.
+        """
+        counters = self.db.hgetall(self._stats_key(user))
+        return TaskStats.from_counters(
+            {key.decode(): int(value) for key, value in counters.items()}
+        )
+
+    def collection_version(self, user: uuid.UUID) -> int:
+        """
+        Gets the collection version of a user from the versions hash.
+
+        Args:
+            user (uuid.UUID): The id of the user.
+        """
+        return int(self.db.hget(self.versions_key, str(user)) or 0)
+
+    def rebuild_stats(self) -> None:
+        """
+        Recomputes every user's task counters from the tasks hashes.
+        """
+        counters = {}
+        for task in self.iter_query(query=TasksQuery()):
+            user_counters = counters.setdefault(str(task.user), {})
+            for key, amount in TaskStats.create_delta(task).items():
+                user_counters[key] = user_counters.get(key, 0) + amount
+
+        pipe = self.db.pipeline()
+        for key in self.db.scan_iter(match=self._stats_key("*")):
+            pipe.delete(key)
+        for user, user_counters in counters.items():
+            pipe.hset(self._stats_key(user), mapping=user_counters)
+        pipe.execute()
+
+
+class AsyncRedisTasksRepo(RedisTasksQueries, AsyncTasksRepo):
+    """
+    Redis tasks repository running on the asyncio event loop.
+    """
+
+    def __init__(self, db: AsyncRedis):
+        """
+        Args:
+            db (AsyncRedis): The asyncio redis client.
+        """
+        self.db = db
+
+    async def _fetch(self, ids: list[bytes | str]) -> list[dict]:
+        pipe = self.db.pipeline(transaction=False)
+        for id in ids:
+            pipe.hgetall(self._key(id.decode() if isinstance(id, bytes) else id))
+        return [self._decode(entry) for entry in await pipe.execute() if entry]
+
+    async def create(self, task: Task) -> Task:
+        """
+        Creates a new task with its indexes and counters in a single transaction.
+
+        Args:
+            task (Task): The data for the task to be created.
+        """
+        pipe = self.db.pipeline()
+        self._queue_create(pipe, dump_row(task))
+        await pipe.execute()
+        return task
+
+    async def iter_query(
+        self, query: TasksQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.AsyncIterator[Task]:
+        """
+        Lazily yields the tasks that match the given query.
+
+        Args:
+            query (TasksQuery): The query to match.
+            offset (int): The number of matching tasks to skip.
+            limit (int | None): The maximum number of tasks to yield.
+        """
+        query = query.query_json
+        if "id" in query:
+            rows = await self._fetch([query["id"]])
+            matches = [row for row in rows if self._matches(row, query)]
+            stop = None if limit is None else offset + limit
+            for row in matches[offset:stop]:
+                yield self.hydrate(row)
+            return
+
+        key, start, stop = self._range(query, offset=offset, limit=limit)
+        while stop is None or start <= stop:
+            end = start + self.batch_size - 1
+            if stop is not None:
+                end = min(end, stop)
+            ids = await self.db.zrange(key, start, end)
+            for row in await self._fetch(ids):
+                yield self.hydrate(row)
+            if len(ids) < end - start + 1:
+                return
+            start = end + 1
+
+    async def query(
+        self,
+        query: TasksQuery,
+        offset: int = 0,
+        limit: int | None = None,
+        version: int | None = None,
+    ) -> list[Task]:
+        """
+        Queries the repository for tasks that match the given query.
+
+        Args:
+            query (TasksQuery): The query to match.
+            offset (int): The number of matching tasks to skip.
+            limit (int | None): The maximum number of tasks to return.
+            version (int | None): Ignored, redis reads always see every write.
+        """
+        return [
+            task
+            async for task in self.iter_query(query=query, offset=offset, limit=limit)
+        ]
+
+    async def get(self, query: TasksQuery) -> Task:
+        """
+        Gets the first task that matches the given query.
+
+        Args:
+            query (TasksQuery): The query to match.
+        """
+        return next(iter(await self.query(query=query, limit=1)), None)
+
+    async def update(
+        self, query: TasksQuery, data: TaskUpdate, returning: bool = True
+    ) -> list[Task]:
+        """
+        Updates the tasks that match the given query with the given update.
+
+        Args:
+            query (TasksQuery): The query to match.
+            data (TaskUpdate): The update to apply.
+            returning (bool): Whether to return the updated tasks.
+        """
+        ids = [task.id for task in await self.query(query=query)]
+        if not ids:
+            return []
+        async with self.db.pipeline() as pipe:
+            while True:
+                try:
+                    await pipe.watch(*[self._key(id) for id in ids])
+                    rows = await self._fetch(ids)
+                    pipe.multi()
+                    rows = [
+                        self._queue_update(pipe, row, data.update_json) for row in rows
+                    ]
+                    await pipe.execute()
+                    break
+                except WatchError:
+                    continue
+        if not returning:
+            return []
+        return [self.hydrate(row) for row in rows]
+
+    async def stats(self, user: uuid.UUID) -> TaskStats:
+        """
+        Gets the task counters of a user from its counters hash.
+
+        Args:
+            user (uuid.UUID): The id of the user.
+        """
+        counters = await self.db.hgetall(self._stats_key(user))
+        return TaskStats.from_counters(
+            {key.decode(): int(value) for key, value in counters.items()}
+        )
+
+    async def collection_version(self, user: uuid.UUID) -> int:
+        """
+        Gets the collection version of a user from the versions hash.
+
+        Args:
+            user (uuid.UUID): The id of the user.
+        """
+        return int(await self.db.hget(self.versions_key, str(user)) or 0)
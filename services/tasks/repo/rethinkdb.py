@@ -1,25 +1,253 @@
-import json
+import datetime
+import typing
+import uuid
 
-from rethinkdb import RethinkDB
+from rethinkdb import r
 
-from api.db.rethinkdb import get_or_create_table
-from services.tasks.models import Task, TasksQuery, TaskUpdate
-from services.tasks.repo.base import TasksRepo
+from api.db.rethinkdb import SCHEMA, AsyncConnectionPool, ConnectionPool, select
+from api.db.rows import RowHydrator, dump_row
+from services.tasks.models import Task, TasksQuery, TaskStats, TaskUpdate
+from services.tasks.repo.base import AsyncTasksRepo, TasksRepo
 
 
-class RethinkDBTasksRepo(TasksRepo):
+class RethinkDBTasksQueries:
     """
-    RethinkDB tasks repository.
+    Builds the ReQL queries of the tasks repositories. ReQL queries do not depend on the
+    connection type, so the sync and asyncio repositories share them and only differ in
+    how they run them.
     """
 
     table = "tasks"
+    stats_table = "tasks_stats"
+    versions_table = "tasks_versions"
+    hydrate = RowHydrator(Task)
+
+    table_ref = r.table(table)
+    stats_table_ref = r.table(stats_table)
+    versions_table_ref = r.table(versions_table)
+    indexes = SCHEMA[table]
+
+    # The consistency of every read method. "single" reads from the primary replica of
+    # each shard and sees every acknowledged write, "outdated" reads from the closest
+    # replica and may lag behind. Writes always run on the primary.
+    read_modes = {
+        "query": "outdated",
+        "iter_query": "outdated",
+        "get": "single",
+        "stats": "single",
+        "collection_version": "single",
+    }
+
+    def _set_read_routing(self, replica_db, read_modes: dict[str, str] | None) -> None:
+        self.replica_db = replica_db
+        self.read_modes = {**self.read_modes, **(read_modes or {})}
+
+    def _read(self, method: str, consistent: bool = False) -> tuple:
+        """
+        Returns the pool and read mode of a read method. Eventually consistent reads run
+        on the replica pool when there is one, so they scale with the replicas.
+
+        Args:
+            method (str): The name of the read method.
+            consistent (bool): Whether this read must see every acknowledged write.
+        """
+        if consistent:
+            return self.db, "single"
+        read_mode = self.read_modes.get(method, "single")
+        if read_mode == "outdated" and self.replica_db is not None:
+            return self.replica_db, read_mode
+        return self.db, read_mode
+
+    @staticmethod
+    def _table(name: str, read_mode: str = "single"):
+        if read_mode == "single":
+            return r.table(name)
+        return r.table(name, read_mode=read_mode)
+
+    def _select(
+        self,
+        query: TasksQuery,
+        offset: int = 0,
+        limit: int | None = None,
+        read_mode: str = "single",
+    ):
+        """
+        Returns the selection of tasks matching the query, using the best fitting index.
+        The tasks are ordered by the date they were received, so pages are stable.
+
+        Args:
+            query (TasksQuery): The query to match.
+            offset (int): The number of matching tasks to skip.
+            limit (int | None): The maximum number of tasks to select.
+            read_mode (str): The consistency of the read.
+        """
+        table = self._table(self.table, read_mode=read_mode)
+        selection = select(
+            table,
+            query=query.query_json,
+            indexes=self.indexes,
+            order_by="received_at",
+        )
+        if offset:
+            selection = selection.skip(offset)
+        if limit is not None:
+            selection = selection.limit(limit)
+        return selection
+
+    @staticmethod
+    def _checks_version(query: TasksQuery, version: int | None, read_mode: str) -> bool:
+        # Reads from the primaries see every write, the others may lag behind the version
+        return version is not None and query.user is not None and read_mode != "single"
+
+    def _select_versioned(
+        self, query: TasksQuery, offset: int, limit: int | None, read_mode: str
+    ):
+        """
+        Returns the query reading the collection version of the user of the query and
+        then the matching tasks, from the same replica, as {"version", "tasks"}.
+        """
+        versions = self._table(self.versions_table, read_mode=read_mode)
+        tasks = self._select(query, offset=offset, limit=limit, read_mode=read_mode)
+        return (
+            versions.get(str(query.user))["version"]
+            .default(0)
+            .do(lambda version: {"version": version, "tasks": tasks.coerce_to("array")})
+        )
+
+    def _select_received_before(
+        self, query: TasksQuery, before: datetime.datetime, limit: int | None
+    ):
+        """
+        Returns the selection of tasks matching the query received before the given
+        date. Dates are stored as ISO strings of the same timezone, so they compare in
+        order.
+
+        Args:
+            query (TasksQuery): The query to match.
+            before (datetime.datetime): The date the tasks were received before.
+            limit (int | None): The maximum number of tasks to select.
+        """
+        selection = select(self.table_ref, query=query.query_json, indexes=self.indexes)
+        selection = selection.filter(r.row["received_at"].lt(before.isoformat()))
+        if limit is not None:
+            selection = selection.limit(limit)
+        return selection
+
+    def _insert(self, task: Task):
+        """
+        Returns the query inserting the task.
+
+        Args:
+            task (Task): The task to insert.
+        """
+        return self.table_ref.insert(dump_row(task))
+
+    def _update(self, query: TasksQuery, data: TaskUpdate, returning: bool):
+        """
+        Returns the query updating the tasks matching the query and increasing their
+        revision. Changes are returned when the caller wants the rows, a status change
+        needs the old rows to keep the stats counters, or the query does not tell the
+        users whose collection version changes.
+
+        Args:
+            query (TasksQuery): The query to match.
+            data (TaskUpdate): The update to apply.
+            returning (bool): Whether the updated tasks are returned.
+        """
+        if returning:
+            return_changes = "always"
+        else:
+            return_changes = data.status is not None or query.user is None
+        update = {
+            **data.update_json,
+            "revision": r.row["revision"].default(0).add(1),
+            "updated_at": datetime.datetime.now().isoformat(),
+        }
+        return self._select(query).update(update, return_changes=return_changes)
+
+    @staticmethod
+    def _updated_users(query: TasksQuery, result: dict) -> set[str]:
+        """
+        Returns the users of the tasks changed by an update.
+
+        Args:
+            query (TasksQuery): The query of the update.
+            result (dict): The result of the update.
+        """
+        if not result.get("replaced"):
+            return set()
+        if query.user is not None:
+            return {str(query.user)}
+        return {change["old_val"]["user"] for change in result.get("changes", [])}
+
+    def _bump_versions(self, users: typing.Iterable[str]):
+        """
+        Returns the upsert increasing the collection version of the given users.
+
+        Args:
+            users (Iterable[str]): The ids of the users.
+        """
+        return self.versions_table_ref.insert(
+            [{"id": str(user), "version": 1} for user in users],
+            conflict=lambda _id, old, new: old.merge(
+                {"version": old["version"].add(1)}
+            ),
+        )
+
+    def _increment_stats(self, user: uuid.UUID, counters: dict[str, int]):
+        """
+        Returns the upsert adding the given amounts to the task counters of a user.
+
+        Args:
+            user (uuid.UUID): The id of the user.
+            counters (dict[str, int]): The amount to add to each counter.
+        """
+        return self.stats_table_ref.insert(
+            {"id": str(user), **counters},
+            conflict=lambda _id, old, new: old.merge(
+                {
+                    key: old[key].default(0).add(amount)
+                    for key, amount in counters.items()
+                }
+            ),
+        )
+
+    @staticmethod
+    def _changes_stats(changes: list[dict]) -> list[tuple[str, dict[str, int]]]:
+        """
+        Returns the users and counters to increment for the status changes of an update.
+
+        Args:
+            changes (list[dict]): The changes returned by the update.
+        """
+        deltas = []
+        for change in changes:
+            old, new = change["old_val"], change["new_val"]
+            counters = TaskStats.status_delta(old["status"], new["status"])
+            if counters:
+                deltas.append((old["user"], counters))
+        return deltas
+
 
-    def __init__(self, db: RethinkDB):
+class RethinkDBTasksRepo(RethinkDBTasksQueries, TasksRepo):
+    """
+    RethinkDB tasks repository.
+    """
+
+    def __init__(
+        self,
+        db: ConnectionPool,
+        replica_db: ConnectionPool | None = None,
+        read_modes: dict[str, str] | None = None,
+    ):
         """
         Args:
-            db (RethinkDB): The rethinkdb instance.
+            db (ConnectionPool): The rethinkdb connection pool.
+            replica_db (ConnectionPool | None): The pool for eventually consistent reads.
+            read_modes (dict[str, str] | None): Overrides of the read mode per method.
         """
         self.db = db
+        self._set_read_routing(replica_db, read_modes)
 
     def create(self, task: Task) -> Task:
         """
@@ -28,45 +256,348 @@ class RethinkDBTasksRepo(TasksRepo):
         Args:
             task (Task): The data for the task to be created.
         """
-        get_or_create_table(self.table).insert(json.loads(task.model_dump_json())).run(
-            self.db
-        )
+        with self.db.connection() as connection:
+            self._insert(task).run(connection)
+            self._increment_stats(
+                user=task.user, counters=TaskStats.create_delta(task)
+            ).run(connection)
+            self._bump_versions([task.user]).run(connection)
         return task
 
-    def query(self, query: TasksQuery) -> list[Task]:
+    def iter_query(
+        self, query: TasksQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.Iterator[Task]:
+        """
+        Lazily yields the tasks that match the given query. The cursor fetches the rows in
+        batches and the connection stays checked out until the iteration ends.
+
+        Args:
+            query (TasksQuery): The query to match.
+            offset (int): The number of matching tasks to skip.
+            limit (int | None): The maximum number of tasks to yield.
+        """
+        db, read_mode = self._read("iter_query")
+        with db.connection() as connection:
+            selection = self._select(
+                query, offset=offset, limit=limit, read_mode=read_mode
+            )
+            cursor = selection.run(connection)
+            try:
+                for entry in cursor:
+                    yield self.hydrate(entry)
+            finally:
+                cursor.close()
+
+    def query(
+        self,
+        query: TasksQuery,
+        offset: int = 0,
+        limit: int | None = None,
+        version: int | None = None,
+    ) -> list[Task]:
         """
         Queries the repository for tasks that match the given query.
 
         Args:
             query (dict): The query to match.
+            offset (int): The number of matching tasks to skip.
+            limit (int | None): The maximum number of tasks to return.
+            version (int | None): A collection version of the user of the query the
+                tasks must not be older than. The tasks are read with the version from
+                the replica, and again from the primary if the replica is behind it.
         """
-
-        return [
-            Task(**entry)
-            for entry in get_or_create_table(self.table)
-            .filter(query.query_json)
-            .run(self.db)
-        ]
+        db, read_mode = self._read("query")
+        if self._checks_version(query, version, read_mode):
+            with db.connection() as connection:
+                result = self._select_versioned(query, offset, limit, read_mode).run(
+                    connection
+                )
+            if result["version"] >= version:
+                return [self.hydrate(entry) for entry in result["tasks"]]
+            db, read_mode = self._read("query", consistent=True)
+        with db.connection() as connection:
+            selection = self._select(
+                query, offset=offset, limit=limit, read_mode=read_mode
+            )
+            return [self.hydrate(entry) for entry in selection.run(connection)]
 
     def get(self, query: TasksQuery) -> Task:
         """
-        Gets a task that matches the given query.
+        Gets the first task that matches the given query.
 
         Args:
             query (TasksQuery): The query to match.
         """
-        return next(iter(self.query(query=query)), None)
+        db, read_mode = self._read("get")
+        with db.connection() as connection:
+            selection = self._select(query, limit=1, read_mode=read_mode)
+            return next(
+                (self.hydrate(entry) for entry in selection.run(connection)), None
+            )
 
-    def update(self, query: TasksQuery, data: TaskUpdate) -> list[Task]:
+    def update(
+        self, query: TasksQuery, data: TaskUpdate, returning: bool = True
+    ) -> list[Task]:
         """
-        Updates the tasks that match the given query with the given update.
+        Updates the tasks that match the given query with the given update. The new rows
+        are taken from the changes returned by the update itself.
 
         Args:
             query (dict): The query to match.
             update (dict): The update to apply.
+            returning (bool): Whether to return the updated tasks.
+        """
+        if not data.update_json:
+            return self.query(query=query) if returning else []
+        with self.db.connection() as connection:
+            result = self._update(query, data=data, returning=returning).run(connection)
+            changes = result.get("changes", [])
+            for user, counters in self._changes_stats(changes):
+                self._increment_stats(user=user, counters=counters).run(connection)
+            users = self._updated_users(query, result)
+            if users:
+                self._bump_versions(users).run(connection)
+        if not returning:
+            return []
+        return [self.hydrate(change["new_val"]) for change in changes]
+
+    def query_received_before(
+        self, query: TasksQuery, before: datetime.datetime, limit: int | None = None
+    ) -> list[Task]:
+        """
+        Queries the tasks that match the given query received before the given date.
+
+        Args:
+            query (TasksQuery): The query to match.
+            before (datetime.datetime): The date the tasks were received before.
+            limit (int | None): The maximum number of tasks to return.
+        """
+        selection = self._select_received_before(query, before=before, limit=limit)
+        with self.db.connection() as connection:
+            return [self.hydrate(entry) for entry in selection.run(connection)]
+
+    def delete_many(self, ids: list[uuid.UUID]) -> None:
+        """
+        Deletes the tasks with the given ids with a single primary key lookup.
+
+        Args:
+            ids (list[uuid.UUID]): The ids of the tasks to delete.
+        """
+        if not ids:
+            return
+        with self.db.connection() as connection:
+            result = (
+                self.table_ref.get_all(*[str(id) for id in ids])
+                .delete(return_changes=True)
+                .run(connection)
+            )
+            users = {change["old_val"]["user"] for change in result.get("changes", [])}
+            if users:
+                self._bump_versions(users).run(connection)
+
+    def stats(self, user: uuid.UUID) -> TaskStats:
+        """
+        Gets the task counters of a user with a single primary key lookup.
+
+        Args:
+            user (uuid.UUID): The id of the user.
+        """
+        db, read_mode = self._read("stats")
+        with db.connection() as connection:
+            table = self._table(self.stats_table, read_mode=read_mode)
+            counters = table.get(str(user)).run(connection)
+        return TaskStats.from_counters(counters or {})
+
+    def collection_version(self, user: uuid.UUID) -> int:
+        """
+        Gets the collection version of a user with a single primary key lookup.
+
+        Args:
+            user (uuid.UUID): The id of the user.
+        """
+        db, read_mode = self._read("collection_version")
+        with db.connection() as connection:
+            table = self._table(self.versions_table, read_mode=read_mode)
+            return table.get(str(user))["version"].default(0).run(connection)
+
+    def rebuild_stats(self) -> None:
+        """
+        Recomputes every user's task counters streaming the tasks table.
+        """
+        counters = {}
+        with self.db.connection() as connection:
+            for entry in self.table_ref.run(connection):
+                user_counters = counters.setdefault(entry["user"], {})
+                for key, amount in TaskStats.create_delta(self.hydrate(entry)).items():
+                    user_counters[key] = user_counters.get(key, 0) + amount
+
+            self.stats_table_ref.delete().run(connection)
+            self.stats_table_ref.insert(
+                [
+                    {"id": user, **user_counters}
+                    for user, user_counters in counters.items()
+                ]
+            ).run(connection)
+
+
+class AsyncRethinkDBTasksRepo(RethinkDBTasksQueries, AsyncTasksRepo):
+    """
+    RethinkDB tasks repository running on the asyncio event loop.
+    """
+
+    def __init__(
+        self,
+        db: AsyncConnectionPool,
+        replica_db: AsyncConnectionPool | None = None,
+        read_modes: dict[str, str] | None = None,
+    ):
+        """
+        Args:
+            db (AsyncConnectionPool): The asyncio rethinkdb connection pool.
+            replica_db (AsyncConnectionPool | None): The pool for eventually consistent
+                reads.
+            read_modes (dict[str, str] | None): Overrides of the read mode per method.
+        """
+        self.db = db
+        self._set_read_routing(replica_db, read_modes)
+
+    async def create(self, task: Task) -> Task:
+        """
+        Creates a new task with the given data and returns the created task.
+
+        Args:
+            task (Task): The data for the task to be created.
+        """
+        async with self.db.connection() as connection:
+            await self._insert(task).run(connection)
+            await self._increment_stats(
+                user=task.user, counters=TaskStats.create_delta(task)
+            ).run(connection)
+            await self._bump_versions([task.user]).run(connection)
+        return task
+
+    async def iter_query(
+        self, query: TasksQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.AsyncIterator[Task]:
+        """
+        Lazily yields the tasks that match the given query.
+
+        Args:
+            query (TasksQuery): The query to match.
+            offset (int): The number of matching tasks to skip.
+            limit (int | None): The maximum number of tasks to yield.
+        """
+        db, read_mode = self._read("iter_query")
+        async with db.connection() as connection:
+            selection = self._select(
+                query, offset=offset, limit=limit, read_mode=read_mode
+            )
+            cursor = await selection.run(connection)
+            try:
+                async for entry in cursor:
+                    yield self.hydrate(entry)
+            finally:
+                await cursor.close()
+
+    async def query(
+        self,
+        query: TasksQuery,
+        offset: int = 0,
+        limit: int | None = None,
+        version: int | None = None,
+    ) -> list[Task]:
+        """
+        Queries the repository for tasks that match the given query.
+
+        Args:
+            query (TasksQuery): The query to match.
+            offset (int): The number of matching tasks to skip.
+            limit (int | None): The maximum number of tasks to return.
+            version (int | None): A collection version of the user of the query the
+                tasks must not be older than. The tasks are read with the version from
+                the replica, and again from the primary if the replica is behind it.
+        """
+        db, read_mode = self._read("query")
+        if self._checks_version(query, version, read_mode):
+            async with db.connection() as connection:
+                result = await self._select_versioned(
+                    query, offset, limit, read_mode
+                ).run(connection)
+            if result["version"] >= version:
+                return [self.hydrate(entry) for entry in result["tasks"]]
+            db, read_mode = self._read("query", consistent=True)
+        async with db.connection() as connection:
+            selection = self._select(
+                query, offset=offset, limit=limit, read_mode=read_mode
+            )
+            cursor = await selection.run(connection)
+            return [self.hydrate(entry) async for entry in cursor]
+
+    async def get(self, query: TasksQuery) -> Task:
+        """
+        Gets the first task that matches the given query.
+
+        Args:
+            query (TasksQuery): The query to match.
+        """
+        db, read_mode = self._read("get")
+        async with db.connection() as connection:
+            selection = self._select(query, limit=1, read_mode=read_mode)
+            cursor = await selection.run(connection)
+            async for entry in cursor:
+                return self.hydrate(entry)
+        return None
+
+    async def update(
+        self, query: TasksQuery, data: TaskUpdate, returning: bool = True
+    ) -> list[Task]:
+        """
+        Updates the tasks that match the given query with the given update.
+
+        Args:
+            query (TasksQuery): The query to match.
+            data (TaskUpdate): The update to apply.
+            returning (bool): Whether to return the updated tasks.
         """
+        if not data.update_json:
+            return await self.query(query=query) if returning else []
+        async with self.db.connection() as connection:
+            result = await self._update(query, data=data, returning=returning).run(
+                connection
+            )
+            changes = result.get("changes", [])
+            for user, counters in self._changes_stats(changes):
+                await self._increment_stats(user=user, counters=counters).run(
+                    connection
+                )
+            users = self._updated_users(query, result)
+            if users:
+                await self._bump_versions(users).run(connection)
+        if not returning:
+            return []
+        return [self.hydrate(change["new_val"]) for change in changes]
 
-        get_or_create_table("tasks").filter(query.query_json).update(
-            data.update_json
-        ).run(self.db)
-        return self.query(query=query)
+    async def stats(self, user: uuid.UUID) -> TaskStats:
+        """
+        Gets the task counters of a user with a single primary key lookup.
+
+        Args:
+            user (uuid.UUID): The id of the user.
+        """
+        db, read_mode = self._read("stats")
+        async with db.connection() as connection:
+            table = self._table(self.stats_table, read_mode=read_mode)
+            counters = await table.get(str(user)).run(connection)
+        return TaskStats.from_counters(counters or {})
+
+    async def collection_version(self, user: uuid.UUID) -> int:
+        """
+        Gets the collection version of a user with a single primary key lookup.
+
+        Args:
+            user (uuid.UUID): The id of the user.
+        """
+        db, read_mode = self._read("collection_version")
+        async with db.connection() as connection:
+            table = self._table(self.versions_table, read_mode=read_mode)
+            return await table.get(str(user))["version"].default(0).run(connection)
@@ -0,0 +1,386 @@
+import datetime
+import json
+import sqlite3
+import typing
+import uuid
+
+from starlette.concurrency import run_in_threadpool
+
+from api.db.rows import RowHydrator, dump_row
+from api.db.sqlite import SQLitePool
+from services.tasks.models import Task, TasksQuery, TaskStats, TaskUpdate
+from services.tasks.repo.base import AsyncTasksRepo, TasksRepo
+
+COLUMNS = [
+    "id",
+    "user",
+    "received_at",
+    "status",
+    "type",
+    "category",
+    "title",
+    "description",
+    "trello_data",
+    "fail_count",
+    "revision",
+    "updated_at",
+]
+
+INSERT_TASK = f"""
+    INSERT INTO tasks ({", ".join(COLUMNS)})
+    VALUES ({", ".join(f":{column}" for column in COLUMNS)})
+"""
+
+INCREMENT_STATS = """
+    INSERT INTO tasks_stats (user, counter, amount) VALUES (?, ?, ?)
+    ON CONFLICT (user, counter) DO UPDATE SET amount = amount + excluded.amount
+"""
+
+BUMP_VERSION = """
+    INSERT INTO tasks_versions (user, version) VALUES (?, 1)
+    ON CONFLICT (user) DO UPDATE SET version = version + 1
+"""
+
+
+class SQLiteTasksRepo(TasksRepo):
+    """
+    SQLite tasks repository. Tasks are rows of the `tasks` table, indexed by user and
+    status, and the counters of every user are rows of `tasks_stats` updated with upserts,
+    like the collection versions of `tasks_versions`.
+    """
+
+    hydrate = RowHydrator(Task)
+
+    def __init__(self, db: SQLitePool):
+        """
+        Args:
+            db (SQLitePool): The sqlite connection pool.
+        """
+        self.db = db
+
+    @staticmethod
+    def _encode(task: Task) -> dict:
+        row = dump_row(task)
+        if row["trello_data"] is not None:
+            row["trello_data"] = json.dumps(row["trello_data"])
+        return row
+
+    @classmethod
+    def _decode(cls, row: sqlite3.Row) -> Task:
+        row = dict(row)
+        if row["trello_data"] is not None:
+            row["trello_data"] = json.loads(row["trello_data"])
+        return cls.hydrate(row)
+
+    @staticmethod
+    def _where(query: TasksQuery) -> tuple[str, list]:
+        """
+        Returns the WHERE clause matching the query and its parameters. Queries only
+        filter on a few fields, so the few possible statements stay prepared.
+        """
+        query = query.query_json
+        if not query:
+            return "", []
+        clause = " AND ".join(f"{field} = ?" for field in query)
+        return f" WHERE {clause}", list(query.values())
+
+    def _stats_rows(self, user: str, counters: dict[str, int]) -> list[tuple]:
+        return [(user, counter, amount) for counter, amount in counters.items()]
+
+    @staticmethod
+    def _bump_versions(connection: sqlite3.Connection, users: set[str]) -> None:
+        connection.executemany(BUMP_VERSION, [(user,) for user in users])
+
+    def create(self, task: Task) -> Task:
+        """
+        Creates a new task and increments its counters in a single transaction.
+
+        Args:
+            task (Task): The data for the task to be created.
+        """
+        return self.create_many([task])[0]
+
+    def create_many(self, tasks: list[Task]) -> list[Task]:
+        """
+        Creates the given tasks with a single bulk insert.
+
+        Args:
+            tasks (list[Task]): The tasks to be created.
+        """
+        stats = []
+        for task in tasks:
+            stats += self._stats_rows(str(task.user), TaskStats.create_delta(task))
+        with self.db.transaction() as connection:
+            connection.executemany(INSERT_TASK, [self._encode(task) for task in tasks])
+            connection.executemany(INCREMENT_STATS, stats)
+            self._bump_versions(connection, {str(task.user) for task in tasks})
+        return tasks
+
+    def iter_query(
+        self, query: TasksQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.Iterator[Task]:
+        """
+        Lazily yields the tasks that match the given query, in insertion order.
+
+        Args:
+            query (TasksQuery): The query to match.
+            offset (int): The number of matching tasks to skip.
+            limit (int | None): The maximum number of tasks to yield.
+        """
+        where, params = self._where(query)
+        cursor = self.db.connection.execute(
+            f"SELECT * FROM tasks{where} ORDER BY rowid LIMIT ? OFFSET ?",
+            [*params, -1 if limit is None else limit, offset],
+        )
+        try:
+            for row in cursor:
+                yield self._decode(row)
+        finally:
+            cursor.close()
+
+    def query_page(
+        self, query: TasksQuery, after: int = 0, offset: int = 0, limit: int = 100
+    ) -> tuple[list[Task], int]:
+        """
+        Queries a page of the tasks that match the given query inserted after the given
+        rowid, and returns it with the rowid of its last task. Reading the next page
+        after that rowid seeks the index instead of skipping every previous row, and
+        tasks inserted meanwhile do not shift the pages.
+
+        Args:
+            query (TasksQuery): The query to match.
+            after (int): The rowid of the last task of the previous page, 0 for the first.
+            offset (int): The number of matching tasks to skip after it.
+            limit (int): The maximum number of tasks to return.
+        """
+        where, params = self._where(query)
+        where = f"{where} AND" if where else " WHERE"
+        rows = self.db.connection.execute(
+            f"SELECT rowid, * FROM tasks{where} rowid > ? ORDER BY rowid LIMIT ? OFFSET ?",
+            [*params, after, limit, offset],
+        ).fetchall()
+        if not rows:
+            return [], after
+        return [self._decode(row) for row in rows], rows[-1]["rowid"]
+
+    def query(
+        self,
+        query: TasksQuery,
+        offset: int = 0,
+        limit: int | None = None,
+        version: int | None = None,
+    ) -> list[Task]:
+        """
+        Queries the repository for tasks that match the given query.
+
+        Args:
+            query (TasksQuery): The query to match.
+            offset (int): The number of matching tasks to skip.
+            limit (int | None): The maximum number of tasks to return.
+            version (int | None): Ignored, sqlite reads always see every write.
+        """
+        return list(self.iter_query(query=query, offset=offset, limit=limit))
+
+    def get(self, query: TasksQuery) -> Task:
+        """
+        Gets the first task that matches the given query.
+
+        Args:
+            query (TasksQuery): The query to match.
+        """
+        return next(iter(self.query(query=query, limit=1)), None)
+
+    def update(
+        self, query: TasksQuery, data: TaskUpdate, returning: bool = True
+    ) -> list[Task]:
+        """
+        Updates the tasks that match the given query with the given update, taking the
+        updated rows from the update itself. A status change also moves the counters of
+        the tasks, and the collection versions of their users are increased, in the same
+        transaction.
+
+        Args:
+            query (TasksQuery): The query to match.
+            data (TaskUpdate): The update to apply.
+            returning (bool): Whether to return the updated tasks.
+        """
+        update = data.update_json
+        if "trello_data" in update:
+            update["trello_data"] = json.dumps(update["trello_data"])
+        if not update:
+            return self.query(query=query) if returning else []
+
+        where, params = self._where(query)
+        update["updated_at"] = datetime.datetime.now().isoformat()
+        assignments = ", ".join(f"{field} = ?" for field in update)
+        with self.db.transaction() as connection:
+            old_statuses = {}
+            if data.status is not None:
+                old_statuses = dict(
+                    connection.execute(f"SELECT id, status FROM tasks{where}", params)
+                )
+            rows = connection.execute(
+                f"UPDATE tasks SET {assignments}, revision = revision + 1{where} "
+                "RETURNING *",
+                [*update.values(), *params],
+            ).fetchall()
+
+            stats = []
+            for row in rows:
+                if row["id"] in old_statuses:
+                    counters = TaskStats.status_delta(
+                        old_statuses[row["id"]], row["status"]
+                    )
+                    stats += self._stats_rows(row["user"], counters)
+            connection.executemany(INCREMENT_STATS, stats)
+            self._bump_versions(connection, {row["user"] for row in rows})
+        if not returning:
+            return []
+        return [self._decode(row) for row in rows]
+
+    def query_received_before(
+        self, query: TasksQuery, before: datetime.datetime, limit: int | None = None
+    ) -> list[Task]:
+        """
+        Queries the tasks that match the given query received before the given date.
+        Dates are stored as ISO strings of the same timezone, so they compare in order.
+
+        Args:
+            query (TasksQuery): The query to match.
+            before (datetime.datetime): The date the tasks were received before.
+            limit (int | None): The maximum number of tasks to return.
+        """
+        where, params = self._where(query)
+        where = f"{where} AND" if where else " WHERE"
+        rows = self.db.connection.execute(
+            f"SELECT * FROM tasks{where} received_at < ? ORDER BY rowid LIMIT ?",
+            [*params, before.isoformat(), -1 if limit is None else limit],
+        )
+        return [self._decode(row) for row in rows.fetchall()]
+
+    def delete_many(self, ids: list[uuid.UUID]) -> None:
+        """
+        Deletes the tasks with the given ids in a single transaction.
+
+        Args:
+            ids (list[uuid.UUID]): The ids of the tasks to delete.
+        """
+        users = set()
+        with self.db.transaction() as connection:
+            for id in ids:
+                deleted = connection.execute(
+                    "DELETE FROM tasks WHERE id = ? RETURNING user", [str(id)]
+                )
+                users.update(user for (user,) in deleted.fetchall())
+            self._bump_versions(connection, users)
+
+    def stats(self, user: uuid.UUID) -> TaskStats:
+        """
+        Gets the task counters of a user with a single primary key range read.
+
+        Args:
+            user (uuid.UUID): The id of the user.
+        """
+        rows = self.db.connection.execute(
+            "SELECT counter, amount FROM tasks_stats WHERE user = ?", [str(user)]
+        )
+        return TaskStats.from_counters(dict(rows.fetchall()))
+
+    def collection_version(self, user: uuid.UUID) -> int:
+        """
+        Gets the collection version of a user with a single primary key lookup.
+
+        Args:
+            user (uuid.UUID): The id of the user.
+        """
+        row = self.db.connection.execute(
+            "SELECT version FROM tasks_versions WHERE user = ?", [str(user)]
+        ).fetchone()
+        return row[0] if row else 0
+
+    def rebuild_stats(self) -> None:
+        """
+        Recomputes every user's task counters from the tasks table.
+        """
+        counters = {}
+        for task in self.iter_query(query=TasksQuery()):
+            user_counters = counters.setdefault(str(task.user), {})
+            for key, amount in TaskStats.create_delta(task).items():
+                user_counters[key] = user_counters.get(key, 0) + amount
+
+        stats = []
+        for user, user_counters in counters.items():
+            stats += self._stats_rows(user, user_counters)
+        with self.db.transaction() as connection:
+            connection.execute("DELETE FROM tasks_stats")
+            connection.executemany(INCREMENT_STATS, stats)
+
+
+class AsyncSQLiteTasksRepo(AsyncTasksRepo):
+    """
+    Asyncio interface of SQLiteTasksRepo. sqlite calls block, so they run in the
+    threadpool, where every thread uses its own connection.
+    """
+
+    # Tasks read per threadpool call while iterating
+    batch_size = 100
+
+    def __init__(self, db: SQLitePool) -> None:
+        self.repo = SQLiteTasksRepo(db=db)
+
+    async def create(self, task: Task) -> Task:
+        return await run_in_threadpool(self.repo.create, task=task)
+
+    async def query(
+        self,
+        query: TasksQuery,
+        offset: int = 0,
+        limit: int | None = None,
+        version: int | None = None,
+    ) -> list[Task]:
+        return await run_in_threadpool(
+            self.repo.query,
+            query=query,
+            offset=offset,
+            limit=limit,
+            version=version,
+        )
+
+    async def iter_query(
+        self, query: TasksQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.AsyncIterator[Task]:
+        # A cursor can not move between threads, so tasks are read in pages, each one
+        # after the last rowid of the previous
+        after = 0
+        while limit is None or limit > 0:
+            size = self.batch_size if limit is None else min(self.batch_size, limit)
+            tasks, after = await run_in_threadpool(
+                self.repo.query_page,
+                query=query,
+                after=after,
+                offset=offset,
+                limit=size,
+            )
+            for task in tasks:
+                yield task
+            if len(tasks) < size:
+                return
+            offset = 0
+            if limit is not None:
+                limit -= size
+
+    async def get(self, query: TasksQuery) -> Task:
+        return await run_in_threadpool(self.repo.get, query=query)
+
+    async def update(
+        self, query: TasksQuery, data: TaskUpdate, returning: bool = True
+    ) -> list[Task]:
+        return await run_in_threadpool(
+            self.repo.update, query=query, data=data, returning=returning
+        )
+
+    async def stats(self, user: uuid.UUID) -> TaskStats:
+        return await run_in_threadpool(self.repo.stats, user=user)
+
+    async def collection_version(self, user: uuid.UUID) -> int:
+        return await run_in_threadpool(self.repo.collection_version, user=user)
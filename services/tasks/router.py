@@ -1,21 +1,29 @@
 import typing
 import uuid
 
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.responses import Response, StreamingResponse
 
+from api.responses import PydanticJSONResponse, http_date, is_not_modified
 from api.setup import tasks_service
-from services.auth.handlers import UserDependsType
-from services.tasks.models import Task, TaskCreate, TasksQuery, TaskStatus
+from services.auth.handlers import PrincipalDependsType, UserDependsType
+from services.tasks.export import ExportFormat, export_chunks
+from services.tasks.models import Task, TaskCreate, TasksQuery, TaskStats, TaskStatus
 
 router = APIRouter(tags=["tasks"])
 
+# The tasks are built by the repos from rows validated when they were written, so the
+# routes only document their response model instead of validating every response again,
+# and return them in a PydanticJSONResponse encoded in a single pass
+
 
 @router.post(
     path="/",
     status_code=status.HTTP_201_CREATED,
-    response_model=Task,
+    response_model=None,
+    responses={status.HTTP_201_CREATED: {"model": Task}},
 )
-def create(task: TaskCreate, user: UserDependsType):
+async def create(task: TaskCreate, user: UserDependsType) -> PydanticJSONResponse:
     """
     Creates a new task with the given data and returns the created task.
 
@@ -23,45 +31,132 @@ def create(task: TaskCreate, user: UserDependsType):
         task (Task): The data for the task to be created.
         user (UserDependsType): The user that is creating the task.
     """
-    return tasks_service.create(task=task, user=user)
+    task = await tasks_service.acreate(task=task, user=user)
+    return PydanticJSONResponse(content=task, status_code=status.HTTP_201_CREATED)
 
 
 @router.get(
     path="/",
     status_code=status.HTTP_200_OK,
-    response_model=list[Task],
+    response_model=None,
+    responses={status.HTTP_200_OK: {"model": list[Task]}},
 )
-def query(
-    user: UserDependsType,
+async def query(
+    request: Request,
+    user: PrincipalDependsType,
     status: typing.Optional[TaskStatus] = None,
-) -> list[Task]:
+    offset: int = Query(0, ge=0),
+    limit: typing.Optional[int] = Query(None, ge=1),
+) -> PydanticJSONResponse:
     """
-    Queries the repository for tasks that match the given query.
+    Queries the repository for tasks that match the given query. The ETag is the version
+    of the user tasks, so clients polling with `If-None-Match` get a 304 until one of
+    their tasks changes.
 
     Args:
-        user (UserDependsType): The user that is querying the tasks.
+        request (Request): The request, with the conditional headers.
+        user (PrincipalDependsType): The user that is querying the tasks.
         status (TaskStatus): The status of the tasks to query.
+        offset (int): The number of matching tasks to skip.
+        limit (int): The maximum number of tasks to return.
     """
+    # Read before the tasks, a write in between changes the version the client sends next.
+    # Passing it makes replicas behind it fall back to the primary, so the body is never
+    # older than the ETag
+    version = await tasks_service.acollection_version(user_id=user.id)
+    headers = {"ETag": f'"{user.id}.{version}"'}
+    if is_not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
     query = TasksQuery(user=user.id, status=status)
-    return tasks_service.query(query=query)
+    tasks = await tasks_service.aquery(
+        query=query, offset=offset, limit=limit, version=version
+    )
+    return PydanticJSONResponse(content=tasks, headers=headers)
+
+
+@router.get(
+    path="/stats/",
+    status_code=status.HTTP_200_OK,
+    response_model=None,
+    responses={status.HTTP_200_OK: {"model": TaskStats}},
+)
+async def stats(user: PrincipalDependsType) -> PydanticJSONResponse:
+    """
+    Returns the task counters by status, type and category of the user.
+
+    Args:
+        user (PrincipalDependsType): The user that is getting the stats.
+    """
+    return PydanticJSONResponse(content=await tasks_service.astats(user_id=user.id))
+
+
+@router.get(
+    path="/export/",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+)
+async def export(
+    request: Request,
+    user: PrincipalDependsType,
+    format: ExportFormat = ExportFormat.NDJSON,
+    status: typing.Optional[TaskStatus] = None,
+) -> StreamingResponse:
+    """
+    Streams every task of the user as NDJSON or CSV. Tasks are read from a cursor and
+    encoded in batches as the client consumes them, so the export does not hold the user
+    tasks in memory. It is compressed with gzip when the client accepts it. Archived
+    tasks are not exported.
+
+    Args:
+        request (Request): The request, to negotiate the encoding.
+        user (PrincipalDependsType): The user that is exporting the tasks.
+        format (ExportFormat): The format of the export.
+        status (TaskStatus): The status of the tasks to export.
+    """
+    query = TasksQuery(user=user.id, status=status)
+    gzip = "gzip" in request.headers.get("accept-encoding", "")
+    headers = {
+        "Content-Disposition": f'attachment; filename="tasks.{format.value}"',
+        "Vary": "Accept-Encoding",
+    }
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        content=export_chunks(tasks_service.aiter_query(query=query), format, gzip),
+        media_type=format.media_type,
+        headers=headers,
+    )
 
 
 @router.get(
     path="/{id}/",
     status_code=status.HTTP_200_OK,
-    response_model=Task,
+    response_model=None,
+    responses={status.HTTP_200_OK: {"model": Task}},
 )
-def get(id: uuid.UUID, user: UserDependsType) -> Task:
+async def get(
+    request: Request, id: uuid.UUID, user: PrincipalDependsType
+) -> PydanticJSONResponse:
     """
-    Gets a task with the given id.
+    Gets a task with the given id. The ETag is the revision of the task, and requests
+    with a matching `If-None-Match` or `If-Modified-Since` get a 304 without a body.
 
     Args:
+        request (Request): The request, with the conditional headers.
         id (uuid.UUID): The id of the task to get.
-        user (UserDependsType): The user that is getting the task.
+        user (PrincipalDependsType): The user that is getting the task.
     """
     query = TasksQuery(id=id, user=user.id)
 
-    tasks = tasks_service.query(query=query)
-    if tasks:
-        return tasks[0]
-    raise HTTPException(status_code=404)
+    task = await tasks_service.aget(query=query)
+    if task is None:
+        raise HTTPException(status_code=404)
+
+    headers = {
+        "ETag": f'"{task.id}.{task.revision}"',
+        "Last-Modified": http_date(task.last_modified),
+    }
+    if is_not_modified(request, headers["ETag"], last_modified=task.last_modified):
+        return Response(status_code=304, headers=headers)
+    return PydanticJSONResponse(content=task, headers=headers)
@@ -1,9 +1,14 @@
+import datetime
+import typing
 import uuid
 
 from rq import Queue, Retry
+from starlette.concurrency import run_in_threadpool
 
-from services.tasks.models import Task, TaskCreate, TasksQuery
-from services.tasks.repo.base import TasksRepo
+from services.tasks.archive import TasksArchive
+from services.tasks.cache import TasksQueryCache
+from services.tasks.models import Task, TaskCreate, TasksQuery, TaskStats, TaskStatus
+from services.tasks.repo.base import AsyncTasksRepo, TasksRepo
 from services.tasks.utils import create_trello_task
 from services.trello.service import TrelloService
 from services.users.models import UserDB
@@ -16,20 +21,29 @@ class TasksService:
 
     Args:
         repo (TasksRepo): Repository for managing notes data.
+        async_repo (AsyncTasksRepo): Asyncio repository used by the async methods.
         trello_service (TrelloService): Service for getting and creating trello data.
+        archive (TasksArchive | None): Store of the tasks moved out of the repository.
+        cache (TasksQueryCache | None): Cache of the tasks lists queried by user.
     """
 
     def __init__(
         self,
         repo: TasksRepo,
+        async_repo: AsyncTasksRepo,
         users_service: UsersService,
         trello_service: TrelloService,
         queue: Queue,
+        archive: TasksArchive | None = None,
+        cache: TasksQueryCache | None = None,
     ):
         self.repo = repo
+        self.async_repo = async_repo
         self.users_service = users_service
         self.trello_service = trello_service
         self.queue = queue
+        self.archive = archive
+        self.cache = cache
 
     def create(self, task: TaskCreate, user: UserDB) -> Task:
         """
@@ -48,17 +62,62 @@ class TasksService:
         )
         return self.repo.create(task=task)
 
-    def query(self, query: TasksQuery) -> list[Task]:
+    def _cacheable(self, query: TasksQuery) -> bool:
+        return self.cache is not None and query.user is not None and query.id is None
+
+    def query(
+        self,
+        query: TasksQuery,
+        offset: int = 0,
+        limit: int | None = None,
+        version: int | None = None,
+    ) -> list[Task]:
         """
-        Queries the repository for tasks that match the given query.
+        Queries the repository for tasks that match the given query. Queries by user are
+        served from the cache while the collection version of the user tasks is the same.
 
         Args:
             query (Task): The query to match tasks against.
+            offset (int): The number of matching tasks to skip.
+            limit (int | None): The maximum number of tasks to return.
+            version (int | None): The collection version of the user tasks, when the
+                caller already read it. The tasks are then not older than the version.
 
         Returns:
             list[Task]: A list of tasks that match the given query.
         """
-        return self.repo.query(query=query)
+        if not self._cacheable(query):
+            return self.repo.query(
+                query=query, offset=offset, limit=limit, version=version
+            )
+
+        # Read before the tasks, so a write in between is never cached as older, and passed
+        # to the repo, so tasks from a replica behind it are never cached as newer
+        if version is None:
+            version = self.repo.collection_version(user=query.user)
+        tasks = self.cache.get(query, version, offset=offset, limit=limit)
+        if tasks is None:
+            tasks = self.repo.query(
+                query=query, offset=offset, limit=limit, version=version
+            )
+            self.cache.set(query, version, tasks, offset=offset, limit=limit)
+        return tasks
+
+    def iter_query(
+        self, query: TasksQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.Iterator[Task]:
+        """
+        Lazily yields the tasks that match the given query.
+
+        Args:
+            query (Task): The query to match tasks against.
+            offset (int): The number of matching tasks to skip.
+            limit (int | None): The maximum number of tasks to yield.
+
+        Yields:
+            Task: The tasks that match the given query.
+        """
+        return self.repo.iter_query(query=query, offset=offset, limit=limit)
 
     def get(self, query: TasksQuery) -> Task:
         """
@@ -68,19 +127,224 @@ class TasksService:
             query (TasksQuery): The query used to retrieve the task.
 
         Returns:
-            Task: The task retrieved from the repository.
+            Task: The task retrieved from the repository or the archive.
+        """
+        task = self.repo.get(query=query)
+        if task is None:
+            task = self._get_archived(query=query)
+        return task
+
+    def _get_archived(self, query: TasksQuery) -> Task | None:
+        """
+        Reads the task of the given query from the archive, only lookups by id can be
+        served from it.
         """
-        return self.repo.get(query=query)
+        if self.archive is None or query.id is None:
+            return None
+        task = self.archive.get(id=query.id)
+        if task is None:
+            return None
+        if any(getattr(task, key) != value for key, value in query.query_dict.items()):
+            return None
+        return task
 
-    def update(self, query: TasksQuery, data: Task) -> list[Task]:
+    def update(
+        self, query: TasksQuery, data: Task, returning: bool = True
+    ) -> list[Task]:
         """
         Updates a task in the repository based on the given query.
 
         Args:
             query (TasksQuery): The query used to retrieve the task.
             update (Task): The update to apply to the task.
+            returning (bool): Whether to return the updated tasks.
+
+        Returns:
+            list[Task]: A list of tasks that were updated, empty if not returning.
+        """
+        return self.repo.update(query=query, data=data, returning=returning)
+
+    def stats(self, user_id: uuid.UUID) -> TaskStats:
+        """
+        Retrieves the task counters of the given user.
+
+        Args:
+            user_id (uuid.UUID): The id of the user.
+
+        Returns:
+            TaskStats: The task counters of the user.
+        """
+        return self.repo.stats(user=user_id)
+
+    def collection_version(self, user_id: uuid.UUID) -> int:
+        """
+        Retrieves the version of the tasks of the given user, increased whenever one of
+        them is created, updated or archived.
+
+        Args:
+            user_id (uuid.UUID): The id of the user.
+
+        Returns:
+            int: The version of the tasks of the user.
+        """
+        return self.repo.collection_version(user=user_id)
+
+    def rebuild_stats(self) -> None:
+        """
+        Repairs the task counters of every user from the tasks stored in the repository.
+        """
+        self.repo.rebuild_stats()
+
+    def archive_tasks(self, before: datetime.datetime, batch_size: int = 1000) -> int:
+        """
+        Moves the tasks already created in trello and received before the given date
+        to the archive, in batches, so the repository only holds the recent tasks. A
+        batch is deleted once its segment is written, so an interrupted run at most
+        archives a batch twice.
+
+        Args:
+            before (datetime.datetime): The date the archived tasks were received before.
+            batch_size (int): The number of tasks moved per batch.
+
+        Returns:
+            int: The number of archived tasks.
+        """
+        if self.archive is None:
+            raise ValueError("The tasks service has no archive.")
+        query = TasksQuery(status=TaskStatus.CREATED)
+        archived = 0
+        while True:
+            tasks = self.repo.query_received_before(
+                query=query, before=before, limit=batch_size
+            )
+            if not tasks:
+                return archived
+            self.archive.write(tasks=tasks)
+            self.repo.delete_many(ids=[task.id for task in tasks])
+            archived += len(tasks)
+
+    async def acreate(self, task: TaskCreate, user: UserDB) -> Task:
+        """
+        Async version of `create`.
+
+        Args:
+            task (Task): The data for the task to be created.
+
+        Returns:
+            Task: The created task.
+        """
+        task = Task(**task.model_dump(), id=uuid.uuid4(), user=user.id)
+        await run_in_threadpool(
+            self.queue.enqueue,
+            create_trello_task,
+            task,
+            user,
+            retry=Retry(max=6, interval=30),
+        )
+        return await self.async_repo.create(task=task)
+
+    async def aquery(
+        self,
+        query: TasksQuery,
+        offset: int = 0,
+        limit: int | None = None,
+        version: int | None = None,
+    ) -> list[Task]:
+        """
+        Async version of `query`.
+
+        Args:
+            query (Task): The query to match tasks against.
+            offset (int): The number of matching tasks to skip.
+            limit (int | None): The maximum number of tasks to return.
+            version (int | None): The collection version of the user tasks, when the
+                caller already read it. The tasks are then not older than the version.
+
+        Returns:
+            list[Task]: A list of tasks that match the given query.
+        """
+        if not self._cacheable(query):
+            return await self.async_repo.query(
+                query=query, offset=offset, limit=limit, version=version
+            )
+
+        if version is None:
+            version = await self.async_repo.collection_version(user=query.user)
+        tasks = await self.cache.aget(query, version, offset=offset, limit=limit)
+        if tasks is None:
+            tasks = await self.async_repo.query(
+                query=query, offset=offset, limit=limit, version=version
+            )
+            await self.cache.aset(query, version, tasks, offset=offset, limit=limit)
+        return tasks
+
+    def aiter_query(
+        self, query: TasksQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.AsyncIterator[Task]:
+        """
+        Async version of `iter_query`.
+
+        Args:
+            query (Task): The query to match tasks against.
+            offset (int): The number of matching tasks to skip.
+            limit (int | None): The maximum number of tasks to yield.
+
+        Yields:
+            Task: The tasks that match the given query.
+        """
+        return self.async_repo.iter_query(query=query, offset=offset, limit=limit)
+
+    async def aget(self, query: TasksQuery) -> Task:
+        """
+        Async version of `get`.
+
+        Args:
+            query (TasksQuery): The query used to retrieve the task.
+
+        Returns:
+            Task: The task retrieved from the repository or the archive.
+        """
+        task = await self.async_repo.get(query=query)
+        if task is None and self.archive is not None:
+            task = await run_in_threadpool(self._get_archived, query=query)
+        return task
+
+    async def aupdate(
+        self, query: TasksQuery, data: Task, returning: bool = True
+    ) -> list[Task]:
+        """
+        Async version of `update`.
+
+        Args:
+            query (TasksQuery): The query used to retrieve the task.
+            update (Task): The update to apply to the task.
+            returning (bool): Whether to return the updated tasks.
+
+        Returns:
+            list[Task]: A list of tasks that were updated, empty if not returning.
+        """
+        return await self.async_repo.update(query=query, data=data, returning=returning)
+
+    async def astats(self, user_id: uuid.UUID) -> TaskStats:
+        """
+        Async version of `stats`.
+
+        Args:
+            user_id (uuid.UUID): The id of the user.
+
+        Returns:
+            TaskStats: The task counters of the user.
+        """
+        return await self.async_repo.stats(user=user_id)
+
+    async def acollection_version(self, user_id: uuid.UUID) -> int:
+        """
+        Async version of `collection_version`.
+
+        Args:
+            user_id (uuid.UUID): The id of the user.
 
         Returns:
-            list[Task]: A list of tasks that were updated.
+            int: The version of the tasks of the user.
         """
-        return self.repo.update(query=query, data=data)
+        return await self.async_repo.collection_version(user=user_id)
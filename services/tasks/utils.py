@@ -62,4 +62,6 @@ def create_trello_task(task: Task, user: UserDB):
         members=members,
     )
     update_data = TaskUpdate(**task.model_dump() | dict(status=TaskStatus.CREATED))
-    tasks_service.update(query=TasksQuery(id=task.id), data=update_data)
+    tasks_service.update(
+        query=TasksQuery(id=task.id), data=update_data, returning=False
+    )
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, status
 
 from api.setup import trello_service
-from services.auth.handlers import UserDependsType
+from services.auth.handlers import PrincipalDependsType, UserDependsType
 from services.trello.models import (
     TrelloAuthURLResponse,
     TrelloUserTokenSet,
@@ -16,7 +16,7 @@ router = APIRouter(tags=["trello"])
     status_code=status.HTTP_200_OK,
     response_model=TrelloAuthURLResponse,
 )
-def get_auth_url(_: UserDependsType):
+async def get_auth_url(_: PrincipalDependsType):
     """
     Returns the url needed to obtain access token from Trello
     """
@@ -28,10 +28,12 @@ def get_auth_url(_: UserDependsType):
     status_code=status.HTTP_200_OK,
     response_model=TrelloUserTokenSetResult,
 )
-def user_token_set(user: UserDependsType, data: TrelloUserTokenSet):
+async def user_token_set(user: UserDependsType, data: TrelloUserTokenSet):
     """
     Set relationshipt between local user and trello access token
     """
     return TrelloUserTokenSetResult(
-        result=trello_service.set_user_trello_token(user_id=user.id, token=data.token)
+        result=await trello_service.aset_user_trello_token(
+            user_id=user.id, token=data.token
+        )
     )
@@ -49,6 +49,23 @@ class TrelloService:
         updated = self.users_service.update(query=query, data=data)
         return bool(updated)
 
+    async def aset_user_trello_token(self, user_id: uuid.UUID, token: str) -> bool:
+        """
+        Async version of `set_user_trello_token`.
+
+        Args:
+            user_id (uuid.UUID): The ID of the user to set the token for.
+            token (str): The token to set.
+
+        Returns:
+            bool: True if the token was set, False otherwise.
+        """
+        query = UsersQuery(id=user_id)
+        key = TRELLO_TOKEN_USER_DATA_KEY
+        data = UserUpdate(external_data={key: token})
+        updated = await self.users_service.aupdate(query=query, data=data)
+        return bool(updated)
+
     def _request(
         self,
         token: str,
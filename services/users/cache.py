@@ -0,0 +1,242 @@
+import collections
+import threading
+import time
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from redis.exceptions import WatchError
+
+from services.users.models import UserPrincipal
+
+
+class PrincipalCache:
+    """
+    Bounded cache of the authenticated users, keyed by username, so authenticated
+    requests do not look the user up on every call.
+
+    The local tier is an LRU of `maxsize` users kept for `ttl` seconds. The optional
+    redis tier is shared by every worker and kept for `redis_ttl` seconds. Invalidating a
+    user removes it from the redis tier and the local tier of this process, the local
+    tiers of other processes expire after `ttl`, so keep it short.
+
+    A lookup that read the user before a concurrent update must not cache it after the
+    update invalidated it. Lookups take the `generation` of the cache before reading the
+    user and pass it to `set`, which skips the tiers invalidated since: the local tier
+    counts its invalidations, and the redis tier counts the invalidations of each user
+    in its own key, checked in the same transaction as the write.
+
+    Args:
+        maxsize (int): The maximum number of users in the local tier.
+        ttl (float): Seconds a user is kept in the local tier.
+        redis (Redis | None): The redis client of the shared tier.
+        async_redis (AsyncRedis | None): The asyncio redis client of the shared tier.
+        redis_ttl (int): Seconds a user is kept in the shared tier.
+    """
+
+    prefix = "principals"
+    generation_prefix = "principals_generation"
+    # Longer than any lookup, so a generation never expires while a lookup holds it
+    generation_ttl = 24 * 60 * 60
+
+    def __init__(
+        self,
+        maxsize: int = 10_000,
+        ttl: float = 5,
+        redis: Redis | None = None,
+        async_redis: AsyncRedis | None = None,
+        redis_ttl: int = 60,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.redis = redis
+        self.async_redis = async_redis
+        self.redis_ttl = redis_ttl
+        self._users: collections.OrderedDict[
+            str, tuple[UserPrincipal, float]
+        ] = collections.OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _key(self, username: str) -> str:
+        return f"{self.prefix}:{username}"
+
+    def _generation_key(self, username: str) -> str:
+        return f"{self.generation_prefix}:{username}"
+
+    def _get_local(self, username: str) -> UserPrincipal | None:
+        with self._lock:
+            entry = self._users.get(username)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._users[username]
+                return None
+            self._users.move_to_end(username)
+            return user
+
+    def _set_local(self, user: UserPrincipal, generation: int | None = None) -> None:
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._users[user.username] = (user, time.monotonic() + self.ttl)
+            self._users.move_to_end(user.username)
+            while len(self._users) > self.maxsize:
+                self._users.popitem(last=False)
+
+    def _invalidate_local(self, username: str) -> None:
+        with self._lock:
+            self._generation += 1
+            self._users.pop(username, None)
+
+    def get(self, username: str) -> UserPrincipal | None:
+        """
+        Returns the cached user with the given username, None on a miss.
+
+        Args:
+            username (str): The username of the user.
+        """
+        user = self._get_local(username)
+        if user is None and self.redis is not None:
+            generation = self._generation
+            data = self.redis.get(self._key(username))
+            if data is not None:
+                user = UserPrincipal.model_validate_json(data)
+                self._set_local(user, generation)
+        return user
+
+    def generation(self, username: str) -> tuple[int, int]:
+        """
+        Returns the generation of the cache for the given username, to take before
+        reading the user that is then cached with `set`.
+
+        Args:
+            username (str): The username of the user.
+        """
+        if self.redis is None:
+            return self._generation, 0
+        return self._generation, int(
+            self.redis.get(self._generation_key(username)) or 0
+        )
+
+    def set(
+        self, user: UserPrincipal, generation: tuple[int, int] | None = None
+    ) -> None:
+        """
+        Caches the given user, unless it was invalidated since the given generation.
+
+        Args:
+            user (UserPrincipal): The user to cache.
+            generation (tuple[int, int] | None): The generation taken before reading
+                the user, None to cache it anyway.
+        """
+        local, shared = generation if generation is not None else (None, None)
+        self._set_local(user, local)
+        if self.redis is None:
+            return
+        key, data = self._key(user.username), user.model_dump_json()
+        if shared is None:
+            self.redis.set(key, data, ex=self.redis_ttl)
+            return
+        generation_key = self._generation_key(user.username)
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(generation_key)
+                if int(pipe.get(generation_key) or 0) != shared:
+                    return
+                pipe.multi()
+                pipe.set(key, data, ex=self.redis_ttl)
+                pipe.execute()
+            except WatchError:
+                pass
+
+    def invalidate(self, username: str) -> None:
+        """
+        Removes the user with the given username from the cache.
+
+        Args:
+            username (str): The username of the user.
+        """
+        self._invalidate_local(username)
+        if self.redis is not None:
+            generation_key = self._generation_key(username)
+            with self.redis.pipeline() as pipe:
+                pipe.incr(generation_key)
+                pipe.expire(generation_key, self.generation_ttl)
+                pipe.delete(self._key(username))
+                pipe.execute()
+
+    async def aget(self, username: str) -> UserPrincipal | None:
+        """
+        Async version of `get`.
+
+        Args:
+            username (str): The username of the user.
+        """
+        user = self._get_local(username)
+        if user is None and self.async_redis is not None:
+            generation = self._generation
+            data = await self.async_redis.get(self._key(username))
+            if data is not None:
+                user = UserPrincipal.model_validate_json(data)
+                self._set_local(user, generation)
+        return user
+
+    async def ageneration(self, username: str) -> tuple[int, int]:
+        """
+        Async version of `generation`.
+
+        Args:
+            username (str): The username of the user.
+        """
+        if self.async_redis is None:
+            return self._generation, 0
+        shared = await self.async_redis.get(self._generation_key(username))
+        return self._generation, int(shared or 0)
+
+    async def aset(
+        self, user: UserPrincipal, generation: tuple[int, int] | None = None
+    ) -> None:
+        """
+        Async version of `set`.
+
+        Args:
+            user (UserPrincipal): The user to cache.
+            generation (tuple[int, int] | None): The generation taken before reading
+                the user, None to cache it anyway.
+        """
+        local, shared = generation if generation is not None else (None, None)
+        self._set_local(user, local)
+        if self.async_redis is None:
+            return
+        key, data = self._key(user.username), user.model_dump_json()
+        if shared is None:
+            await self.async_redis.set(key, data, ex=self.redis_ttl)
+            return
+        generation_key = self._generation_key(user.username)
+        async with self.async_redis.pipeline() as pipe:
+            try:
+                await pipe.watch(generation_key)
+                if int(await pipe.get(generation_key) or 0) != shared:
+                    return
+                pipe.multi()
+                pipe.set(key, data, ex=self.redis_ttl)
+                await pipe.execute()
+            except WatchError:
+                pass
+
+    async def ainvalidate(self, username: str) -> None:
+        """
+        Async version of `invalidate`.
+
+        Args:
+            username (str): The username of the user.
+        """
+        self._invalidate_local(username)
+        if self.async_redis is not None:
+            generation_key = self._generation_key(username)
+            async with self.async_redis.pipeline() as pipe:
+                pipe.incr(generation_key)
+                pipe.expire(generation_key, self.generation_ttl)
+                pipe.delete(self._key(username))
+                await pipe.execute()
@@ -1,9 +1,10 @@
-import json
 import typing
 import uuid
 
 from pydantic import BaseModel, Field
 
+from api.db.rows import dump_row
+
 
 class UserCreate(BaseModel):
     """
@@ -26,11 +27,13 @@ class UserDB(UserCreate):
         id (uuid.UUID): The unique identifier for the user.
         username (str): The username of the user to be created.
         password (str): The password of the user to be created.
+        token_version (int): The version of the access tokens, increased to revoke them.
     """
 
     id: uuid.UUID = Field(default_factory=uuid.uuid4)
     # This field is a flexible store to save data like trello user <-> local user relationship.
     external_data: typing.Optional[dict] = Field(default_factory=dict)
+    token_version: int = 0
 
 
 class UserRead(BaseModel):
@@ -47,6 +50,17 @@ class UserRead(BaseModel):
     external_data: dict
 
 
+class UserPrincipal(UserRead):
+    """
+    Represents an authenticated user, with the version of its access tokens.
+
+    Attributes:
+        token_version (int): The version of the access tokens, increased to revoke them.
+    """
+
+    token_version: int = 0
+
+
 class UsersQuery(BaseModel):
     """
     Represents a query for retrieving users from the database.
@@ -70,20 +84,20 @@ class UsersQuery(BaseModel):
         return {k: v for k, v in self.model_dump().items() if v is not None}
 
     @property
-    def query_json(self) -> str:
+    def query_json(self) -> dict:
         """
-        Returns a JSON representation of the query.
+        Returns a JSON compatible dictionary representation of the query.
 
         Returns:
-            str: The JSON representation of the query.
+            dict: The JSON compatible representation of the query.
         """
-        return {
-            k: v for k, v in json.loads(self.model_dump_json()).items() if v is not None
-        }
+        return dump_row(self, exclude_none=True)
 
 
 class UserUpdate(BaseModel):
     external_data: typing.Optional[dict] = None
+    token_version: typing.Optional[int] = None
+    password: typing.Optional[str] = None
 
     @property
     def update_dict(self) -> dict:
@@ -91,6 +105,4 @@ class UserUpdate(BaseModel):
 
     @property
     def update_json(self) -> dict:
-        return {
-            k: v for k, v in json.loads(self.model_dump_json()).items() if v is not None
-        }
+        return dump_row(self, exclude_none=True)
@@ -1,37 +1,68 @@
 import abc
+import typing
 
 from services.users.models import UserDB, UsersQuery, UserUpdate
 
 
+class UsernameTakenError(ValueError):
+    """Raised when a user is created with the username of another user."""
+
+
 class UsersRepo(abc.ABC):
     """Abstract base class for user repository."""
 
     @abc.abstractmethod
     def create(self, user: UserDB) -> UserDB:
         """
-        Creates a new user in the database.
+        Creates a new user in the database, checking the username is free in the same
+        atomic operation.
 
         Args:
             user (UserDB): The user to create.
 
+        Raises:
+            UsernameTakenError: If another user has the same username.
+
         Returns:
             UserDB: The created user.
         """
         pass
 
     @abc.abstractmethod
-    def query(self, query: UsersQuery) -> list[UserDB]:
+    def query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> list[UserDB]:
         """
         Queries the database for users that match the given query.
 
         Args:
             query (UsersQuery): The query to match users against.
+            offset (int): The number of matching users to skip.
+            limit (int | None): The maximum number of users to return.
 
         Returns:
             list[UserDB]: A list of users that match the given query.
         """
         pass
 
+    @abc.abstractmethod
+    def iter_query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.Iterator[UserDB]:
+        """
+        Lazily yields the users that match the given query, so callers can stop early
+        without every match being loaded.
+
+        Args:
+            query (UsersQuery): The query to match users against.
+            offset (int): The number of matching users to skip.
+            limit (int | None): The maximum number of users to yield.
+
+        Yields:
+            UserDB: The users that match the given query.
+        """
+        pass
+
     @abc.abstractmethod
     def get(self, query: UsersQuery) -> UserDB:
         """
@@ -46,14 +77,130 @@ class UsersRepo(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def update(self, query: UsersQuery, data: UserUpdate) -> UserDB:
+    def update(
+        self, query: UsersQuery, data: UserUpdate, returning: bool = True
+    ) -> list[UserDB]:
+        """
+        Update some user data upserting every field on data.
+
+        Args:
+            query (UsersQuery): The query used to retrieve the users to update.
+            returning (bool): Whether to return the updated users.
+
+        Returns:
+            list[UserDB]: The updated version of the users in db, empty if not returning.
+        """
+        pass
+
+    @abc.abstractmethod
+    def increment_token_version(self, query: UsersQuery) -> list[UserDB]:
+        """
+        Increases the token version of the users matching the query by one, atomically
+        for every user, so concurrent revocations all count.
+
+        Args:
+            query (UsersQuery): The query used to retrieve the users to update.
+
+        Returns:
+            list[UserDB]: The updated users.
+        """
+        pass
+
+
+class AsyncUsersRepo(abc.ABC):
+    """Abstract base class for asyncio user repository, the async variant of UsersRepo."""
+
+    @abc.abstractmethod
+    async def create(self, user: UserDB) -> UserDB:
+        """
+        Creates a new user in the database, checking the username is free in the same
+        atomic operation.
+
+        Args:
+            user (UserDB): The user to create.
+
+        Raises:
+            UsernameTakenError: If another user has the same username.
+
+        Returns:
+            UserDB: The created user.
+        """
+        pass
+
+    @abc.abstractmethod
+    async def query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> list[UserDB]:
+        """
+        Queries the database for users that match the given query.
+
+        Args:
+            query (UsersQuery): The query to match users against.
+            offset (int): The number of matching users to skip.
+            limit (int | None): The maximum number of users to return.
+
+        Returns:
+            list[UserDB]: A list of users that match the given query.
+        """
+        pass
+
+    @abc.abstractmethod
+    def iter_query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.AsyncIterator[UserDB]:
+        """
+        Lazily yields the users that match the given query, so callers can stop early
+        without every match being loaded.
+
+        Args:
+            query (UsersQuery): The query to match users against.
+            offset (int): The number of matching users to skip.
+            limit (int | None): The maximum number of users to yield.
+
+        Yields:
+            UserDB: The users that match the given query.
+        """
+        pass
+
+    @abc.abstractmethod
+    async def get(self, query: UsersQuery) -> UserDB:
+        """
+        Retrieves a user from the database based on the provided query.
+
+        Args:
+            query (UsersQuery): The query used to retrieve the user.
+
+        Returns:
+            UserDB: The user retrieved from the database.
+        """
+        pass
+
+    @abc.abstractmethod
+    async def update(
+        self, query: UsersQuery, data: UserUpdate, returning: bool = True
+    ) -> list[UserDB]:
         """
         Update some user data upserting every field on data.
 
+        Args:
+            query (UsersQuery): The query used to retrieve the users to update.
+            returning (bool): Whether to return the updated users.
+
+        Returns:
+            list[UserDB]: The updated version of the users in db, empty if not returning.
+        """
+        pass
+
+    @abc.abstractmethod
+    async def increment_token_version(self, query: UsersQuery) -> list[UserDB]:
+        """
+        Increases the token version of the users matching the query by one, atomically
+        for every user, so concurrent revocations all count.
+
         Args:
             query (UsersQuery): The query used to retrieve the users to update.
 
         Returns:
-            UserDB: The updated version of the user in db
+            list[UserDB]: The updated users.
         """
         pass
@@ -1,41 +1,107 @@
-from api.db.memory import InMemoryDB
+import typing
+
+from api.db.memory import CompactRowCodec, InMemoryDB
+from api.db.rows import RowHydrator
 from services.users.models import UserDB, UsersQuery, UserUpdate
-from services.users.repo.base import UsersRepo
+from services.users.repo.base import AsyncUsersRepo, UsernameTakenError, UsersRepo
 
 
 class UsersMemoryRepo(UsersRepo):
     table = "users"
+    hydrate = RowHydrator(UserDB, shared=True)
+    indexes = ["username"]
 
     def __init__(self, db: InMemoryDB) -> None:
         self.db = db
+        # Codecs count the rows holding their interned values, every database has its own
+        if self.table not in self.db.codecs:
+            codec = CompactRowCodec.from_model(UserDB)
+            self.db.set_codec(table=self.table, codec=codec)
+        for field in self.indexes:
+            self.db.create_index(table=self.table, field=field)
 
     def create(self, user: UserDB) -> UserDB:
-        return UserDB(**self.db.create(table=self.table, data=user.model_dump()))
+        try:
+            entry = self.db.create(
+                table=self.table, data=user.model_dump(), unique=["username"]
+            )
+        except ValueError as e:
+            raise UsernameTakenError("Username already taken.") from e
+        return self.hydrate(entry)
+
+    def iter_query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.Iterator[UserDB]:
+        for entry in self.db.iterate(
+            table=self.table, offset=offset, limit=limit, **query.query_dict
+        ):
+            yield self.hydrate(entry)
 
-    def _filter_entry(self, entry: dict, query: UsersQuery) -> bool:
-        if query.id and not query.id == entry.get("id"):
-            return False
+    def query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> list[UserDB]:
+        return list(self.iter_query(query=query, offset=offset, limit=limit))
 
-        if query.username and not query.username == entry.get("username"):
-            return False
+    def get(self, query: UsersQuery) -> UserDB:
+        return next(self.iter_query(query=query, limit=1), None)
 
-        return True
+    def update(
+        self, query: UsersQuery, data: UserUpdate, returning: bool = True
+    ) -> list[UserDB]:
+        updated = []
+        with self.db.lock(self.table):
+            for user in self.query(query=query):
+                entry = self.db.update(
+                    table=self.table, id=user.id, data=data.update_dict
+                )
+                if returning:
+                    updated.append(self.hydrate(entry))
+        return updated
 
-    def query(self, query: UsersQuery) -> list[UserDB]:
-        return [
-            UserDB(**entry)
-            for entry in self.db.list(table=self.table)
-            if self._filter_entry(entry=entry, query=query)
-        ]
+    def increment_token_version(self, query: UsersQuery) -> list[UserDB]:
+        updated = []
+        # The version is read under the lock, so concurrent increments all count
+        with self.db.lock(self.table):
+            for user in self.query(query=query):
+                entry = self.db.update(
+                    table=self.table,
+                    id=user.id,
+                    data={"token_version": user.token_version + 1},
+                )
+                updated.append(self.hydrate(entry))
+        return updated
 
-    def get(self, query: UsersQuery) -> UserDB:
-        result = self.query(query=query)
-        if not result:
-            return None
-        return result[0]
-
-    def update(self, query: UsersQuery, data: UserUpdate) -> list[UserDB]:
-        users = self.query(query=query)
-        for user in users:
-            self.db.update(table=self.table, id=user.id, data=data.update_dict)
-        return self.query(query=query)
+
+class AsyncUsersMemoryRepo(AsyncUsersRepo):
+    """
+    Asyncio interface of UsersMemoryRepo. In-memory operations never wait on I/O, so they
+    run directly on the event loop.
+    """
+
+    def __init__(self, db: InMemoryDB) -> None:
+        self.repo = UsersMemoryRepo(db=db)
+
+    async def create(self, user: UserDB) -> UserDB:
+        return self.repo.create(user=user)
+
+    async def query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> list[UserDB]:
+        return self.repo.query(query=query, offset=offset, limit=limit)
+
+    async def iter_query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.AsyncIterator[UserDB]:
+        for user in self.repo.iter_query(query=query, offset=offset, limit=limit):
+            yield user
+
+    async def get(self, query: UsersQuery) -> UserDB:
+        return self.repo.get(query=query)
+
+    async def update(
+        self, query: UsersQuery, data: UserUpdate, returning: bool = True
+    ) -> list[UserDB]:
+        return self.repo.update(query=query, data=data, returning=returning)
+
+    async def increment_token_version(self, query: UsersQuery) -> list[UserDB]:
+        return self.repo.increment_token_version(query=query)
@@ -0,0 +1,193 @@
+import json
+import time
+import typing
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+from api.db.rows import RowHydrator, dump_row
+from services.users.models import UserDB, UsersQuery, UserUpdate
+from services.users.repo.base import AsyncUsersRepo, UsernameTakenError, UsersRepo
+
+
+class RedisUsersQueries:
+    table = "users"
+    hydrate = RowHydrator(UserDB)
+
+    def _key(self, id) -> str:
+        return f"{self.table}:{id}"
+
+    @property
+    def _username_key(self) -> str:
+        return f"{self.table}:index:username"
+
+    @property
+    def _all_key(self) -> str:
+        return f"{self.table}:index:all"
+
+    @staticmethod
+    def _encode(row: dict) -> dict[str, str]:
+        return {field: json.dumps(value) for field, value in row.items()}
+
+    @staticmethod
+    def _decode(entry: dict[bytes, bytes]) -> dict:
+        return {field.decode(): json.loads(value) for field, value in entry.items()}
+
+    @staticmethod
+    def _page(ids: list, offset: int, limit: int | None) -> list:
+        return ids[offset : None if limit is None else offset + limit]
+
+    def _queue_create(self, pipe, row: dict) -> None:
+        # The username is reserved beforehand with HSETNX
+        pipe.hset(self._key(row["id"]), mapping=self._encode(row))
+        pipe.zadd(self._all_key, {row["id"]: time.time()})
+
+    def _queue_fetch(self, pipe, ids: list) -> None:
+        for id in ids:
+            pipe.hgetall(self._key(id.decode() if isinstance(id, bytes) else id))
+
+    def _queue_increment_token_version(self, pipe, ids: list) -> None:
+        # Versions are stored as JSON integers, which HINCRBY reads as numbers
+        for id in ids:
+            pipe.hincrby(self._key(id), "token_version", 1)
+        self._queue_fetch(pipe, ids)
+
+    def _rows(self, entries: list, query: dict) -> list[dict]:
+        rows = [self._decode(entry) for entry in entries if entry]
+        return [
+            row
+            for row in rows
+            if all(row.get(field) == value for field, value in query.items())
+        ]
+
+
+class RedisUsersRepo(RedisUsersQueries, UsersRepo):
+    def __init__(self, db: Redis):
+        self.db = db
+
+    def _ids(self, query: dict, offset: int, limit: int | None) -> list:
+        if "id" in query:
+            return self._page([query["id"]], offset, limit)
+        if "username" in query:
+            id = self.db.hget(self._username_key, query["username"])
+            return self._page([id] if id else [], offset, limit)
+        stop = -1 if limit is None else offset + limit - 1
+        return self.db.zrange(self._all_key, offset, stop)
+
+    def create(self, user: UserDB) -> UserDB:
+        if not self.db.hsetnx(self._username_key, user.username, str(user.id)):
+            raise UsernameTakenError("Username already taken.")
+        pipe = self.db.pipeline()
+        self._queue_create(pipe, dump_row(user))
+        try:
+            pipe.execute()
+        except BaseException:
+            self.db.hdel(self._username_key, user.username)
+            raise
+        return user
+
+    def iter_query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.Iterator[UserDB]:
+        yield from self.query(query=query, offset=offset, limit=limit)
+
+    def query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> list[UserDB]:
+        query = query.query_json
+        pipe = self.db.pipeline(transaction=False)
+        self._queue_fetch(pipe, self._ids(query, offset=offset, limit=limit))
+        return [self.hydrate(row) for row in self._rows(pipe.execute(), query)]
+
+    def get(self, query: UsersQuery) -> UserDB:
+        return next(iter(self.query(query=query, limit=1)), None)
+
+    def update(
+        self, query: UsersQuery, data: UserUpdate, returning: bool = True
+    ) -> list[UserDB]:
+        ids = [user.id for user in self.query(query=query)]
+        update = data.update_json
+        pipe = self.db.pipeline()
+        for id in ids:
+            if update:
+                pipe.hset(self._key(id), mapping=self._encode(update))
+        if returning:
+            self._queue_fetch(pipe, ids)
+        results = pipe.execute()
+        if not returning:
+            return []
+        return [self.hydrate(row) for row in self._rows(results[-len(ids) :], {})]
+
+    def increment_token_version(self, query: UsersQuery) -> list[UserDB]:
+        # Only existing users, HINCRBY would create the hash of a missing one
+        ids = [user.id for user in self.query(query=query)]
+        pipe = self.db.pipeline()
+        self._queue_increment_token_version(pipe, ids)
+        results = pipe.execute()
+        return [self.hydrate(row) for row in self._rows(results[len(ids) :], {})]
+
+
+class AsyncRedisUsersRepo(RedisUsersQueries, AsyncUsersRepo):
+    def __init__(self, db: AsyncRedis):
+        self.db = db
+
+    async def _ids(self, query: dict, offset: int, limit: int | None) -> list:
+        if "id" in query:
+            return self._page([query["id"]], offset, limit)
+        if "username" in query:
+            id = await self.db.hget(self._username_key, query["username"])
+            return self._page([id] if id else [], offset, limit)
+        stop = -1 if limit is None else offset + limit - 1
+        return await self.db.zrange(self._all_key, offset, stop)
+
+    async def create(self, user: UserDB) -> UserDB:
+        if not await self.db.hsetnx(self._username_key, user.username, str(user.id)):
+            raise UsernameTakenError("Username already taken.")
+        pipe = self.db.pipeline()
+        self._queue_create(pipe, dump_row(user))
+        try:
+            await pipe.execute()
+        except BaseException:
+            await self.db.hdel(self._username_key, user.username)
+            raise
+        return user
+
+    async def iter_query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.AsyncIterator[UserDB]:
+        for user in await self.query(query=query, offset=offset, limit=limit):
+            yield user
+
+    async def query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> list[UserDB]:
+        query = query.query_json
+        pipe = self.db.pipeline(transaction=False)
+        self._queue_fetch(pipe, await self._ids(query, offset=offset, limit=limit))
+        return [self.hydrate(row) for row in self._rows(await pipe.execute(), query)]
+
+    async def get(self, query: UsersQuery) -> UserDB:
+        return next(iter(await self.query(query=query, limit=1)), None)
+
+    async def update(
+        self, query: UsersQuery, data: UserUpdate, returning: bool = True
+    ) -> list[UserDB]:
+        ids = [user.id for user in await self.query(query=query)]
+        update = data.update_json
+        pipe = self.db.pipeline()
+        for id in ids:
+            if update:
+                pipe.hset(self._key(id), mapping=self._encode(update))
+        if returning:
+            self._queue_fetch(pipe, ids)
+        results = await pipe.execute()
+        if not returning:
+            return []
+        return [self.hydrate(row) for row in self._rows(results[-len(ids) :], {})]
+
+    async def increment_token_version(self, query: UsersQuery) -> list[UserDB]:
+        ids = [user.id for user in await self.query(query=query)]
+        pipe = self.db.pipeline()
+        self._queue_increment_token_version(pipe, ids)
+        results = await pipe.execute()
+        return [self.hydrate(row) for row in self._rows(results[len(ids) :], {})]
@@ -1,37 +1,158 @@
-import json
+import typing
 
-from rethinkdb import RethinkDB
+from rethinkdb import r
 
-from api.db.rethinkdb import get_or_create_table
+from api.db.rethinkdb import SCHEMA, AsyncConnectionPool, ConnectionPool, select
+from api.db.rows import RowHydrator, dump_row
 from services.users.models import UserDB, UsersQuery, UserUpdate
-from services.users.repo.base import UsersRepo
+from services.users.repo.base import AsyncUsersRepo, UsernameTakenError, UsersRepo
 
 
-class RethinkDBUsersRepo(UsersRepo):
+class RethinkDBUsersQueries:
     table = "users"
+    hydrate = RowHydrator(UserDB)
+    # Keyed by username, so inserting a taken username fails on the primary key
+    usernames_table = "usernames"
 
-    def __init__(self, db: RethinkDB):
+    table_ref = r.table(table)
+    usernames_table_ref = r.table(usernames_table)
+    indexes = SCHEMA[table]
+
+    def _insert(self, user: UserDB):
+        """
+        Returns the query reserving the username and inserting the user only when the
+        reservation succeeds, in a single round trip. It inserts one row, unless the
+        username is taken.
+
+        Args:
+            user (UserDB): The user to insert.
+        """
+        row = dump_row(user)
+        reservation = {"id": row["username"], "user": row["id"]}
+        return self.usernames_table_ref.insert(reservation).do(
+            lambda result: r.branch(
+                result["inserted"].eq(1), self.table_ref.insert(row), result
+            )
+        )
+
+    @staticmethod
+    def _check_inserted(result: dict) -> None:
+        if result["inserted"] != 1:
+            raise UsernameTakenError("Username already taken.")
+
+    def _select(self, query: UsersQuery, offset: int = 0, limit: int | None = None):
+        # Ordered by the primary key, so pages are stable
+        selection = select(
+            self.table_ref, query=query.query_json, indexes=self.indexes, order_by="id"
+        )
+        if offset:
+            selection = selection.skip(offset)
+        if limit is not None:
+            selection = selection.limit(limit)
+        return selection
+
+    def _update(self, query: UsersQuery, data: UserUpdate, returning: bool):
+        return self._select(query).update(
+            data.update_json,
+            non_atomic=True,
+            return_changes="always" if returning else False,
+        )
+
+    def _increment_token_version(self, query: UsersQuery):
+        # A deterministic update, so it runs atomically on every document
+        return self._select(query).update(
+            {"token_version": r.row["token_version"].default(0).add(1)},
+            return_changes="always",
+        )
+
+
+class RethinkDBUsersRepo(RethinkDBUsersQueries, UsersRepo):
+    def __init__(self, db: ConnectionPool):
         self.db = db
 
     def create(self, user: UserDB) -> UserDB:
-        get_or_create_table(self.table).insert(json.loads(user.model_dump_json())).run(
-            self.db
-        )
+        with self.db.connection() as connection:
+            result = self._insert(user).run(connection)
+        self._check_inserted(result)
         return user
 
-    def query(self, query: UsersQuery) -> list[UserDB]:
-        return [
-            UserDB(**entry)
-            for entry in get_or_create_table(self.table)
-            .filter(query.query_json)
-            .run(self.db)
-        ]
+    def iter_query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.Iterator[UserDB]:
+        with self.db.connection() as connection:
+            cursor = self._select(query, offset=offset, limit=limit).run(connection)
+            try:
+                for entry in cursor:
+                    yield self.hydrate(entry)
+            finally:
+                cursor.close()
+
+    def query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> list[UserDB]:
+        with self.db.connection() as connection:
+            selection = self._select(query, offset=offset, limit=limit)
+            return [self.hydrate(entry) for entry in selection.run(connection)]
 
     def get(self, query: UsersQuery) -> UserDB:
-        return next(iter(self.query(query=query)), None)
+        return next(iter(self.query(query=query, limit=1)), None)
+
+    def update(
+        self, query: UsersQuery, data: UserUpdate, returning: bool = True
+    ) -> list[UserDB]:
+        with self.db.connection() as connection:
+            result = self._update(query, data=data, returning=returning).run(connection)
+        return [self.hydrate(change["new_val"]) for change in result.get("changes", [])]
+
+    def increment_token_version(self, query: UsersQuery) -> list[UserDB]:
+        with self.db.connection() as connection:
+            result = self._increment_token_version(query).run(connection)
+        return [self.hydrate(change["new_val"]) for change in result.get("changes", [])]
+
+
+class AsyncRethinkDBUsersRepo(RethinkDBUsersQueries, AsyncUsersRepo):
+    def __init__(self, db: AsyncConnectionPool):
+        self.db = db
+
+    async def create(self, user: UserDB) -> UserDB:
+        async with self.db.connection() as connection:
+            result = await self._insert(user).run(connection)
+        self._check_inserted(result)
+        return user
+
+    async def iter_query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.AsyncIterator[UserDB]:
+        async with self.db.connection() as connection:
+            selection = self._select(query, offset=offset, limit=limit)
+            cursor = await selection.run(connection)
+            try:
+                async for entry in cursor:
+                    yield self.hydrate(entry)
+            finally:
+                await cursor.close()
+
+    async def query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> list[UserDB]:
+        async with self.db.connection() as connection:
+            selection = self._select(query, offset=offset, limit=limit)
+            cursor = await selection.run(connection)
+            return [self.hydrate(entry) async for entry in cursor]
+
+    async def get(self, query: UsersQuery) -> UserDB:
+        return next(iter(await self.query(query=query, limit=1)), None)
+
+    async def update(
+        self, query: UsersQuery, data: UserUpdate, returning: bool = True
+    ) -> list[UserDB]:
+        async with self.db.connection() as connection:
+            result = await self._update(query, data=data, returning=returning).run(
+                connection
+            )
+        return [self.hydrate(change["new_val"]) for change in result.get("changes", [])]
 
-    def update(self, query: UsersQuery, data: UserUpdate) -> list[UserDB]:
-        get_or_create_table(self.table).filter(query.query_json).update(
-            data.update_json, non_atomic=True
-        ).run(self.db)
-        return self.query(query=query)
+    async def increment_token_version(self, query: UsersQuery) -> list[UserDB]:
+        async with self.db.connection() as connection:
+            result = await self._increment_token_version(query).run(connection)
+        return [self.hydrate(change["new_val"]) for change in result.get("changes", [])]
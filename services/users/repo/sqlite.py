@@ -0,0 +1,133 @@
+import json
+import sqlite3
+import typing
+
+from starlette.concurrency import run_in_threadpool
+
+from api.db.rows import RowHydrator, dump_row
+from api.db.sqlite import SQLitePool
+from services.users.models import UserDB, UsersQuery, UserUpdate
+from services.users.repo.base import AsyncUsersRepo, UsernameTakenError, UsersRepo
+
+INSERT_USER = """
+    INSERT INTO users (id, username, password, external_data, token_version)
+    VALUES (:id, :username, :password, :external_data, :token_version)
+"""
+
+
+class SQLiteUsersRepo(UsersRepo):
+    hydrate = RowHydrator(UserDB)
+
+    def __init__(self, db: SQLitePool):
+        self.db = db
+
+    @classmethod
+    def _decode(cls, row: sqlite3.Row) -> UserDB:
+        row = dict(row)
+        row["external_data"] = json.loads(row["external_data"] or "{}")
+        return cls.hydrate(row)
+
+    @staticmethod
+    def _where(query: UsersQuery) -> tuple[str, list]:
+        query = query.query_json
+        if not query:
+            return "", []
+        clause = " AND ".join(f"{field} = ?" for field in query)
+        return f" WHERE {clause}", list(query.values())
+
+    def create(self, user: UserDB) -> UserDB:
+        row = dump_row(user)
+        row["external_data"] = json.dumps(row["external_data"])
+        try:
+            self.db.connection.execute(INSERT_USER, row)
+        except sqlite3.IntegrityError as e:
+            raise UsernameTakenError("Username already taken.") from e
+        return user
+
+    def iter_query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.Iterator[UserDB]:
+        where, params = self._where(query)
+        cursor = self.db.connection.execute(
+            f"SELECT * FROM users{where} ORDER BY rowid LIMIT ? OFFSET ?",
+            [*params, -1 if limit is None else limit, offset],
+        )
+        try:
+            for row in cursor:
+                yield self._decode(row)
+        finally:
+            cursor.close()
+
+    def query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> list[UserDB]:
+        return list(self.iter_query(query=query, offset=offset, limit=limit))
+
+    def get(self, query: UsersQuery) -> UserDB:
+        return next(iter(self.query(query=query, limit=1)), None)
+
+    def update(
+        self, query: UsersQuery, data: UserUpdate, returning: bool = True
+    ) -> list[UserDB]:
+        update = data.update_json
+        if "external_data" in update:
+            update["external_data"] = json.dumps(update["external_data"])
+        if not update:
+            return self.query(query=query) if returning else []
+
+        where, params = self._where(query)
+        assignments = ", ".join(f"{field} = ?" for field in update)
+        rows = self.db.connection.execute(
+            f"UPDATE users SET {assignments}{where} RETURNING *",
+            [*update.values(), *params],
+        ).fetchall()
+        if not returning:
+            return []
+        return [self._decode(row) for row in rows]
+
+    def increment_token_version(self, query: UsersQuery) -> list[UserDB]:
+        where, params = self._where(query)
+        rows = self.db.connection.execute(
+            f"UPDATE users SET token_version = token_version + 1{where} RETURNING *",
+            params,
+        ).fetchall()
+        return [self._decode(row) for row in rows]
+
+
+class AsyncSQLiteUsersRepo(AsyncUsersRepo):
+    """
+    Asyncio interface of SQLiteUsersRepo. sqlite calls block, so they run in the
+    threadpool, where every thread uses its own connection.
+    """
+
+    def __init__(self, db: SQLitePool) -> None:
+        self.repo = SQLiteUsersRepo(db=db)
+
+    async def create(self, user: UserDB) -> UserDB:
+        return await run_in_threadpool(self.repo.create, user=user)
+
+    async def query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> list[UserDB]:
+        return await run_in_threadpool(
+            self.repo.query, query=query, offset=offset, limit=limit
+        )
+
+    async def iter_query(
+        self, query: UsersQuery, offset: int = 0, limit: int | None = None
+    ) -> typing.AsyncIterator[UserDB]:
+        for user in await self.query(query=query, offset=offset, limit=limit):
+            yield user
+
+    async def get(self, query: UsersQuery) -> UserDB:
+        return await run_in_threadpool(self.repo.get, query=query)
+
+    async def update(
+        self, query: UsersQuery, data: UserUpdate, returning: bool = True
+    ) -> list[UserDB]:
+        return await run_in_threadpool(
+            self.repo.update, query=query, data=data, returning=returning
+        )
+
+    async def increment_token_version(self, query: UsersQuery) -> list[UserDB]:
+        return await run_in_threadpool(self.repo.increment_token_version, query=query)
@@ -2,9 +2,10 @@ from fastapi import APIRouter, HTTPException, status
 
 from api.setup import users_service
 from services.auth.handlers import UserDependsType
-from services.auth.models import Token
+from services.auth.models import Token, TokenData
 from services.auth.service import AuthService
 from services.users.models import UserCreate, UserRead
+from services.users.repo.base import UsernameTakenError
 
 router = APIRouter(tags=["users"])
 
@@ -14,7 +15,7 @@ router = APIRouter(tags=["users"])
     status_code=status.HTTP_201_CREATED,
     response_model=UserRead,
 )
-def create_user(user: UserCreate):
+async def create_user(user: UserCreate):
     """
     Creates a new user with the given user data.
 
@@ -25,8 +26,8 @@ def create_user(user: UserCreate):
         UserRead: The newly created user.
     """
     try:
-        user = users_service.create(user=user)
-    except ValueError as e:
+        user = await users_service.acreate(user=user)
+    except UsernameTakenError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Username already taken"
         ) from e
@@ -38,7 +39,7 @@ def create_user(user: UserCreate):
     status_code=status.HTTP_200_OK,
     response_model=Token,
 )
-def login(data: UserCreate) -> Token:
+async def login(data: UserCreate) -> Token:
     """
     Authenticates a user and returns an access token.
 
@@ -48,19 +49,22 @@ def login(data: UserCreate) -> Token:
     Returns:
         Token: An access token for the authenticated user.
     """
-    user = users_service.authenticate(data.username, data.password)
+    user = await users_service.aauthenticate(data.username, data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = AuthService.create_access_token(data={"sub": user.username})
+    token_data = TokenData(
+        username=user.username, id=user.id, token_version=user.token_version
+    )
+    access_token = AuthService.create_access_token(data=token_data.claims)
     return Token(access_token=access_token)
 
 
 @router.get("/me/", response_model=UserRead)
-def me(current_user: UserDependsType):
+async def me(current_user: UserDependsType):
     """
     Returns the current user.
 
@@ -1,30 +1,57 @@
+import uuid
+
 from services.auth.service import AuthService
-from services.users.models import UserCreate, UserDB, UserRead, UsersQuery, UserUpdate
-from services.users.repo.base import UsersRepo
+from services.users.cache import PrincipalCache
+from services.users.models import (
+    UserCreate,
+    UserDB,
+    UserPrincipal,
+    UserRead,
+    UsersQuery,
+    UserUpdate,
+)
+from services.users.repo.base import AsyncUsersRepo, UsersRepo
 
 
 class UsersService:
     """
     Service class for managing user-related operations.
+
+    Args:
+        repo (UsersRepo): Repository for managing users data.
+        async_repo (AsyncUsersRepo): Asyncio repository used by the async methods.
+        cache (PrincipalCache | None): Cache of the users looked up by authentication.
     """
 
-    def __init__(self, repo: UsersRepo) -> None:
+    def __init__(
+        self,
+        repo: UsersRepo,
+        async_repo: AsyncUsersRepo,
+        cache: PrincipalCache | None = None,
+    ) -> None:
         self.repo = repo
+        self.async_repo = async_repo
+        self.cache = cache
+
+    @staticmethod
+    def _principal(user: UserDB | None) -> UserPrincipal | None:
+        return None if user is None else UserPrincipal(**user.model_dump())
 
     def create(self, user: UserCreate) -> UserRead:
         """
-        Creates a new user with the given username and password.
+        Creates a new user with the given username and password. The repository checks
+        the username is free while inserting the user, so concurrent registrations of
+        the same username can not both succeed.
 
         Args:
             user (UserCreate): The user data to create.
 
         Returns:
             UserRead: The created user data.
-        """
-        query = UsersQuery(username=user.username)
-        if self.repo.query(query=query):
-            raise ValueError("Username already taken.")
 
+        Raises:
+            UsernameTakenError: If another user has the same username.
+        """
         user = UserDB(
             username=user.username,
             # hash before storing
@@ -50,20 +77,67 @@ class UsersService:
             return None
         return UserRead(**user.model_dump())
 
-    def update(self, query: UsersQuery, data: UserUpdate) -> list[UserDB]:
+    def get_principal(self, username: str) -> UserPrincipal | None:
+        """
+        Retrieves the authenticated user with the given username, from the cache when
+        there is one.
+
+        Args:
+            username (str): The username of the authenticated user.
+
+        Returns:
+            UserPrincipal | None: The user, or None if no user is found.
+        """
+        query = UsersQuery(username=username)
+        if self.cache is None:
+            return self._principal(self.repo.get(query=query))
+        user = self.cache.get(username)
+        if user is None:
+            # Taken before the read, so a user updated meanwhile is not cached
+            generation = self.cache.generation(username)
+            user = self._principal(self.repo.get(query=query))
+            if user is not None:
+                self.cache.set(user, generation=generation)
+        return user
+
+    def update(
+        self, query: UsersQuery, data: UserUpdate, returning: bool = True
+    ) -> list[UserDB]:
         """
         Update users records in the database.
 
         Args:
             query (UsersQuery): The query used to filter users to update.
             data (UserUpdate): The data to be update on users.
+            returning (bool): Whether to return the updated users.
 
         Returns:
-            list[UserRead]: The updated users list.
+            list[UserRead]: The updated users list, empty if not returning.
         """
-        return self.repo.update(query=query, data=data)
+        if self.cache is None:
+            return self.repo.update(query=query, data=data, returning=returning)
+        # The updated users tell which cached users are stale
+        users = self.repo.update(query=query, data=data)
+        for user in users:
+            self.cache.invalidate(user.username)
+        return users if returning else []
 
-    def authenticate(self, username: str, password: str) -> UserRead | None:
+    def revoke_tokens(self, user_id: uuid.UUID) -> None:
+        """
+        Revokes the access tokens issued to a user by increasing its token version.
+        Endpoints that read the user reject the revoked tokens right away, endpoints
+        trusting the token claims alone accept them until they expire.
+
+        Args:
+            user_id (uuid.UUID): The id of the user.
+        """
+        # Increased by the repository, so concurrent revocations are never lost
+        users = self.repo.increment_token_version(query=UsersQuery(id=user_id))
+        if self.cache is not None:
+            for user in users:
+                self.cache.invalidate(user.username)
+
+    def authenticate(self, username: str, password: str) -> UserPrincipal | None:
         """
         Authenticates a user with the given username and password.
 
@@ -72,16 +146,149 @@ class UsersService:
             password (str): The password of the user to authenticate.
 
         Returns:
-            UserRead | None: The authenticated user, or None if authentication failed.
+            UserPrincipal | None: The authenticated user, or None if authentication
+                failed.
         """
         query = UsersQuery(username=username)
         user = self.repo.get(query=query)
         if not user:
             return None
 
-        if not AuthService.verify_password(
+        valid, new_hash = AuthService.verify_and_update_password(
             plain_password=password, hashed_password=user.password
-        ):
+        )
+        if not valid:
             return None
+        if new_hash is not None:
+            self.update(
+                query=UsersQuery(id=user.id),
+                data=UserUpdate(password=new_hash),
+                returning=False,
+            )
 
+        return UserPrincipal(**user.model_dump())
+
+    async def acreate(self, user: UserCreate) -> UserRead:
+        """
+        Async version of `create`. Password hashing is CPU bound, so it runs in the
+        password processes instead of blocking the event loop.
+
+        Args:
+            user (UserCreate): The user data to create.
+
+        Returns:
+            UserRead: The created user data.
+
+        Raises:
+            UsernameTakenError: If another user has the same username.
+        """
+        user = UserDB(
+            username=user.username,
+            password=await AuthService.ahash_password(user.password),
+        )
+        user = (await self.async_repo.create(user)).model_dump()
+        return UserRead(**user)
+
+    async def aget(self, query: UsersQuery) -> UserRead:
+        """
+        Async version of `get`.
+
+        Args:
+            query (UsersQuery): The query used to retrieve the user.
+
+        Returns:
+            UserRead: The user that matches the query, or None if no user is found.
+        """
+        user = await self.async_repo.get(query=query)
+        if user is None:
+            return None
         return UserRead(**user.model_dump())
+
+    async def aget_principal(self, username: str) -> UserPrincipal | None:
+        """
+        Async version of `get_principal`.
+
+        Args:
+            username (str): The username of the authenticated user.
+
+        Returns:
+            UserPrincipal | None: The user, or None if no user is found.
+        """
+        query = UsersQuery(username=username)
+        if self.cache is None:
+            return self._principal(await self.async_repo.get(query=query))
+        user = await self.cache.aget(username)
+        if user is None:
+            generation = await self.cache.ageneration(username)
+            user = self._principal(await self.async_repo.get(query=query))
+            if user is not None:
+                await self.cache.aset(user, generation=generation)
+        return user
+
+    async def aupdate(
+        self, query: UsersQuery, data: UserUpdate, returning: bool = True
+    ) -> list[UserDB]:
+        """
+        Async version of `update`.
+
+        Args:
+            query (UsersQuery): The query used to filter users to update.
+            data (UserUpdate): The data to be update on users.
+            returning (bool): Whether to return the updated users.
+
+        Returns:
+            list[UserRead]: The updated users list, empty if not returning.
+        """
+        if self.cache is None:
+            return await self.async_repo.update(
+                query=query, data=data, returning=returning
+            )
+        users = await self.async_repo.update(query=query, data=data)
+        for user in users:
+            await self.cache.ainvalidate(user.username)
+        return users if returning else []
+
+    async def arevoke_tokens(self, user_id: uuid.UUID) -> None:
+        """
+        Async version of `revoke_tokens`.
+
+        Args:
+            user_id (uuid.UUID): The id of the user.
+        """
+        users = await self.async_repo.increment_token_version(
+            query=UsersQuery(id=user_id)
+        )
+        if self.cache is not None:
+            for user in users:
+                await self.cache.ainvalidate(user.username)
+
+    async def aauthenticate(self, username: str, password: str) -> UserPrincipal | None:
+        """
+        Async version of `authenticate`. The password check runs in the password
+        processes.
+
+        Args:
+            username (str): The username of the user to authenticate.
+            password (str): The password of the user to authenticate.
+
+        Returns:
+            UserPrincipal | None: The authenticated user, or None if authentication
+                failed.
+        """
+        user = await self.async_repo.get(query=UsersQuery(username=username))
+        if not user:
+            return None
+
+        valid, new_hash = await AuthService.averify_and_update_password(
+            plain_password=password, hashed_password=user.password
+        )
+        if not valid:
+            return None
+        if new_hash is not None:
+            await self.aupdate(
+                query=UsersQuery(id=user.id),
+                data=UserUpdate(password=new_hash),
+                returning=False,
+            )
+
+        return UserPrincipal(**user.model_dump())
@@ -0,0 +1,7 @@
+import os
+import unittest
+
+# Benchmarks take seconds and print their numbers, so the default run skips them
+ENABLED = os.environ.get("BENCHMARKS") == "1"
+
+benchmark = unittest.skipUnless(ENABLED, "set BENCHMARKS=1 to run the benchmarks")
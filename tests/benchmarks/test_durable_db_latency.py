@@ -0,0 +1,44 @@
+import statistics
+import tempfile
+import time
+import unittest
+import uuid
+
+from api.db.durable import DurableInMemoryDB
+from api.db.memory import InMemoryDB
+from tests.benchmarks import benchmark
+
+WRITES = 20_000
+
+
+@benchmark
+class DurableInMemoryDBLatencyBenchmark(unittest.TestCase):
+    """
+    Compares the write latency of the durable and the plain InMemoryDB. Run with
+    `BENCHMARKS=1 pytest -s tests/benchmarks` to see the numbers.
+    """
+
+    def measure(self, db: InMemoryDB) -> list[float]:
+        latencies = []
+        for _ in range(WRITES):
+            row = dict(id=uuid.uuid4(), user=uuid.uuid4(), status="PENDING", total=1)
+            start = time.perf_counter()
+            db.create("tasks", row)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    def test_write_latency(self):
+        with tempfile.TemporaryDirectory() as path:
+            durable = DurableInMemoryDB(path)
+            try:
+                results = {
+                    "memory": self.measure(InMemoryDB()),
+                    "durable": self.measure(durable),
+                }
+            finally:
+                durable.close()
+
+        for name, latencies in results.items():
+            p50 = statistics.median(latencies) * 1e6
+            p99 = statistics.quantiles(latencies, n=100)[98] * 1e6
+            print(f"\n{name}: p50 {p50:.1f}us, p99 {p99:.1f}us per write")
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import os
+import time
+import unittest
+import uuid
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from starlette.responses import JSONResponse
+
+from api.responses import PydanticJSONResponse
+from services.tasks.models import Task, TaskStatus
+from tests.benchmarks import benchmark
+
+ROWS = 1_000
+ROUNDS = int(os.environ.get("BENCHMARK_ROUNDS", 20))
+
+
+@benchmark
+class JSONResponseBenchmark(unittest.TestCase):
+    """
+    Compares the encoding of a 1k tasks list response: FastAPI validating it against the
+    response model and encoding it with `jsonable_encoder` and `json.dumps`, FastAPI
+    encoding it without validation, and `PydanticJSONResponse`. Run with
+    `BENCHMARKS=1 pytest -s tests/benchmarks` to see the numbers. The bodies are
+    checked by tests/test_responses.py.
+    """
+
+    def setUp(self) -> None:
+        user = uuid.uuid4()
+        self.tasks = [
+            Task(
+                id=uuid.uuid4(),
+                user=user,
+                title=f"Task {i}",
+                description="Description",
+                status=TaskStatus.CREATED,
+                trello_data={
+                    "id": str(i),
+                    "labels": [{"name": "label", "color": "red"}],
+                },
+            )
+            for i in range(ROWS)
+        ]
+
+    def measure(self, encode) -> tuple[float, bytes]:
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            body = encode()
+        return ROWS * ROUNDS / (time.perf_counter() - start), body
+
+    def test_task_list_throughput(self):
+        field = create_response_field(name="response", type_=list[Task])
+
+        def validated():
+            content = asyncio.run(
+                serialize_response(field=field, response_content=self.tasks)
+            )
+            return JSONResponse(content).body
+
+        def encoded():
+            content = asyncio.run(serialize_response(response_content=self.tasks))
+            return JSONResponse(content).body
+
+        def pydantic_core():
+            return PydanticJSONResponse(self.tasks).body
+
+        results = {
+            "validated": self.measure(validated),
+            "jsonable_encoder": self.measure(encoded),
+            "pydantic_core": self.measure(pydantic_core),
+        }
+        for name, (throughput, body) in results.items():
+            print(f"\n{name}: {throughput:,.0f} tasks/s")
+            self.assertEqual(json.loads(body), json.loads(results["validated"][1]))
+        fastest_fastapi = max(results["validated"][0], results["jsonable_encoder"][0])
+        self.assertGreater(results["pydantic_core"][0], fastest_fastapi)
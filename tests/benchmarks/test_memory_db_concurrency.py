@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+import unittest
+import uuid
+
+from api.db.memory import InMemoryDB
+from tests.benchmarks import benchmark
+
+DURATION = float(os.environ.get("BENCHMARK_SECONDS", 0.5))
+ROWS = 10_000
+USERS = 100
+
+
+@benchmark
+class InMemoryDBConcurrencyBenchmark(unittest.TestCase):
+    """
+    Measures read throughput while writer threads insert and update rows of the same
+    table. Run with `BENCHMARKS=1 pytest -s tests/benchmarks` to see the numbers, and
+    raise BENCHMARK_SECONDS for steadier ones.
+    """
+
+    def setUp(self) -> None:
+        self.db = InMemoryDB()
+        self.db.create_index("tasks", "user")
+        self.users = [str(uuid.uuid4()) for _ in range(USERS)]
+        self.ids = []
+        for i in range(ROWS):
+            row = dict(id=str(uuid.uuid4()), user=self.users[i % USERS], status=0)
+            self.ids.append(self.db.create("tasks", row)["id"])
+
+    def run_mixed_load(self, readers: int, writers: int) -> dict[str, int]:
+        counts = {"reads": 0, "writes": 0}
+        errors = []
+        stop = threading.Event()
+
+        def read(index: int):
+            reads = 0
+            user = self.users[index % USERS]
+            try:
+                while not stop.is_set():
+                    self.db.find("tasks", user=user)
+                    # Full scans iterate the whole table while it grows
+                    next(self.db.iterate("tasks", offset=ROWS // 2), None)
+                    reads += 2
+            except Exception as e:
+                errors.append(e)
+            counts["reads"] += reads
+
+        def write(index: int):
+            writes = 0
+            try:
+                while not stop.is_set():
+                    self.db.create(
+                        "tasks",
+                        dict(id=str(uuid.uuid4()), user=self.users[index], status=0),
+                    )
+                    self.db.update(
+                        "tasks", id=self.ids[writes % ROWS], data=dict(status=writes)
+                    )
+                    writes += 2
+            except Exception as e:
+                errors.append(e)
+            counts["writes"] += writes
+
+        threads = [threading.Thread(target=read, args=(i,)) for i in range(readers)]
+        threads += [threading.Thread(target=write, args=(i,)) for i in range(writers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(DURATION)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        return counts
+
+    def test_mixed_load(self):
+        for readers, writers in [(8, 0), (8, 2), (16, 4)]:
+            counts = self.run_mixed_load(readers=readers, writers=writers)
+            self.assertGreater(counts["reads"], 0)
+            print(
+                f"\n{readers} readers / {writers} writers: "
+                f"{counts['reads'] / DURATION:,.0f} reads/s, "
+                f"{counts['writes'] / DURATION:,.0f} writes/s"
+            )
@@ -0,0 +1,59 @@
+import os
+import tracemalloc
+import unittest
+import uuid
+
+from api.db.memory import CompactRowCodec, InMemoryDB
+from services.tasks.models import Task, TaskCategory, TaskType
+from tests.benchmarks import benchmark
+
+TASKS = int(os.environ.get("BENCHMARK_TASKS", 20_000))
+
+
+@benchmark
+class InMemoryDBFootprintBenchmark(unittest.TestCase):
+    """
+    Measures the memory held per task by dict rows and by compact rows. Run with
+    `BENCHMARKS=1 pytest -s tests/benchmarks` to see the numbers, and raise
+    BENCHMARK_TASKS to reproduce the soak test sizes.
+    """
+
+    def measure(self, codec: CompactRowCodec | None) -> float:
+        users = [uuid.uuid4() for _ in range(100)]
+        tracemalloc.start()
+        tasks = [
+            Task(
+                id=uuid.uuid4(),
+                # Rows parsed from requests do not share their foreign keys
+                user=uuid.UUID(str(users[i % len(users)])),
+                title="Title",
+                category=TaskCategory.MAINTENANCE,
+                type=TaskType.TASK,
+            ).model_dump()
+            for i in range(TASKS)
+        ]
+
+        db = InMemoryDB()
+        if codec:
+            db.set_codec("tasks", codec)
+        db.create_index("tasks", "user")
+        db.create_index("tasks", "status")
+        for task in tasks:
+            db.create("tasks", task)
+        # Dict rows are the input records themselves, compact rows let them be freed
+        del tasks
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return size / TASKS
+
+    def test_footprint(self):
+        dict_rows = self.measure(codec=None)
+        compact_rows = self.measure(
+            codec=CompactRowCodec.from_model(Task, interned=["user"])
+        )
+        print(
+            f"\ndict rows: {dict_rows:.0f} B/task, "
+            f"compact rows: {compact_rows:.0f} B/task "
+            f"({dict_rows / compact_rows:.1f}x smaller)"
+        )
+        self.assertLess(compact_rows, dict_rows)
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import time
+import unittest
+import uuid
+
+from fakeredis import FakeStrictRedis
+
+from api.db.memory import InMemoryDB
+from api.db.sqlite import SQLitePool, bootstrap
+from services.tasks.models import Task, TasksQuery, TaskStatus, TaskUpdate
+from services.tasks.repo.base import TasksRepo
+from services.tasks.repo.memory import TasksMemoryRepo
+from services.tasks.repo.redis import RedisTasksRepo
+from services.tasks.repo.sqlite import SQLiteTasksRepo
+from tests.benchmarks import benchmark
+
+TASKS = int(os.environ.get("BENCHMARK_TASKS", 2_000))
+USERS = 20
+
+
+@benchmark
+class TasksReposThroughputBenchmark(unittest.TestCase):
+    """
+    Compares the tasks repositories that run without external services on the same
+    workload. Run with `BENCHMARKS=1 pytest -s tests/benchmarks` to see the numbers. The
+    redis repo runs on fakeredis, so its numbers only show the repo overhead, not redis
+    latency.
+    """
+
+    def run_workload(self, repo: TasksRepo) -> dict[str, float]:
+        users = [uuid.uuid4() for _ in range(USERS)]
+        tasks = [
+            Task(id=uuid.uuid4(), user=users[i % USERS], title="T", description="D")
+            for i in range(TASKS)
+        ]
+        timings = {}
+
+        start = time.perf_counter()
+        for task in tasks:
+            repo.create(task=task)
+        timings["create"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for task in tasks:
+            repo.get(query=TasksQuery(id=task.id))
+        timings["get"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for task in tasks:
+            repo.query(query=TasksQuery(user=task.user), limit=20)
+        timings["query"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for task in tasks:
+            repo.update(
+                query=TasksQuery(id=task.id),
+                data=TaskUpdate(status=TaskStatus.CREATED),
+                returning=False,
+            )
+        timings["update"] = time.perf_counter() - start
+        return timings
+
+    def test_throughput(self):
+        with tempfile.TemporaryDirectory() as directory:
+            pool = SQLitePool(path=f"{directory}/benchmark.sqlite3")
+            bootstrap(pool.connection)
+            repos = {
+                "memory": TasksMemoryRepo(db=InMemoryDB()),
+                "sqlite": SQLiteTasksRepo(db=pool),
+                "redis (fake)": RedisTasksRepo(db=FakeStrictRedis()),
+            }
+            for name, repo in repos.items():
+                timings = self.run_workload(repo)
+                print(
+                    f"\n{name}: "
+                    + ", ".join(
+                        f"{operation} {TASKS / seconds:,.0f}/s"
+                        for operation, seconds in timings.items()
+                    )
+                )
+                self.assertEqual(
+                    repo.stats(user=repo.get(TasksQuery()).user).total, TASKS // USERS
+                )
+            pool.close()
@@ -0,0 +1,90 @@
+import tempfile
+import time
+import unittest
+import uuid
+
+from api.db.durable import DurableInMemoryDB
+from api.db.memory import CompactRowCodec
+from services.tasks.models import Task
+
+
+class DurableInMemoryDBTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+
+    def open(self, **kwargs) -> DurableInMemoryDB:
+        db = DurableInMemoryDB(self.path, **kwargs)
+        self.addCleanup(db.close)
+        return db
+
+    def write(self, db: DurableInMemoryDB) -> tuple[dict, dict]:
+        kept = db.create("table", dict(id=uuid.uuid4(), key="a"))
+        removed = db.create("table", dict(id=uuid.uuid4(), key="b"))
+        db.update("table", id=kept["id"], data=dict(key="c"))
+        db.increment("counters", id=kept["id"], counters=dict(total=2))
+        db.remove("table", removed["id"])
+        return kept, removed
+
+    def test_replay_log(self):
+        db = self.open()
+        kept, _ = self.write(db)
+        db.close()
+
+        db = self.open()
+        self.assertEqual(db.list("table"), [dict(id=kept["id"], key="c")])
+        self.assertEqual(db.get("counters", kept["id"])["total"], 2)
+
+    def test_snapshot(self):
+        db = self.open()
+        kept, _ = self.write(db)
+        db.snapshot()
+        db.increment("counters", id=kept["id"], counters=dict(total=1))
+        db.close()
+
+        db = self.open()
+        self.assertEqual(db.list("table"), [dict(id=kept["id"], key="c")])
+        self.assertEqual(db.get("counters", kept["id"])["total"], 3)
+
+    def test_snapshot_every(self):
+        db = self.open(snapshot_every=3)
+        self.write(db)
+        deadline = time.monotonic() + 1
+        while not db.snapshot_path.exists() and time.monotonic() < deadline:
+            time.sleep(db.fsync_interval)
+        db.close()
+
+        self.assertTrue(db.snapshot_path.exists())
+        self.assertEqual(len(list(db.path.glob("log.*"))), 1)
+
+    def test_torn_record_dropped(self):
+        db = self.open()
+        kept, _ = self.write(db)
+        db.close()
+        with open(db._log_path(0), "ab") as file:
+            file.write(b"\x10\x00\x00\x00torn")
+
+        db = self.open()
+        self.assertEqual(db.list("table"), [dict(id=kept["id"], key="c")])
+
+    def test_indexes_rebuilt(self):
+        db = self.open()
+        kept, _ = self.write(db)
+        db.close()
+
+        db = self.open()
+        db.create_index("table", "key")
+        self.assertEqual(db.find("table", key="c"), [dict(id=kept["id"], key="c")])
+
+    def test_snapshot_compact_rows(self):
+        db = self.open()
+        db.set_codec("tasks", CompactRowCodec.from_model(Task))
+        task = Task(id=uuid.uuid4(), user=uuid.uuid4(), title="Title", description="d")
+        db.create("tasks", task.model_dump())
+        db.snapshot()
+        db.close()
+
+        db = self.open()
+        db.set_codec("tasks", CompactRowCodec.from_model(Task))
+        self.assertEqual(db.get("tasks", task.id), task.model_dump())
@@ -1,7 +1,10 @@
+import threading
 import unittest
 import uuid
 
-from api.db.memory import InMemoryDB
+from api.db.memory import CompactRowCodec, InMemoryDB
+from services.tasks.models import Task, TaskStatus
+from services.tasks.repo.memory import AsyncTasksMemoryRepo, TasksMemoryRepo
 
 
 class InMemoryDBTestCase(unittest.TestCase):
@@ -37,3 +40,174 @@ class InMemoryDBTestCase(unittest.TestCase):
         entry = db.create("table", dict(id=str(uuid.uuid4()), key="value"))
         db.update("table", id=entry["id"], data=dict(key="new value"))
         self.assertEqual(db.get("table", entry["id"])["key"], "new value")
+
+    def test_increment(self):
+        db = InMemoryDB()
+        id = str(uuid.uuid4())
+        db.increment("table", id=id, counters=dict(total=1, other=2))
+        db.increment("table", id=id, counters=dict(total=1))
+        self.assertEqual(db.get("table", id), dict(id=id, total=2, other=2))
+
+    def test_find(self):
+        db = InMemoryDB()
+        db.create_index("table", "key")
+        for key in ["a", "b", "b"]:
+            db.create("table", dict(id=str(uuid.uuid4()), key=key, other="value"))
+
+        self.assertEqual(len(db.find("table", key="b")), 2)
+        self.assertEqual(len(db.find("table", key="b", other="value")), 2)
+        self.assertEqual(len(db.find("table", key="c")), 0)
+        self.assertEqual(len(db.find("table", other="value")), 3)
+
+        entry = db.find("table", key="a")[0]
+        self.assertEqual(db.find("table", id=entry["id"]), [entry])
+        self.assertEqual(db.find("table", id=entry["id"], key="b"), [])
+
+    def test_index_maintained(self):
+        db = InMemoryDB()
+        db.create_index("table", "key")
+        entry = db.create("table", dict(id=str(uuid.uuid4()), key="a"))
+
+        entry = db.update("table", id=entry["id"], data=dict(key="b"))
+        self.assertEqual(db.find("table", key="a"), [])
+        self.assertEqual(db.find("table", key="b"), [entry])
+
+        db.remove("table", entry["id"])
+        self.assertEqual(db.find("table", key="b"), [])
+
+    def test_create_index_existing_records(self):
+        db = InMemoryDB()
+        entry = db.create("table", dict(id=str(uuid.uuid4()), key="a"))
+        db.create_index("table", "key")
+        self.assertEqual(db.find("table", key="a"), [entry])
+
+    def test_iterate(self):
+        db = InMemoryDB()
+        for key in range(10):
+            db.create("table", dict(id=str(uuid.uuid4()), key=key, parity=key % 2))
+
+        rows = db.iterate("table", offset=1, limit=2, parity=0)
+        self.assertEqual([row["key"] for row in rows], [2, 4])
+        self.assertEqual(next(db.iterate("table", parity=1))["key"], 1)
+        self.assertEqual(len(list(db.iterate("table", offset=8))), 2)
+
+    def test_update_keeps_snapshot(self):
+        db = InMemoryDB()
+        entry = db.create("table", dict(id=str(uuid.uuid4()), key="a"))
+        rows = db.iterate("table")
+
+        db.update("table", id=entry["id"], data=dict(key="b"))
+        db.create("table", dict(id=str(uuid.uuid4()), key="c"))
+        self.assertEqual([row["key"] for row in rows], ["a"])
+        self.assertEqual(entry["key"], "a")
+
+    def test_scans_share_snapshot_until_write(self):
+        db = InMemoryDB()
+        entry = db.create("table", dict(id=str(uuid.uuid4()), key="a"))
+        self.assertIs(db._snapshot("table"), db._snapshot("table"))
+
+        rows = db.iterate("table", key="a")
+        db.update("table", id=entry["id"], data=dict(key="b"))
+        self.assertEqual([row["key"] for row in rows], ["a"])
+        self.assertEqual(db.find("table", key="b"), [dict(entry, key="b")])
+        db.remove("table", id=entry["id"])
+        self.assertEqual(db.find("table", key="b"), [])
+
+    def test_concurrent_writes(self):
+        db = InMemoryDB()
+        db.create_index("table", "key")
+        id = str(uuid.uuid4())
+
+        def write():
+            for _ in range(1000):
+                db.increment("table", id=id, counters=dict(total=1))
+                db.create("table", dict(id=str(uuid.uuid4()), key="value"))
+
+        threads = [threading.Thread(target=write) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(db.get("table", id)["total"], 4000)
+        self.assertEqual(len(db.find("table", key="value")), 4000)
+
+    def test_create_unique(self):
+        db = InMemoryDB()
+        db.create_index("table", "key")
+        row = db.create("table", dict(id="1", key="value"), unique=["key"])
+        db.create("table", dict(row, other=1), unique=["key"])
+        with self.assertRaises(ValueError):
+            db.create("table", dict(id="2", key="value"), unique=["key"])
+        self.assertEqual(len(db.find("table", key="value")), 1)
+
+    def test_concurrent_unique_creates(self):
+        db = InMemoryDB()
+        db.create_index("table", "key")
+        created = []
+
+        def create(number: int):
+            for key in range(200):
+                try:
+                    db.create("table", dict(id=f"{number}-{key}", key=key), ["key"])
+                except ValueError:
+                    continue
+                created.append(key)
+
+        threads = [threading.Thread(target=create, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(created), list(range(200)))
+
+    def test_compact_codec(self):
+        db = InMemoryDB()
+        db.create_index("tasks", "status")
+        db.create_index("tasks", "user")
+        task = Task(id=uuid.uuid4(), user=uuid.uuid4(), title="Title", description="d")
+        db.create("tasks", task.model_dump())
+        db.set_codec("tasks", CompactRowCodec.from_model(Task))
+
+        self.assertIsInstance(db.store["tasks"][task.id.int], tuple)
+        self.assertEqual(db.get("tasks", task.id), task.model_dump())
+        self.assertEqual(db.find("tasks", user=task.user), [task.model_dump()])
+        self.assertEqual(db.find("tasks", status=TaskStatus.CREATED), [])
+
+        updated = db.update("tasks", id=task.id, data=dict(status=TaskStatus.CREATED))
+        self.assertEqual(updated["status"], TaskStatus.CREATED)
+        self.assertEqual(db.find("tasks", status="CREATED"), [updated])
+        self.assertEqual(Task(**db.list("tasks")[0]), Task(**updated))
+
+        with self.assertRaises(ValueError):
+            db.update("tasks", id=task.id, data=dict(unknown=1))
+
+    def test_interned_values_released(self):
+        db = InMemoryDB()
+        codec = CompactRowCodec.from_model(Task, interned=["user"])
+        db.set_codec("tasks", codec)
+        user = uuid.uuid4()
+        tasks = [Task(id=uuid.uuid4(), user=user, title="Title") for _ in range(2)]
+        for task in tasks:
+            db.create("tasks", task.model_dump())
+        rows = list(db.store["tasks"].values())
+        self.assertIs(
+            rows[0][codec.positions["user"]], rows[1][codec.positions["user"]]
+        )
+
+        db.update("tasks", id=tasks[0].id, data=dict(user=uuid.uuid4()))
+        db.remove("tasks", id=tasks[1].id)
+        self.assertEqual(
+            list(codec._interned_values), [db.list("tasks")[0]["user"].int]
+        )
+
+        db.cleanup("tasks")
+        self.assertEqual(codec._interned_values, {})
+
+    def test_repos_codec_per_database(self):
+        db = InMemoryDB()
+        codec = TasksMemoryRepo(db=db).db.codecs["tasks"]
+        AsyncTasksMemoryRepo(db=db)
+        self.assertIs(db.codecs["tasks"], codec)
+        self.assertIsNot(TasksMemoryRepo(db=InMemoryDB()).db.codecs["tasks"], codec)
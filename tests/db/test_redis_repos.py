@@ -0,0 +1,194 @@
+import datetime
+import unittest
+import uuid
+
+from fakeredis import FakeStrictRedis
+from fakeredis.aioredis import FakeRedis as FakeAsyncRedis
+
+from services.tasks.models import Task, TasksQuery, TaskStatus, TaskType, TaskUpdate
+from services.tasks.repo.redis import AsyncRedisTasksRepo, RedisTasksRepo
+from services.users.models import UserDB, UsersQuery, UserUpdate
+from services.users.repo.base import UsernameTakenError
+from services.users.repo.redis import AsyncRedisUsersRepo, RedisUsersRepo
+
+
+def make_task(user: uuid.UUID, **data) -> Task:
+    return Task(
+        id=uuid.uuid4(), user=user, title="Title", description="Description", **data
+    )
+
+
+class RedisTasksRepoTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.repo = RedisTasksRepo(db=FakeStrictRedis())
+        self.user = uuid.uuid4()
+
+    def test_create_and_query(self):
+        tasks = [self.repo.create(make_task(self.user)) for _ in range(5)]
+        self.repo.create(make_task(uuid.uuid4()))
+
+        query = TasksQuery(user=self.user)
+        self.assertEqual(self.repo.query(query=query), tasks)
+        self.assertEqual(self.repo.query(query=query, offset=1, limit=2), tasks[1:3])
+        self.assertEqual(self.repo.get(query=TasksQuery(id=tasks[2].id)), tasks[2])
+        self.assertEqual(len(self.repo.query(query=TasksQuery())), 6)
+
+    def test_iter_query_batches(self):
+        self.repo.batch_size = 2
+        tasks = [self.repo.create(make_task(self.user)) for _ in range(5)]
+
+        query = TasksQuery(user=self.user)
+        self.assertEqual(list(self.repo.iter_query(query=query)), tasks)
+        self.assertEqual(list(self.repo.iter_query(query=query, offset=3)), tasks[3:])
+
+    def test_update_moves_indexes_and_stats(self):
+        task = self.repo.create(make_task(self.user))
+        self.repo.create(make_task(self.user, type=TaskType.BUG))
+
+        updated = self.repo.update(
+            query=TasksQuery(id=task.id),
+            data=TaskUpdate(title="New title", status=TaskStatus.CREATED),
+        )
+        self.assertEqual([t.title for t in updated], ["New title"])
+
+        created = TasksQuery(user=self.user, status=TaskStatus.CREATED)
+        pending = TasksQuery(user=self.user, status=TaskStatus.PENDING)
+        self.assertEqual([t.id for t in self.repo.query(query=created)], [task.id])
+        self.assertEqual(len(self.repo.query(query=pending)), 1)
+
+        stats = self.repo.stats(user=self.user)
+        self.assertEqual(stats.total, 2)
+        self.assertEqual(stats.status, {TaskStatus.PENDING: 1, TaskStatus.CREATED: 1})
+        self.assertEqual(stats.type, {TaskType.ISSUE: 1, TaskType.BUG: 1})
+
+        self.repo.rebuild_stats()
+        self.assertEqual(self.repo.stats(user=self.user), stats)
+
+    def test_update_bumps_revision_and_version(self):
+        task = self.repo.create(make_task(self.user))
+        self.assertEqual(task.revision, 0)
+        self.assertIsNone(task.updated_at)
+        self.assertEqual(self.repo.collection_version(user=self.user), 1)
+
+        updated = self.repo.update(
+            query=TasksQuery(id=task.id), data=TaskUpdate(title="New title")
+        )
+        self.assertEqual(updated[0].revision, 1)
+        self.assertIsNotNone(updated[0].updated_at)
+        self.assertEqual(self.repo.collection_version(user=self.user), 2)
+
+        self.repo.delete_many(ids=[task.id])
+        self.assertEqual(self.repo.collection_version(user=self.user), 3)
+        self.assertEqual(self.repo.collection_version(user=uuid.uuid4()), 0)
+
+    def test_query_received_before_and_delete(self):
+        old = [
+            self.repo.create(
+                make_task(
+                    self.user,
+                    status=TaskStatus.CREATED,
+                    received_at=datetime.datetime(2020, 1, 1, second=second),
+                )
+            )
+            for second in range(3)
+        ]
+        self.repo.create(make_task(self.user, status=TaskStatus.CREATED))
+        self.repo.create(
+            make_task(self.user, received_at=datetime.datetime(2020, 1, 1))
+        )
+
+        query = TasksQuery(status=TaskStatus.CREATED)
+        before = datetime.datetime(2021, 1, 1)
+        self.assertEqual(
+            self.repo.query_received_before(query=query, before=before), old
+        )
+        self.assertEqual(
+            self.repo.query_received_before(query=query, before=before, limit=2),
+            old[:2],
+        )
+
+        self.repo.delete_many(ids=[task.id for task in old] + [uuid.uuid4()])
+        self.assertEqual(
+            self.repo.query_received_before(query=query, before=before), []
+        )
+        self.assertEqual(len(self.repo.query(query=TasksQuery(user=self.user))), 2)
+        self.assertIsNone(self.repo.get(query=TasksQuery(id=old[0].id)))
+        self.assertEqual(self.repo.stats(user=self.user).total, 5)
+
+
+class AsyncRedisTasksRepoTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_create_query_update(self):
+        repo = AsyncRedisTasksRepo(db=FakeAsyncRedis())
+        user = uuid.uuid4()
+        task = await repo.create(make_task(user))
+
+        self.assertEqual(await repo.query(query=TasksQuery(user=user)), [task])
+        updated = await repo.update(
+            query=TasksQuery(id=task.id), data=TaskUpdate(status=TaskStatus.CREATED)
+        )
+        self.assertEqual(updated[0].status, TaskStatus.CREATED)
+        tasks = [t async for t in repo.iter_query(query=TasksQuery(user=user))]
+        self.assertEqual(tasks, updated)
+        self.assertEqual((await repo.stats(user=user)).status, {TaskStatus.CREATED: 1})
+
+
+class RedisUsersRepoTestCase(unittest.TestCase):
+    def test_create_query_update(self):
+        repo = RedisUsersRepo(db=FakeStrictRedis())
+        user = repo.create(UserDB(username="user", password="password"))
+        repo.create(UserDB(username="other", password="password"))
+
+        self.assertEqual(repo.get(query=UsersQuery(username="user")), user)
+        self.assertEqual(repo.get(query=UsersQuery(id=user.id)), user)
+        self.assertIsNone(repo.get(query=UsersQuery(username="missing")))
+        self.assertEqual(len(repo.query(query=UsersQuery())), 2)
+
+        updated = repo.update(
+            query=UsersQuery(id=user.id), data=UserUpdate(external_data={"key": 1})
+        )
+        self.assertEqual(updated[0].external_data, {"key": 1})
+        self.assertEqual(repo.get(query=UsersQuery(id=user.id)), updated[0])
+
+    def test_username_taken(self):
+        repo = RedisUsersRepo(db=FakeStrictRedis())
+        user = repo.create(UserDB(username="user", password="password"))
+        with self.assertRaises(UsernameTakenError):
+            repo.create(UserDB(username="user", password="other"))
+        self.assertEqual(repo.query(query=UsersQuery()), [user])
+
+    def test_increment_token_version(self):
+        repo = RedisUsersRepo(db=FakeStrictRedis())
+        user = repo.create(UserDB(username="user", password="password"))
+
+        repo.increment_token_version(query=UsersQuery(id=user.id))
+        updated = repo.increment_token_version(query=UsersQuery(username="user"))
+        self.assertEqual(updated[0].token_version, 2)
+        self.assertEqual(repo.get(query=UsersQuery(id=user.id)), updated[0])
+
+        missing = uuid.uuid4()
+        self.assertEqual(repo.increment_token_version(query=UsersQuery(id=missing)), [])
+        self.assertFalse(repo.db.exists(repo._key(missing)))
+
+
+class AsyncRedisUsersRepoTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_create_query_update(self):
+        repo = AsyncRedisUsersRepo(db=FakeAsyncRedis())
+        user = await repo.create(UserDB(username="user", password="password"))
+
+        self.assertEqual(await repo.get(query=UsersQuery(username="user")), user)
+        updated = await repo.update(
+            query=UsersQuery(username="user"), data=UserUpdate(external_data={"a": 1})
+        )
+        self.assertEqual(updated[0].external_data, {"a": 1})
+
+    async def test_username_taken(self):
+        repo = AsyncRedisUsersRepo(db=FakeAsyncRedis())
+        await repo.create(UserDB(username="taken", password="password"))
+        with self.assertRaises(UsernameTakenError):
+            await repo.create(UserDB(username="taken", password="other"))
+
+    async def test_increment_token_version(self):
+        repo = AsyncRedisUsersRepo(db=FakeAsyncRedis())
+        user = await repo.create(UserDB(username="version", password="password"))
+        updated = await repo.increment_token_version(query=UsersQuery(id=user.id))
+        self.assertEqual(updated[0].token_version, 1)
@@ -0,0 +1,386 @@
+import asyncio
+import datetime
+import re
+import threading
+import unittest
+import uuid
+
+from rethinkdb import r
+from rethinkdb.errors import ReqlDriverError
+
+from api.db.rethinkdb import (
+    SCHEMA,
+    AsyncConnectionPool,
+    ConnectionPool,
+    duplicated_values,
+    round_robin,
+    select,
+)
+from api.db.rows import dump_row
+from services.tasks.models import Task, TasksQuery
+from services.tasks.repo.rethinkdb import RethinkDBTasksRepo
+from services.users.models import UserDB, UsersQuery
+from services.users.repo.base import UsernameTakenError
+from services.users.repo.rethinkdb import RethinkDBUsersRepo
+
+
+class FakeConnection:
+    def __init__(self) -> None:
+        self.open = True
+        self.reconnects = 0
+        self.in_use = False
+
+    def is_open(self) -> bool:
+        return self.open
+
+    def reconnect(self, noreply_wait: bool = True) -> "FakeConnection":
+        self.open = True
+        self.reconnects += 1
+        return self
+
+    def server(self) -> dict:
+        if not self.open:
+            raise ReqlDriverError("Connection is closed.")
+        return {}
+
+    def close(self, noreply_wait: bool = True) -> None:
+        self.open = False
+
+
+class FakeAsyncConnection(FakeConnection):
+    async def reconnect(self, noreply_wait: bool = True) -> "FakeAsyncConnection":
+        return super().reconnect(noreply_wait=noreply_wait)
+
+    async def server(self) -> dict:
+        return super().server()
+
+    async def close(self, noreply_wait: bool = True) -> None:
+        super().close(noreply_wait=noreply_wait)
+
+
+class FakeQueryConnection(FakeConnection):
+    """Connection answering the queries it runs with the given results, in order."""
+
+    def __init__(self, *results) -> None:
+        super().__init__()
+        self.results = list(results)
+        self.queries = []
+
+    def _start(self, query, **global_optargs):
+        self.queries.append(str(query))
+        return self.results.pop(0)
+
+
+async def connect_async() -> FakeAsyncConnection:
+    return FakeAsyncConnection()
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+    def test_open(self):
+        pool = ConnectionPool(connect=FakeConnection, min_size=3, max_size=5)
+        pool.open()
+        self.assertEqual(pool.size, 3)
+
+    def test_reuse_connection(self):
+        pool = ConnectionPool(connect=FakeConnection, max_size=5)
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(pool.size, 1)
+
+    def test_timeout(self):
+        pool = ConnectionPool(connect=FakeConnection, max_size=1, timeout=0.01)
+        with pool.connection():
+            with self.assertRaises(ReqlDriverError):
+                with pool.connection():
+                    pass
+
+    def test_discard_broken_connection(self):
+        pool = ConnectionPool(connect=FakeConnection, max_size=1)
+        with self.assertRaises(ReqlDriverError):
+            with pool.connection() as broken:
+                raise ReqlDriverError("Connection reset.")
+        self.assertEqual(pool.size, 0)
+        self.assertFalse(broken.is_open())
+
+        with pool.connection() as connection:
+            self.assertIsNot(connection, broken)
+
+    def test_reconnect_closed_connection(self):
+        pool = ConnectionPool(
+            connect=FakeConnection, max_size=1, health_check_interval=0
+        )
+        with pool.connection() as connection:
+            pass
+        connection.close()
+        with pool.connection() as reconnected:
+            self.assertIs(connection, reconnected)
+            self.assertTrue(reconnected.is_open())
+        self.assertEqual(connection.reconnects, 1)
+
+    def test_concurrent_checkout(self):
+        pool = ConnectionPool(connect=FakeConnection, max_size=4)
+        errors = []
+
+        def worker():
+            for _ in range(200):
+                with pool.connection() as connection:
+                    if connection.in_use:
+                        errors.append(connection)
+                    connection.in_use = True
+                    connection.in_use = False
+
+        threads = [threading.Thread(target=worker) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertLessEqual(pool.size, 4)
+
+
+class AsyncConnectionPoolTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_open(self):
+        pool = AsyncConnectionPool(connect=connect_async, min_size=3, max_size=5)
+        await pool.open()
+        self.assertEqual(pool.size, 3)
+
+    async def test_reuse_connection(self):
+        pool = AsyncConnectionPool(connect=connect_async, max_size=5)
+        async with pool.connection() as first:
+            pass
+        async with pool.connection() as second:
+            pass
+        self.assertIs(first, second)
+
+    async def test_timeout(self):
+        pool = AsyncConnectionPool(connect=connect_async, max_size=1, timeout=0.01)
+        async with pool.connection():
+            with self.assertRaises(ReqlDriverError):
+                async with pool.connection():
+                    pass
+
+    async def test_discard_broken_connection(self):
+        pool = AsyncConnectionPool(connect=connect_async, max_size=1)
+        with self.assertRaises(ReqlDriverError):
+            async with pool.connection() as broken:
+                raise ReqlDriverError("Connection reset.")
+        self.assertEqual(pool.size, 0)
+        self.assertFalse(broken.is_open())
+
+    async def test_concurrent_checkout(self):
+        pool = AsyncConnectionPool(connect=connect_async, max_size=2)
+        in_use = []
+
+        async def worker():
+            async with pool.connection() as connection:
+                self.assertNotIn(connection, in_use)
+                in_use.append(connection)
+                await asyncio.sleep(0.001)
+                in_use.remove(connection)
+
+        await asyncio.gather(*(worker() for _ in range(20)))
+        self.assertEqual(pool.size, 2)
+
+
+class SelectTestCase(unittest.TestCase):
+    def test_primary_key(self):
+        selection = select(r.table("tasks"), {"id": "1", "user": "2"}, SCHEMA["tasks"])
+        self.assertEqual(
+            str(selection), str(r.table("tasks").get_all("1").filter({"user": "2"}))
+        )
+
+    def test_compound_index(self):
+        selection = select(
+            r.table("tasks"), {"user": "1", "status": "PENDING"}, SCHEMA["tasks"]
+        )
+        self.assertEqual(
+            str(selection),
+            str(r.table("tasks").get_all(["1", "PENDING"], index="user_status")),
+        )
+
+    def test_single_index(self):
+        selection = select(r.table("users"), {"username": "user"}, SCHEMA["users"])
+        self.assertEqual(
+            str(selection), str(r.table("users").get_all("user", index="username"))
+        )
+
+    def test_no_index(self):
+        selection = select(r.table("tasks"), {"title": "title"}, SCHEMA["tasks"])
+        self.assertEqual(
+            str(selection), str(r.table("tasks").filter({"title": "title"}))
+        )
+
+    def test_ordered_compound_index(self):
+        selection = select(
+            r.table("tasks"),
+            {"user": "1", "status": "PENDING", "title": "title"},
+            SCHEMA["tasks"],
+            order_by="received_at",
+        )
+        index = "user_status_received_at"
+        self.assertEqual(
+            str(selection),
+            str(
+                r.table("tasks")
+                .between(
+                    ["1", "PENDING", r.minval], ["1", "PENDING", r.maxval], index=index
+                )
+                .order_by(index=index)
+                .filter({"title": "title"})
+            ),
+        )
+
+    def test_ordered_without_fields(self):
+        selection = select(
+            r.table("tasks"), {}, SCHEMA["tasks"], order_by="received_at"
+        )
+        self.assertEqual(
+            str(selection), str(r.table("tasks").order_by(index="received_at"))
+        )
+        selection = select(r.table("users"), {}, SCHEMA["users"], order_by="id")
+        self.assertEqual(str(selection), str(r.table("users").order_by(index="id")))
+
+    def test_ordered_prefers_covering_index(self):
+        selection = select(
+            r.table("users"), {"username": "user"}, SCHEMA["users"], order_by="id"
+        )
+        self.assertEqual(
+            str(selection), str(r.table("users").get_all("user", index="username"))
+        )
+
+
+class ReadRoutingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.primary = ConnectionPool(connect=FakeConnection)
+        self.replica = ConnectionPool(connect=FakeConnection)
+
+    def test_list_reads_use_replicas(self):
+        repo = RethinkDBTasksRepo(db=self.primary, replica_db=self.replica)
+        self.assertEqual(repo._read("query"), (self.replica, "outdated"))
+        self.assertEqual(repo._read("iter_query"), (self.replica, "outdated"))
+
+    def test_read_your_writes_use_primary(self):
+        repo = RethinkDBTasksRepo(db=self.primary, replica_db=self.replica)
+        self.assertEqual(repo._read("get"), (self.primary, "single"))
+        self.assertEqual(repo._read("stats"), (self.primary, "single"))
+
+    def test_consistent_reads_use_primary(self):
+        repo = RethinkDBTasksRepo(db=self.primary, replica_db=self.replica)
+        self.assertEqual(repo._read("query", consistent=True), (self.primary, "single"))
+
+    def make_versioned_repo(self, replica_version: int) -> RethinkDBTasksRepo:
+        self.task = Task(id=uuid.uuid4(), user=uuid.uuid4(), title="Title")
+        row = dump_row(self.task)
+        self.primary_connection = FakeQueryConnection([row])
+        self.replica_connection = FakeQueryConnection(
+            {"version": replica_version, "tasks": [row]}
+        )
+        return RethinkDBTasksRepo(
+            db=ConnectionPool(connect=lambda: self.primary_connection),
+            replica_db=ConnectionPool(connect=lambda: self.replica_connection),
+        )
+
+    def test_versioned_query_uses_replica(self):
+        repo = self.make_versioned_repo(replica_version=3)
+        tasks = repo.query(TasksQuery(user=self.task.user), version=3)
+        self.assertEqual(tasks, [self.task])
+        self.assertEqual(self.primary_connection.queries, [])
+        [query] = self.replica_connection.queries
+        self.assertTrue(
+            query.startswith("r.table('tasks_versions', read_mode='outdated')")
+        )
+        self.assertIn("r.table('tasks', read_mode='outdated')", query)
+
+    def test_versioned_query_behind_replica_uses_primary(self):
+        repo = self.make_versioned_repo(replica_version=2)
+        tasks = repo.query(TasksQuery(user=self.task.user), version=3)
+        self.assertEqual(tasks, [self.task])
+        self.assertEqual(len(self.replica_connection.queries), 1)
+        [query] = self.primary_connection.queries
+        self.assertTrue(query.startswith("r.table('tasks')"))
+
+    def test_without_replicas(self):
+        repo = RethinkDBTasksRepo(db=self.primary)
+        self.assertEqual(repo._read("query"), (self.primary, "outdated"))
+
+    def test_read_modes_override(self):
+        repo = RethinkDBTasksRepo(
+            db=self.primary, replica_db=self.replica, read_modes={"query": "single"}
+        )
+        self.assertEqual(repo._read("query"), (self.primary, "single"))
+        self.assertEqual(repo._read("iter_query"), (self.replica, "outdated"))
+
+    def test_select_read_mode(self):
+        repo = RethinkDBTasksRepo(db=self.primary)
+        query = TasksQuery(status="PENDING")
+        index = "status_received_at"
+        self.assertEqual(
+            str(repo._select(query, read_mode="outdated")),
+            str(
+                r.table("tasks", read_mode="outdated")
+                .between(["PENDING", r.minval], ["PENDING", r.maxval], index=index)
+                .order_by(index=index)
+            ),
+        )
+        self.assertEqual(
+            str(repo._select(query)),
+            str(
+                r.table("tasks")
+                .between(["PENDING", r.minval], ["PENDING", r.maxval], index=index)
+                .order_by(index=index)
+            ),
+        )
+
+    def test_select_received_before(self):
+        repo = RethinkDBTasksRepo(db=self.primary)
+        selection = repo._select_received_before(
+            TasksQuery(status="CREATED"), before=datetime.datetime(2020, 1, 1), limit=10
+        )
+        expected = (
+            r.table("tasks")
+            .get_all("CREATED", index="status")
+            .filter(r.row["received_at"].lt("2020-01-01T00:00:00"))
+            .limit(10)
+        )
+        # Every r.row gets a new variable name
+        self.assertEqual(
+            re.sub(r"var_\d+", "var", str(selection)),
+            re.sub(r"var_\d+", "var", str(expected)),
+        )
+
+    def test_duplicated_values(self):
+        query = str(duplicated_values(r.table("users"), "username"))
+        self.assertTrue(
+            query.startswith("r.table('users').group('username').count().ungroup()")
+        )
+        self.assertIn("['reduction'] > r.expr(1)", query)
+
+    def test_round_robin(self):
+        connect = round_robin(lambda url: url, ["first", "second"])
+        self.assertEqual([connect() for _ in range(3)], ["first", "second", "first"])
+
+
+class UsersQueriesTestCase(unittest.TestCase):
+    def test_username_taken(self):
+        RethinkDBUsersRepo._check_inserted({"inserted": 1})
+        with self.assertRaises(UsernameTakenError):
+            RethinkDBUsersRepo._check_inserted({"inserted": 0, "errors": 1})
+
+    def test_insert_reserves_username(self):
+        user = UserDB(username="user", password="password")
+        query = str(RethinkDBUsersRepo(db=None)._insert(user))
+        self.assertTrue(query.startswith("r.table('usernames').insert("))
+        self.assertIn("r.table('users').insert(", query)
+
+    def test_increment_token_version(self):
+        query = str(
+            RethinkDBUsersRepo(db=None)._increment_token_version(
+                UsersQuery(id=uuid.uuid4())
+            )
+        )
+        self.assertIn(".update(", query)
+        self.assertIn("r.row['token_version'].default(0) + r.expr(1)", query)
@@ -0,0 +1,289 @@
+import datetime
+import tempfile
+import threading
+import unittest
+import uuid
+
+from api.db import DuplicateValuesError
+from api.db.sqlite import SQLitePool, bootstrap
+from services.tasks.models import Task, TasksQuery, TaskStatus, TaskType, TaskUpdate
+from services.tasks.repo.sqlite import AsyncSQLiteTasksRepo, SQLiteTasksRepo
+from services.users.models import UserDB, UsersQuery, UserUpdate
+from services.users.repo.base import UsernameTakenError
+from services.users.repo.sqlite import AsyncSQLiteUsersRepo, SQLiteUsersRepo
+
+
+def make_task(user: uuid.UUID, **data) -> Task:
+    return Task(
+        id=uuid.uuid4(), user=user, title="Title", description="Description", **data
+    )
+
+
+class SQLiteTestMixin:
+    def open_pool(self) -> SQLitePool:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        pool = SQLitePool(path=f"{directory.name}/test.sqlite3")
+        self.addCleanup(pool.close)
+        bootstrap(pool.connection)
+        return pool
+
+
+class SQLiteTasksRepoTestCase(SQLiteTestMixin, unittest.TestCase):
+    def setUp(self) -> None:
+        self.pool = self.open_pool()
+        self.repo = SQLiteTasksRepo(db=self.pool)
+        self.user = uuid.uuid4()
+
+    def test_create_and_query(self):
+        tasks = self.repo.create_many([make_task(self.user) for _ in range(5)])
+        self.repo.create(make_task(uuid.uuid4()))
+
+        query = TasksQuery(user=self.user)
+        self.assertEqual(self.repo.query(query=query), tasks)
+        self.assertEqual(self.repo.query(query=query, offset=1, limit=2), tasks[1:3])
+        self.assertEqual(self.repo.get(query=TasksQuery(id=tasks[2].id)), tasks[2])
+        self.assertEqual(len(self.repo.query(query=TasksQuery())), 6)
+        self.assertEqual(self.repo.stats(user=self.user).total, 5)
+
+    def test_update_moves_stats(self):
+        task = self.repo.create(make_task(self.user, trello_data={"id": "card"}))
+        self.repo.create(make_task(self.user, type=TaskType.BUG))
+
+        updated = self.repo.update(
+            query=TasksQuery(id=task.id),
+            data=TaskUpdate(title="New title", status=TaskStatus.CREATED),
+        )
+        self.assertEqual([t.title for t in updated], ["New title"])
+        self.assertEqual(updated[0].trello_data, {"id": "card"})
+
+        created = TasksQuery(user=self.user, status=TaskStatus.CREATED)
+        self.assertEqual(self.repo.query(query=created), updated)
+
+        stats = self.repo.stats(user=self.user)
+        self.assertEqual(stats.status, {TaskStatus.PENDING: 1, TaskStatus.CREATED: 1})
+        self.assertEqual(stats.type, {TaskType.ISSUE: 1, TaskType.BUG: 1})
+
+        self.repo.rebuild_stats()
+        self.assertEqual(self.repo.stats(user=self.user), stats)
+
+    def test_update_bumps_revision_and_version(self):
+        task = self.repo.create(make_task(self.user))
+        self.assertEqual(task.revision, 0)
+        self.assertIsNone(task.updated_at)
+        self.assertEqual(self.repo.collection_version(user=self.user), 1)
+
+        updated = self.repo.update(
+            query=TasksQuery(id=task.id), data=TaskUpdate(title="New title")
+        )
+        self.assertEqual(updated[0].revision, 1)
+        self.assertIsNotNone(updated[0].updated_at)
+        self.assertEqual(self.repo.collection_version(user=self.user), 2)
+
+        self.repo.delete_many(ids=[task.id])
+        self.assertEqual(self.repo.collection_version(user=self.user), 3)
+        self.assertEqual(self.repo.collection_version(user=uuid.uuid4()), 0)
+
+    def test_connection_per_thread(self):
+        connections = []
+        thread = threading.Thread(
+            target=lambda: connections.append(self.pool.connection)
+        )
+        thread.start()
+        thread.join()
+        self.assertIsNot(connections[0], self.pool.connection)
+
+    def test_query_received_before_and_delete(self):
+        old = [
+            self.repo.create(
+                make_task(
+                    self.user,
+                    status=TaskStatus.CREATED,
+                    received_at=datetime.datetime(2020, 1, 1, second=second),
+                )
+            )
+            for second in range(3)
+        ]
+        self.repo.create(make_task(self.user, status=TaskStatus.CREATED))
+        self.repo.create(
+            make_task(self.user, received_at=datetime.datetime(2020, 1, 1))
+        )
+
+        query = TasksQuery(status=TaskStatus.CREATED)
+        before = datetime.datetime(2021, 1, 1)
+        self.assertEqual(
+            self.repo.query_received_before(query=query, before=before), old
+        )
+        self.assertEqual(
+            self.repo.query_received_before(query=query, before=before, limit=2),
+            old[:2],
+        )
+
+        self.repo.delete_many(ids=[task.id for task in old] + [uuid.uuid4()])
+        self.assertEqual(
+            self.repo.query_received_before(query=query, before=before), []
+        )
+        self.assertEqual(len(self.repo.query(query=TasksQuery(user=self.user))), 2)
+        self.assertIsNone(self.repo.get(query=TasksQuery(id=old[0].id)))
+        self.assertEqual(self.repo.stats(user=self.user).total, 5)
+
+
+class AsyncSQLiteTasksRepoTestCase(SQLiteTestMixin, unittest.IsolatedAsyncioTestCase):
+    async def test_create_query_update(self):
+        repo = AsyncSQLiteTasksRepo(db=self.open_pool())
+        repo.batch_size = 2
+        user = uuid.uuid4()
+        tasks = [await repo.create(make_task(user)) for _ in range(5)]
+
+        query = TasksQuery(user=user)
+        self.assertEqual([t async for t in repo.iter_query(query=query)], tasks)
+        self.assertEqual(
+            [t async for t in repo.iter_query(query=query, offset=1, limit=3)],
+            tasks[1:4],
+        )
+        updated = await repo.update(
+            query=TasksQuery(id=tasks[0].id), data=TaskUpdate(status=TaskStatus.ERROR)
+        )
+        self.assertEqual(await repo.get(query=TasksQuery(id=tasks[0].id)), updated[0])
+
+    async def test_iter_query_pages_after_rowid(self):
+        repo = AsyncSQLiteTasksRepo(db=self.open_pool())
+        repo.batch_size = 2
+        user = uuid.uuid4()
+        tasks = repo.repo.create_many([make_task(user) for _ in range(5)])
+        repo.repo.create(make_task(uuid.uuid4()))
+
+        query = TasksQuery(user=user)
+        iterator = repo.iter_query(query=query, offset=1)
+        self.assertEqual([await anext(iterator) for _ in range(2)], tasks[1:3])
+        # Tasks deleted or inserted while iterating do not shift the next pages
+        repo.repo.delete_many(ids=[tasks[0].id])
+        late = await repo.create(make_task(user))
+        self.assertEqual([task async for task in iterator], tasks[3:] + [late])
+
+        page, after = repo.repo.query_page(query=query, limit=2)
+        self.assertEqual(page, tasks[1:3])
+        page, _ = repo.repo.query_page(query=query, after=after, limit=2)
+        self.assertEqual(page, tasks[3:])
+
+
+class SQLiteUsersRepoTestCase(SQLiteTestMixin, unittest.TestCase):
+    def test_create_query_update(self):
+        repo = SQLiteUsersRepo(db=self.open_pool())
+        user = repo.create(UserDB(username="user", password="password"))
+        repo.create(UserDB(username="other", password="password"))
+
+        self.assertEqual(repo.get(query=UsersQuery(username="user")), user)
+        self.assertIsNone(repo.get(query=UsersQuery(username="missing")))
+
+        updated = repo.update(
+            query=UsersQuery(id=user.id), data=UserUpdate(external_data={"key": 1})
+        )
+        self.assertEqual(updated[0].external_data, {"key": 1})
+        self.assertEqual(repo.get(query=UsersQuery(id=user.id)), updated[0])
+
+    def test_username_taken(self):
+        repo = SQLiteUsersRepo(db=self.open_pool())
+        user = repo.create(UserDB(username="user", password="password"))
+        with self.assertRaises(UsernameTakenError):
+            repo.create(UserDB(username="user", password="other"))
+        self.assertEqual(repo.query(query=UsersQuery()), [user])
+
+    def test_increment_token_version(self):
+        repo = SQLiteUsersRepo(db=self.open_pool())
+        user = repo.create(UserDB(username="user", password="password"))
+        other = repo.create(UserDB(username="other", password="password"))
+
+        repo.increment_token_version(query=UsersQuery(id=user.id))
+        updated = repo.increment_token_version(query=UsersQuery(id=user.id))
+        self.assertEqual([user.token_version for user in updated], [2])
+        self.assertEqual(repo.get(query=UsersQuery(id=other.id)).token_version, 0)
+        self.assertEqual(
+            repo.increment_token_version(query=UsersQuery(username="missing")), []
+        )
+
+    def test_bootstrap_adds_columns(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        pool = SQLitePool(path=f"{directory.name}/test.sqlite3")
+        self.addCleanup(pool.close)
+        pool.connection.execute(
+            "CREATE TABLE users (id TEXT PRIMARY KEY, username TEXT NOT NULL, "
+            "password TEXT NOT NULL, external_data TEXT)"
+        )
+        pool.connection.execute(
+            "INSERT INTO users VALUES ('00000000-0000-0000-0000-000000000001', "
+            "'user', 'password', NULL)"
+        )
+        bootstrap(pool.connection)
+
+        repo = SQLiteUsersRepo(db=pool)
+        user = repo.get(query=UsersQuery(username="user"))
+        self.assertEqual(user.token_version, 0)
+        updated = repo.update(
+            query=UsersQuery(id=user.id), data=UserUpdate(token_version=1)
+        )
+        self.assertEqual(updated[0].token_version, 1)
+
+    def test_bootstrap_with_duplicated_usernames(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        pool = SQLitePool(path=f"{directory.name}/test.sqlite3")
+        self.addCleanup(pool.close)
+        pool.connection.execute(
+            "CREATE TABLE users (id TEXT PRIMARY KEY, username TEXT NOT NULL, "
+            "password TEXT NOT NULL, external_data TEXT)"
+        )
+        for id in (1, 2):
+            pool.connection.execute(
+                "INSERT INTO users VALUES (?, 'user', 'password', NULL)",
+                [str(uuid.UUID(int=id))],
+            )
+
+        # The API does not start, rather than registering users without the index
+        with self.assertRaisesRegex(
+            DuplicateValuesError, "duplicated username values: user"
+        ):
+            bootstrap(pool.connection)
+
+        pool.connection.execute(
+            "DELETE FROM users WHERE id = ?", [str(uuid.UUID(int=2))]
+        )
+        bootstrap(pool.connection)
+        repo = SQLiteUsersRepo(db=pool)
+        with self.assertRaises(UsernameTakenError):
+            repo.create(UserDB(username="user", password="other"))
+        repo.create(UserDB(username="other", password="password"))
+
+    def test_bootstrap_adds_task_columns(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        pool = SQLitePool(path=f"{directory.name}/test.sqlite3")
+        self.addCleanup(pool.close)
+        pool.connection.execute(
+            "CREATE TABLE tasks (id TEXT PRIMARY KEY, user TEXT NOT NULL, "
+            "title TEXT, description TEXT, category TEXT, type TEXT NOT NULL, "
+            "status TEXT NOT NULL, received_at TEXT NOT NULL, trello_data TEXT, "
+            "fail_count INTEGER NOT NULL DEFAULT 0)"
+        )
+        task = make_task(uuid.uuid4())
+        pool.connection.execute(
+            "INSERT INTO tasks VALUES (?, ?, 'Title', NULL, NULL, 'ISSUE', "
+            "'PENDING', ?, NULL, 0)",
+            (str(task.id), str(task.user), task.received_at.isoformat()),
+        )
+        bootstrap(pool.connection)
+
+        repo = SQLiteTasksRepo(db=pool)
+        self.assertEqual(repo.get(query=TasksQuery(id=task.id)).revision, 0)
+        updated = repo.update(
+            query=TasksQuery(id=task.id), data=TaskUpdate(title="New")
+        )
+        self.assertEqual(updated[0].revision, 1)
+
+
+class AsyncSQLiteUsersRepoTestCase(SQLiteTestMixin, unittest.IsolatedAsyncioTestCase):
+    async def test_create_and_get(self):
+        repo = AsyncSQLiteUsersRepo(db=self.open_pool())
+        user = await repo.create(UserDB(username="user", password="password"))
+        self.assertEqual(await repo.get(query=UsersQuery(username="user")), user)
@@ -0,0 +1,52 @@
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+
+from api.setup import users_service
+from services.auth import handlers
+from services.auth.handlers import get_current_principal, get_current_user
+from services.auth.models import Principal, TokenData
+from services.auth.service import AuthService
+from services.users.factory import get_user_create_data
+
+
+class AuthHandlersTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.user = await users_service.acreate(user=get_user_create_data())
+
+    def token(self, **data) -> str:
+        data = {
+            "username": self.user.username,
+            "id": self.user.id,
+            "token_version": 0,
+            **data,
+        }
+        return AuthService.create_access_token(data=TokenData(**data).claims)
+
+    async def test_principal_from_claims(self):
+        with mock.patch.object(handlers, "users_service") as service:
+            principal = await get_current_principal(self.token())
+        service.aget_principal.assert_not_called()
+        self.assertEqual(
+            principal, Principal(id=self.user.id, username=self.user.username)
+        )
+
+    async def test_principal_from_token_without_id(self):
+        principal = await get_current_principal(self.token(id=None))
+        self.assertEqual(principal.id, self.user.id)
+
+    async def test_revoked_token(self):
+        token = self.token()
+        self.assertEqual((await get_current_user(token)).id, self.user.id)
+
+        await users_service.arevoke_tokens(user_id=self.user.id)
+        with self.assertRaises(HTTPException):
+            await get_current_user(token)
+        self.assertEqual(
+            (await get_current_user(self.token(token_version=1))).id, self.user.id
+        )
+
+    async def test_invalid_token(self):
+        with self.assertRaises(HTTPException):
+            await get_current_principal("invalid")
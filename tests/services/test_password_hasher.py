@@ -0,0 +1,62 @@
+import unittest
+
+from passlib.context import CryptContext
+
+from api.setup import users_service
+from services.auth.hasher import PasswordHasher, pwd_context
+from services.users.factory import get_user_create_data
+from services.users.models import UserDB, UsersQuery
+
+weak_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4)
+
+
+class PasswordHasherTestCase(unittest.IsolatedAsyncioTestCase):
+    async def check_hasher(self, hasher: PasswordHasher):
+        hashed = await hasher.hash("password")
+        self.assertEqual(
+            await hasher.verify_and_update("password", hashed), (True, None)
+        )
+        self.assertEqual(await hasher.verify_and_update("error", hashed), (False, None))
+        self.assertEqual(hasher.metrics.jobs, 3)
+        self.assertEqual(hasher.metrics.in_flight, 0)
+        self.assertGreaterEqual(hasher.metrics.queue_seconds_max, 0)
+
+    async def test_process_pool(self):
+        hasher = PasswordHasher(workers=1, max_concurrency=1)
+        self.addCleanup(hasher.shutdown)
+        await self.check_hasher(hasher)
+
+    async def test_threadpool(self):
+        await self.check_hasher(PasswordHasher(workers=0, max_concurrency=1))
+
+    async def test_rehash_outdated_rounds(self):
+        hasher = PasswordHasher(workers=0, max_concurrency=1)
+        valid, new_hash = await hasher.verify_and_update(
+            "password", weak_context.hash("password")
+        )
+        self.assertTrue(valid)
+        self.assertFalse(pwd_context.needs_update(new_hash))
+        self.assertEqual(hasher.metrics.rehashes, 1)
+
+
+class RehashOnLoginTestCase(unittest.IsolatedAsyncioTestCase):
+    def create_user(self):
+        data = get_user_create_data()
+        user = UserDB(username=data.username, password=weak_context.hash(data.password))
+        users_service.repo.create(user)
+        return data
+
+    def stored_hash(self, username: str) -> str:
+        return users_service.repo.get(query=UsersQuery(username=username)).password
+
+    def test_authenticate(self):
+        data = self.create_user()
+        self.assertTrue(users_service.authenticate(data.username, data.password))
+        self.assertFalse(pwd_context.needs_update(self.stored_hash(data.username)))
+        self.assertTrue(users_service.authenticate(data.username, data.password))
+
+    async def test_aauthenticate(self):
+        data = self.create_user()
+        self.assertTrue(await users_service.aauthenticate(data.username, data.password))
+        self.assertFalse(pwd_context.needs_update(self.stored_hash(data.username)))
+        self.assertTrue(await users_service.aauthenticate(data.username, data.password))
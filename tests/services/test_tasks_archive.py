@@ -0,0 +1,90 @@
+import datetime
+import tempfile
+import unittest
+import uuid
+
+from fakeredis import FakeStrictRedis
+from rq import Queue
+
+from api.db.memory import InMemoryDB
+from services.tasks.archive import TasksArchive
+from services.tasks.models import Task, TasksQuery, TaskStatus
+from services.tasks.repo.memory import AsyncTasksMemoryRepo, TasksMemoryRepo
+from services.tasks.service import TasksService
+
+
+def make_task(user: uuid.UUID, **data) -> Task:
+    return Task(
+        id=uuid.uuid4(), user=user, title="Title", description="Description", **data
+    )
+
+
+class TasksArchiveTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+
+    def test_write_and_get(self):
+        archive = TasksArchive(path=self.path)
+        tasks = [make_task(uuid.uuid4()) for _ in range(3)]
+        self.assertIsNone(archive.get(id=tasks[0].id))
+
+        archive.write(tasks=tasks[:2])
+        archive.write(tasks=tasks[2:])
+        for task in tasks:
+            self.assertEqual(archive.get(id=task.id), task)
+        self.assertIsNone(archive.get(id=uuid.uuid4()))
+
+    def test_reads_batches_of_other_writers(self):
+        reader = TasksArchive(path=self.path)
+        writer = TasksArchive(path=self.path)
+        first, second = make_task(uuid.uuid4()), make_task(uuid.uuid4())
+
+        writer.write(tasks=[first])
+        self.assertEqual(reader.get(id=first.id), first)
+        writer.write(tasks=[second])
+        self.assertEqual(reader.get(id=second.id), second)
+
+
+class ArchiveTasksTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        db = InMemoryDB()
+        self.service = TasksService(
+            repo=TasksMemoryRepo(db=db),
+            async_repo=AsyncTasksMemoryRepo(db=db),
+            users_service=None,
+            trello_service=None,
+            queue=Queue(is_async=False, connection=FakeStrictRedis()),
+            archive=TasksArchive(path=directory.name),
+        )
+        self.user = uuid.uuid4()
+
+    def create(self, **data) -> Task:
+        return self.service.repo.create(make_task(self.user, **data))
+
+    async def test_archive_tasks(self):
+        old = datetime.datetime.now() - datetime.timedelta(days=60)
+        archived = [
+            self.create(status=TaskStatus.CREATED, received_at=old) for _ in range(5)
+        ]
+        pending = self.create(received_at=old)
+        recent = self.create(status=TaskStatus.CREATED)
+
+        before = datetime.datetime.now() - datetime.timedelta(days=30)
+        self.assertEqual(self.service.archive_tasks(before=before, batch_size=2), 5)
+        self.assertEqual(self.service.archive_tasks(before=before), 0)
+
+        hot = self.service.query(query=TasksQuery(user=self.user))
+        self.assertEqual(hot, [pending, recent])
+        self.assertEqual(self.service.stats(user_id=self.user).total, 7)
+
+        query = TasksQuery(id=archived[0].id, user=self.user)
+        self.assertEqual(self.service.get(query=query), archived[0])
+        self.assertEqual(await self.service.aget(query=query), archived[0])
+
+        other_user = TasksQuery(id=archived[0].id, user=uuid.uuid4())
+        self.assertIsNone(self.service.get(query=other_user))
+        self.assertIsNone(await self.service.aget(query=other_user))
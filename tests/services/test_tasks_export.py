@@ -0,0 +1,78 @@
+import csv
+import gzip
+import io
+import itertools
+import json
+import unittest
+import uuid
+
+from services.tasks.export import (
+    CSV_COLUMNS,
+    ExportFormat,
+    csv_chunks,
+    export_chunks,
+    ndjson_chunks,
+)
+from services.tasks.models import Task
+
+
+def make_task(**data) -> Task:
+    return Task(
+        id=uuid.uuid4(),
+        user=uuid.uuid4(),
+        title="Title",
+        description='Description, with "quotes"',
+        **data,
+    )
+
+
+async def iterate(tasks):
+    for task in tasks:
+        yield task
+
+
+async def join(chunks) -> bytes:
+    return b"".join([chunk async for chunk in chunks])
+
+
+class TasksExportTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.tasks = [make_task(trello_data={"id": str(i)}) for i in range(5)]
+
+    async def test_ndjson(self):
+        body = await join(ndjson_chunks(iterate(self.tasks), batch_size=2))
+        lines = body.decode().splitlines()
+        self.assertEqual([Task.model_validate_json(line) for line in lines], self.tasks)
+
+    async def test_csv(self):
+        body = await join(csv_chunks(iterate(self.tasks), batch_size=2))
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual(list(rows[0]), CSV_COLUMNS)
+        self.assertEqual(len(rows), len(self.tasks))
+        self.assertEqual(rows[0]["id"], str(self.tasks[0].id))
+        self.assertEqual(rows[0]["description"], self.tasks[0].description)
+        self.assertEqual(rows[0]["category"], "")
+        self.assertEqual(json.loads(rows[0]["trello_data"]), {"id": "0"})
+
+    async def test_gzip(self):
+        chunks = export_chunks(iterate(self.tasks), ExportFormat.NDJSON, gzip=True)
+        body = gzip.decompress(await join(chunks))
+        self.assertEqual(body, await join(ndjson_chunks(iterate(self.tasks))))
+
+    async def test_streams_without_reading_every_task(self):
+        consumed = 0
+
+        async def endless():
+            nonlocal consumed
+            task = make_task()
+            for _ in itertools.count():
+                consumed += 1
+                yield task
+
+        for format in ExportFormat:
+            consumed = 0
+            chunks = export_chunks(endless(), format, gzip=True)
+            for _ in range(3):
+                await anext(chunks)
+            await chunks.aclose()
+            self.assertLessEqual(consumed, 300)
@@ -1,15 +1,24 @@
-from unittest import TestCase
+import uuid
+from unittest import IsolatedAsyncioTestCase, TestCase
 
+from fakeredis import FakeStrictRedis
+from fakeredis.aioredis import FakeRedis as FakeAsyncRedis
 from pydantic import ValidationError
 
+from api.db.memory import InMemoryDB
 from api.setup import tasks_service, users_service
+from services.tasks.cache import TasksQueryCache
 from services.tasks.models import (
+    Task,
     TaskCategory,
     TaskCreate,
     TasksQuery,
+    TaskStatus,
     TaskType,
     TaskUpdate,
 )
+from services.tasks.repo.memory import AsyncTasksMemoryRepo, TasksMemoryRepo
+from services.tasks.service import TasksService
 from services.tasks.utils import create_trello_task
 from services.users.factory import get_user_create_data
 from tests.trello_mock import TrelloMockMixin
@@ -84,3 +93,290 @@ class TasksServiceTestCase(TestCase, TrelloMockMixin):
         with self.assertRaises(ValidationError):
             data = TaskUpdate(status="invalid")
             tasks_service.update(query=query, data=data)
+
+    def test_stats(self):
+        user = users_service.create(user=get_user_create_data())
+        issue = TaskCreate(
+            title="Test task", description="Test description", type=TaskType.ISSUE.value
+        )
+        task = TaskCreate(
+            title="Test title",
+            category=TaskCategory.MAINTENANCE.value,
+            type=TaskType.TASK.value,
+        )
+        created_task = tasks_service.create(task=issue, user=user)
+        tasks_service.create(task=task, user=user)
+        tasks_service.update(
+            query=TasksQuery(id=created_task.id),
+            data=TaskUpdate(status=TaskStatus.CREATED),
+        )
+
+        stats = tasks_service.stats(user_id=user.id)
+        self.assertEqual(stats.total, 2)
+        self.assertEqual(stats.status, {TaskStatus.PENDING: 1, TaskStatus.CREATED: 1})
+        self.assertEqual(stats.type, {TaskType.ISSUE: 1, TaskType.TASK: 1})
+        self.assertEqual(stats.category, {TaskCategory.MAINTENANCE: 1})
+
+        tasks_service.rebuild_stats()
+        self.assertEqual(tasks_service.stats(user_id=user.id), stats)
+
+    def test_update_task(self):
+        user = users_service.create(user=get_user_create_data())
+        task = TaskCreate(
+            title="Test title",
+            category=TaskCategory.MAINTENANCE.value,
+            type=TaskType.TASK.value,
+        )
+        created_task = tasks_service.create(task=task, user=user)
+        query = TasksQuery(id=created_task.id)
+
+        updated = tasks_service.update(query=query, data=TaskUpdate(title="New title"))
+        self.assertEqual([task.title for task in updated], ["New title"])
+
+        updated = tasks_service.update(
+            query=query, data=TaskUpdate(title="Other title"), returning=False
+        )
+        self.assertEqual(updated, [])
+        self.assertEqual(tasks_service.get(query=query).title, "Other title")
+
+    def test_collection_version(self):
+        user = users_service.create(user=get_user_create_data())
+        version = tasks_service.collection_version(user_id=user.id)
+        task = TaskCreate(
+            title="Test title",
+            category=TaskCategory.MAINTENANCE.value,
+            type=TaskType.TASK.value,
+        )
+        created_task = tasks_service.create(task=task, user=user)
+        self.assertEqual(tasks_service.collection_version(user_id=user.id), version + 1)
+
+        updated = tasks_service.update(
+            query=TasksQuery(id=created_task.id), data=TaskUpdate(title="New title")
+        )
+        self.assertEqual(updated[0].revision, created_task.revision + 1)
+        self.assertEqual(updated[0].last_modified, updated[0].updated_at)
+        self.assertEqual(tasks_service.collection_version(user_id=user.id), version + 2)
+
+    def test_query_cache(self):
+        user = users_service.create(user=get_user_create_data())
+        task = TaskCreate(
+            title="Test title",
+            category=TaskCategory.MAINTENANCE.value,
+            type=TaskType.TASK.value,
+        )
+        created_task = tasks_service.create(task=task, user=user)
+        query = TasksQuery(user=user.id)
+        metrics = tasks_service.cache.metrics
+
+        tasks = tasks_service.query(query=query)
+        hits = metrics.hits
+        self.assertEqual(tasks_service.query(query=query), tasks)
+        self.assertEqual(metrics.hits, hits + 1)
+
+        tasks_service.update(
+            query=TasksQuery(id=created_task.id), data=TaskUpdate(title="New title")
+        )
+        tasks = tasks_service.query(query=query)
+        self.assertEqual(metrics.hits, hits + 1)
+        self.assertEqual([task.title for task in tasks], ["New title"])
+
+        created = TasksQuery(user=user.id, status=TaskStatus.CREATED)
+        self.assertEqual(tasks_service.query(query=created), [])
+        self.assertEqual(tasks_service.query(query=query, offset=1), [])
+        self.assertEqual(metrics.hits, hits + 1)
+
+    def test_query_offset_limit(self):
+        user = users_service.create(user=get_user_create_data())
+        created = [
+            tasks_service.create(
+                task=TaskCreate(
+                    title=f"Task {i}",
+                    category=TaskCategory.MAINTENANCE.value,
+                    type=TaskType.TASK.value,
+                ),
+                user=user,
+            )
+            for i in range(5)
+        ]
+        query = TasksQuery(user=user.id)
+
+        tasks = tasks_service.query(query=query, offset=1, limit=2)
+        self.assertEqual([task.id for task in tasks], [t.id for t in created[1:3]])
+
+        tasks = tasks_service.iter_query(query=query, offset=3)
+        self.assertEqual([task.id for task in tasks], [t.id for t in created[3:]])
+
+
+def make_task(user: uuid.UUID) -> Task:
+    return Task(id=uuid.uuid4(), user=user, title="Title", description="Description")
+
+
+class TasksQueryCacheTestCase(TestCase):
+    def test_lru_eviction(self):
+        cache = TasksQueryCache(maxsize=2)
+        queries = [TasksQuery(user=uuid.uuid4()) for _ in range(3)]
+        tasks = [[make_task(query.user)] for query in queries]
+        cache.set(queries[0], 1, tasks[0])
+        cache.set(queries[1], 1, tasks[1])
+        cache.get(queries[0], 1)
+        cache.set(queries[2], 1, tasks[2])
+        self.assertEqual(cache.get(queries[0], 1), tasks[0])
+        self.assertIsNone(cache.get(queries[1], 1))
+        self.assertEqual(cache.get(queries[2], 1), tasks[2])
+        self.assertEqual((cache.metrics.hits, cache.metrics.misses), (3, 1))
+        self.assertEqual(cache.metrics.hit_rate, 0.75)
+
+    def test_max_rows(self):
+        cache = TasksQueryCache(max_rows=3)
+        query = TasksQuery(user=uuid.uuid4())
+        tasks = [make_task(query.user) for _ in range(4)]
+        cache.set(query, 1, tasks)
+        self.assertIsNone(cache.get(query, 1))
+
+        cache.set(query, 1, tasks[:2], limit=2)
+        cache.set(query, 1, tasks[2:], offset=2, limit=2)
+        self.assertIsNone(cache.get(query, 1, limit=2))
+        self.assertEqual(cache.get(query, 1, offset=2, limit=2), tasks[2:])
+
+    def test_version_and_page_in_key(self):
+        cache = TasksQueryCache()
+        query = TasksQuery(user=uuid.uuid4())
+        tasks = [make_task(query.user)]
+        cache.set(query, 1, tasks, limit=10)
+        self.assertEqual(cache.get(query, 1, limit=10), tasks)
+        self.assertIsNone(cache.get(query, 2, limit=10))
+        self.assertIsNone(cache.get(query, 1))
+        status = TasksQuery(user=query.user, status=TaskStatus.CREATED)
+        self.assertIsNone(cache.get(status, 1, limit=10))
+
+    def test_redis_tier_is_shared(self):
+        redis = FakeStrictRedis()
+        query = TasksQuery(user=uuid.uuid4())
+        tasks = [make_task(query.user)]
+        TasksQueryCache(redis=redis).set(query, 1, tasks)
+
+        other = TasksQueryCache(redis=redis)
+        self.assertEqual(other.get(query, 1), tasks)
+        self.assertEqual(other.get(query, 1), tasks)
+        self.assertEqual((other.metrics.hits, other.metrics.redis_hits), (2, 1))
+
+
+class AsyncTasksQueryCacheTestCase(IsolatedAsyncioTestCase):
+    async def test_redis_tier_is_shared(self):
+        redis = FakeAsyncRedis()
+        query = TasksQuery(user=uuid.uuid4())
+        tasks = [make_task(query.user)]
+        await TasksQueryCache(async_redis=redis).aset(query, 1, tasks)
+
+        other = TasksQueryCache(async_redis=redis)
+        self.assertEqual(await other.aget(query, 1), tasks)
+        self.assertIsNone(await other.aget(query, 2))
+
+
+class LaggingTasksRepo(TasksMemoryRepo):
+    """
+    Memory repo whose list reads go to a replica that only receives the writes made
+    with `replicate`, and fall back to the primary when the replica is behind the
+    version they are given.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(db=InMemoryDB())
+        self.replica = TasksMemoryRepo(db=InMemoryDB())
+        self.reads = []
+
+    def replicate(self, task: Task) -> Task:
+        self.replica.create(task)
+        return self.create(task)
+
+    def query(self, query, offset=0, limit=None, version=None):
+        repo = self.replica
+        if version is not None and repo.collection_version(user=query.user) < version:
+            repo = super()
+        self.reads.append("replica" if repo is self.replica else "primary")
+        return repo.query(query=query, offset=offset, limit=limit)
+
+
+class AsyncLaggingTasksRepo(AsyncTasksMemoryRepo):
+    def __init__(self) -> None:
+        self.repo = LaggingTasksRepo()
+
+
+class ReplicaReadsTestCase(IsolatedAsyncioTestCase):
+    def make_service(self, cache: TasksQueryCache | None = None) -> TasksService:
+        async_repo = AsyncLaggingTasksRepo()
+        return TasksService(
+            repo=async_repo.repo,
+            async_repo=async_repo,
+            users_service=None,
+            trello_service=None,
+            queue=None,
+            cache=cache,
+        )
+
+    async def test_versioned_query_uses_replica(self):
+        service = self.make_service()
+        task = service.repo.replicate(make_task(uuid.uuid4()))
+        query = TasksQuery(user=task.user)
+
+        version = await service.acollection_version(user_id=task.user)
+        self.assertEqual(await service.aquery(query=query, version=version), [task])
+        self.assertEqual(service.query(query=query, version=version), [task])
+        self.assertEqual(service.repo.reads, ["replica", "replica"])
+
+    async def test_versioned_query_falls_back_to_primary(self):
+        service = self.make_service()
+        task = service.repo.create(make_task(uuid.uuid4()))
+        query = TasksQuery(user=task.user)
+
+        # Without a version the list may lag behind, like the replica reads
+        self.assertEqual(await service.aquery(query=query), [])
+        version = await service.acollection_version(user_id=task.user)
+        self.assertEqual(await service.aquery(query=query, version=version), [task])
+        self.assertEqual(service.query(query=query, version=version), [task])
+        self.assertEqual(service.repo.reads, ["replica", "primary", "primary"])
+
+    async def test_cached_query_is_not_older_than_version(self):
+        service = self.make_service(cache=TasksQueryCache())
+        first = service.repo.replicate(make_task(uuid.uuid4()))
+        query = TasksQuery(user=first.user)
+        self.assertEqual(await service.aquery(query=query), [first])
+
+        second = service.repo.create(make_task(first.user))
+        self.assertEqual(
+            {task.id for task in service.query(query=query)}, {first.id, second.id}
+        )
+        self.assertEqual(service.cache.metrics.misses, 2)
+        self.assertEqual(service.repo.reads, ["replica", "primary"])
+
+
+class AsyncTasksServiceTestCase(IsolatedAsyncioTestCase, TrelloMockMixin):
+    def setUp(self) -> None:
+        self.start_mocks()
+
+    async def test_create_and_query(self):
+        user = await users_service.acreate(user=get_user_create_data())
+        task = TaskCreate(
+            title="Test task", description="Test description", type=TaskType.ISSUE.value
+        )
+        created_task = await tasks_service.acreate(task=task, user=user)
+
+        tasks = await tasks_service.aquery(query=TasksQuery(user=user.id))
+        self.assertEqual([task.id for task in tasks], [created_task.id])
+
+        updated = await tasks_service.aupdate(
+            query=TasksQuery(id=created_task.id),
+            data=TaskUpdate(status=TaskStatus.CREATED),
+        )
+        self.assertEqual(updated[0].status, TaskStatus.CREATED)
+
+        stats = await tasks_service.astats(user_id=user.id)
+        self.assertEqual(stats.status, {TaskStatus.CREATED: 1})
+
+        tasks = [
+            task
+            async for task in tasks_service.aiter_query(
+                query=TasksQuery(user=user.id), limit=1
+            )
+        ]
+        self.assertEqual([task.id for task in tasks], [created_task.id])
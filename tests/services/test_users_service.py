@@ -1,8 +1,25 @@
+import asyncio
+import threading
+import time
 import unittest
+import uuid
+from unittest import mock
 
+from fakeredis import FakeStrictRedis
+from fakeredis.aioredis import FakeRedis as FakeAsyncRedis
+
+from api.db.memory import InMemoryDB
 from api.setup import users_service
+from services.users.cache import PrincipalCache
 from services.users.factory import get_user_create_data
-from services.users.models import UsersQuery
+from services.users.models import UserPrincipal, UserRead, UsersQuery, UserUpdate
+from services.users.repo.base import UsernameTakenError
+from services.users.repo.memory import AsyncUsersMemoryRepo, UsersMemoryRepo
+from services.users.service import UsersService
+
+
+def make_user(username: str = "user") -> UserPrincipal:
+    return UserPrincipal(id=uuid.uuid4(), username=username, external_data={})
 
 
 class UsersServiceTestCase(unittest.TestCase):
@@ -35,3 +52,223 @@ class UsersServiceTestCase(unittest.TestCase):
         self.assertFalse(
             users_service.authenticate(username=user_data.username, password="error")
         )
+
+    def test_concurrent_registrations(self):
+        user_data = get_user_create_data()
+        results = []
+
+        def register():
+            try:
+                results.append(users_service.create(user=user_data))
+            except UsernameTakenError:
+                results.append(None)
+
+        threads = [threading.Thread(target=register) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len([user for user in results if user is not None]), 1)
+        query = UsersQuery(username=user_data.username)
+        self.assertEqual(len(users_service.repo.query(query=query)), 1)
+
+    def test_principal_cache_invalidated_on_update(self):
+        user = users_service.create(user=get_user_create_data())
+        principal = UserPrincipal(**user.model_dump())
+        self.assertEqual(users_service.get_principal(username=user.username), principal)
+        self.assertEqual(users_service.cache.get(user.username), principal)
+
+        users_service.update(
+            query=UsersQuery(id=user.id),
+            data=UserUpdate(external_data={"key": "value"}),
+            returning=False,
+        )
+        self.assertIsNone(users_service.cache.get(user.username))
+        principal = users_service.get_principal(username=user.username)
+        self.assertEqual(principal.external_data, {"key": "value"})
+
+    def test_concurrent_revocations(self):
+        user = users_service.create(user=get_user_create_data())
+        users_service.get_principal(username=user.username)
+        threads = [
+            threading.Thread(target=users_service.revoke_tokens, args=(user.id,))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIsNone(users_service.cache.get(user.username))
+        principal = users_service.get_principal(username=user.username)
+        self.assertEqual(principal.token_version, 8)
+        users_service.revoke_tokens(user_id=uuid.uuid4())
+
+    def test_read_model_hides_token_version(self):
+        user_data = get_user_create_data()
+        users_service.create(user=user_data)
+        principal = users_service.authenticate(
+            username=user_data.username, password=user_data.password
+        )
+        self.assertEqual(principal.token_version, 0)
+        self.assertNotIn(
+            "token_version", UserRead(**principal.model_dump()).model_dump()
+        )
+
+
+def make_service(cache: PrincipalCache) -> UsersService:
+    db = InMemoryDB()
+    return UsersService(
+        repo=UsersMemoryRepo(db=db), async_repo=AsyncUsersMemoryRepo(db=db), cache=cache
+    )
+
+
+class PrincipalLookupRaceTestCase(unittest.TestCase):
+    def test_stale_read_not_cached(self):
+        service = make_service(PrincipalCache(redis=FakeStrictRedis()))
+        user = service.create(user=get_user_create_data())
+        get = service.repo.get
+
+        # The lookup reads the user, then an update invalidates it before it is cached
+        def racing_get(query):
+            stale = get(query=query)
+            service.update(
+                query=UsersQuery(id=user.id),
+                data=UserUpdate(token_version=1),
+                returning=False,
+            )
+            return stale
+
+        with mock.patch.object(service.repo, "get", racing_get):
+            self.assertEqual(service.get_principal(user.username).token_version, 0)
+        self.assertIsNone(service.cache.get(user.username))
+        self.assertEqual(service.get_principal(user.username).token_version, 1)
+
+    def test_invalidated_by_other_process(self):
+        redis = FakeStrictRedis()
+        user = make_user(f"user-{uuid.uuid4()}")
+        cache, other = PrincipalCache(redis=redis), PrincipalCache(redis=redis)
+
+        generation = cache.generation(user.username)
+        other.invalidate(user.username)
+        cache.set(user, generation=generation)
+        self.assertIsNone(PrincipalCache(redis=redis).get(user.username))
+
+        cache.set(user, generation=cache.generation(user.username))
+        self.assertEqual(PrincipalCache(redis=redis).get(user.username), user)
+
+
+class AsyncPrincipalLookupRaceTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_stale_read_not_cached(self):
+        service = make_service(PrincipalCache(async_redis=FakeAsyncRedis()))
+        user = await service.acreate(user=get_user_create_data())
+        get = service.async_repo.get
+
+        async def racing_get(query):
+            stale = await get(query=query)
+            await service.aupdate(
+                query=UsersQuery(id=user.id),
+                data=UserUpdate(token_version=1),
+                returning=False,
+            )
+            return stale
+
+        with mock.patch.object(service.async_repo, "get", racing_get):
+            principal = await service.aget_principal(user.username)
+        self.assertEqual(principal.token_version, 0)
+        self.assertIsNone(await service.cache.aget(user.username))
+        principal = await service.aget_principal(user.username)
+        self.assertEqual(principal.token_version, 1)
+
+
+class PrincipalCacheTestCase(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = PrincipalCache(maxsize=2)
+        first, second, third = (
+            make_user("first"),
+            make_user("second"),
+            make_user("third"),
+        )
+        cache.set(first)
+        cache.set(second)
+        cache.get("first")
+        cache.set(third)
+        self.assertEqual(cache.get("first"), first)
+        self.assertIsNone(cache.get("second"))
+        self.assertEqual(cache.get("third"), third)
+
+    def test_ttl(self):
+        cache = PrincipalCache(ttl=0.01)
+        cache.set(make_user())
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("user"))
+
+    def test_redis_tier_is_shared(self):
+        redis = FakeStrictRedis()
+        user = make_user()
+        PrincipalCache(redis=redis).set(user)
+
+        other = PrincipalCache(redis=redis)
+        self.assertEqual(other.get("user"), user)
+        other.invalidate("user")
+        self.assertIsNone(PrincipalCache(redis=redis).get("user"))
+
+
+class AsyncPrincipalCacheTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_redis_tier_is_shared(self):
+        redis = FakeAsyncRedis()
+        user = make_user()
+        await PrincipalCache(async_redis=redis).aset(user)
+
+        other = PrincipalCache(async_redis=redis)
+        self.assertEqual(await other.aget("user"), user)
+        await other.ainvalidate("user")
+        self.assertIsNone(await PrincipalCache(async_redis=redis).aget("user"))
+
+
+class AsyncUsersServiceTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_create_user(self):
+        user_data = get_user_create_data()
+        user = await users_service.acreate(user=user_data)
+        self.assertEqual(user_data.username, user.username)
+
+        with self.assertRaises(ValueError):
+            await users_service.acreate(user=user_data)
+
+    async def test_authenticate(self):
+        user_data = get_user_create_data()
+        await users_service.acreate(user=user_data)
+
+        self.assertTrue(
+            await users_service.aauthenticate(
+                username=user_data.username, password=user_data.password
+            )
+        )
+        self.assertFalse(
+            await users_service.aauthenticate(
+                username=user_data.username, password="error"
+            )
+        )
+
+    async def test_principal_cache_invalidated_on_update(self):
+        user = await users_service.acreate(user=get_user_create_data())
+        self.assertEqual(
+            await users_service.aget_principal(username=user.username),
+            UserPrincipal(**user.model_dump()),
+        )
+
+        await users_service.aupdate(
+            query=UsersQuery(id=user.id),
+            data=UserUpdate(external_data={"key": "value"}),
+        )
+        principal = await users_service.aget_principal(username=user.username)
+        self.assertEqual(principal.external_data, {"key": "value"})
+
+    async def test_concurrent_revocations(self):
+        user = await users_service.acreate(user=get_user_create_data())
+        await asyncio.gather(
+            *(users_service.arevoke_tokens(user_id=user.id) for _ in range(4))
+        )
+        principal = await users_service.aget_principal(username=user.username)
+        self.assertEqual(principal.token_version, 4)
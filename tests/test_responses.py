@@ -0,0 +1,76 @@
+import datetime
+import json
+import unittest
+import uuid
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from api.responses import PydanticJSONResponse, http_date, is_not_modified
+from services.tasks.models import Task, TaskStatus
+
+MODIFIED = datetime.datetime(2024, 1, 2, 3, 4, 5, 600, tzinfo=datetime.timezone.utc)
+
+
+def make_request(**headers) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "headers": [
+                (name.replace("_", "-").encode(), value.encode())
+                for name, value in headers.items()
+            ],
+        }
+    )
+
+
+class ConditionalRequestTestCase(unittest.TestCase):
+    def test_http_date(self):
+        self.assertEqual(http_date(MODIFIED), "Tue, 02 Jan 2024 03:04:05 GMT")
+
+    def test_if_none_match(self):
+        etag = '"task.1"'
+        self.assertFalse(is_not_modified(make_request(), etag))
+        self.assertTrue(is_not_modified(make_request(if_none_match=etag), etag))
+        self.assertTrue(
+            is_not_modified(make_request(if_none_match='"other", W/"task.1"'), etag)
+        )
+        self.assertTrue(is_not_modified(make_request(if_none_match="*"), etag))
+        self.assertFalse(is_not_modified(make_request(if_none_match='"task.0"'), etag))
+
+    def test_if_modified_since(self):
+        etag = '"task.1"'
+        since = make_request(if_modified_since=http_date(MODIFIED))
+        self.assertTrue(is_not_modified(since, etag, MODIFIED))
+        later = MODIFIED + datetime.timedelta(seconds=1)
+        self.assertFalse(is_not_modified(since, etag, later))
+        self.assertFalse(is_not_modified(since, etag))
+        invalid = make_request(if_modified_since="yesterday")
+        self.assertFalse(is_not_modified(invalid, etag, MODIFIED))
+
+    def test_if_none_match_takes_precedence(self):
+        request = make_request(
+            if_none_match='"task.0"', if_modified_since=http_date(MODIFIED)
+        )
+        self.assertFalse(is_not_modified(request, '"task.1"', MODIFIED))
+
+
+class PydanticJSONResponseTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_matches_fastapi_encoding(self):
+        tasks = [
+            Task(
+                id=uuid.uuid4(),
+                user=uuid.uuid4(),
+                title=f"Task {i}",
+                status=TaskStatus.CREATED,
+                received_at=datetime.datetime.now(),
+                trello_data={"id": str(i), "labels": [{"name": "label"}]},
+            )
+            for i in range(3)
+        ]
+        field = create_response_field(name="response", type_=list[Task])
+        validated = await serialize_response(field=field, response_content=tasks)
+        body = PydanticJSONResponse(tasks).body
+        self.assertEqual(json.loads(body), json.loads(JSONResponse(validated).body))